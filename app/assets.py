@@ -0,0 +1,480 @@
+# ==== Static Asset Pipeline ====
+# `python -m app.assets build` turns app/static into app/static/dist:
+#   * CSS, JS and images get content-hashed names (style.3f2a9c1d.css), so a
+#     URL never changes meaning and can be cached for a year as immutable
+#   * text files get .gz and .br siblings (brotli when the package is
+#     installed), compressed once at build time instead of per request
+#   * JPEG/PNG images get resized width variants (name.<hash>.w320.jpg) and a
+#     .webp sibling for each, kept only where WebP is smaller
+#   * /static/... references in HTML, CSS and JS are rewritten to the hashed
+#     names; an <img> that declares `sizes` also gets a srcset of the widths
+#   * pages are rewritten and compressed but keep their names (routes serve them)
+#
+# StaticAssets serves the hashed files with the best variant the client
+# accepts (WebP by Accept, br/gzip by Accept-Encoding), strong ETags and 304s.
+# PageCache keeps every built page and its variants in memory; pages are
+# revalidated on each load (they sit behind login and name the current assets).
+# Builds are additive: both pick up a new manifest within RELOAD_INTERVAL, and
+# files of the last KEEP_BUILDS builds stay served for pages already open.
+# Without a build, pages are served from app/static as before.
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+PAGES_DIR = "pages"
+BUILDS_DIR = "builds"               # one manifest per build generation
+KEEP_BUILDS = 3                     # generations whose files stay on disk for pages already loaded
+RELOAD_INTERVAL = 2.0               # seconds between checks for a new build
+TEXT_TYPES = (".css", ".js", ".html", ".svg", ".json", ".txt")
+IMAGE_TYPES = (".jpg", ".jpeg", ".png")
+DEFAULT_WIDTHS = (64, 160, 320, 640, 1280, 1920)
+MIN_COMPRESS_BYTES = 256            # below this the headers outweigh the savings
+MAX_MEMORY_FILE_BYTES = 256 * 1024  # larger hashed files are read from disk per request
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "private, no-cache"
+# Checked in this order; q-values other than 0 are not ranked
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+STATIC_REF = re.compile(r"/static/([A-Za-z0-9_.\-/]+)")
+IMG_TAG = re.compile(r"<img\b[^>]*>", re.IGNORECASE)
+IMG_SRC = re.compile(r"""\bsrc=(["'])/static/([^"']+)\1""", re.IGNORECASE)
+
+
+# ==== Build ====
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:8]
+
+
+def hashed_name(name, digest, suffix=""):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest}{suffix}{ext}"
+
+
+def _compress_variants(path, data):
+    """Write .gz/.br siblings of a text file where they are smaller."""
+    if len(data) < MIN_COMPRESS_BYTES:
+        return
+    # mtime=0 keeps the output (and its ETag) identical across builds
+    variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+        variants.append((".br", brotli.compress(data, quality=11)))
+    except ImportError:
+        pass
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            _write(path + suffix, compressed)
+
+
+def _write(path, data):
+    """Write through a temp file and rename, so a running server never reads a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+def _encode(image, ext, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, format={"jpg": "JPEG", "jpeg": "JPEG", "png": "PNG", "webp": "WEBP"}[ext], **params)
+    return buffer.getvalue()
+
+
+def build_image(name, data, output, widths, webp_quality=80, jpeg_quality=82):
+    """Hashed original plus resized variants; returns the manifest entry."""
+    from PIL import Image
+
+    digest = content_hash(data)
+    ext = os.path.splitext(name)[1].lower().lstrip(".")
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        image = source.convert("RGBA" if source.mode in ("RGBA", "LA", "P") and ext == "png" else "RGB")
+    variants = {}
+    for width in sorted({w for w in widths if w < image.width} | {image.width}):
+        if width == image.width:
+            fallback_name, fallback = hashed_name(name, digest), data
+            resized = image
+        else:
+            resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            fallback_name = hashed_name(name, digest, f".w{width}")
+            params = {"quality": jpeg_quality, "optimize": True, "progressive": True} if ext != "png" else {"optimize": True}
+            fallback = _encode(resized, ext, **params)
+        _write(os.path.join(output, fallback_name), fallback)
+        webp = _encode(resized, "webp", quality=webp_quality, method=6)
+        if len(webp) < len(fallback):
+            _write(os.path.join(output, fallback_name + ".webp"), webp)
+        variants[width] = fallback_name
+    return {"path": variants[image.width], "width": image.width, "widths": variants}
+
+
+def rewrite_references(text, files):
+    """Point /static/<name> at the hashed file, leaving names outside the manifest alone."""
+    def replace(match):
+        entry = files.get(match.group(1))
+        return f"/static/dist/{entry['path']}" if entry else match.group(0)
+    return STATIC_REF.sub(replace, text)
+
+
+def add_srcset(html, files):
+    """srcset of every width variant for <img sizes=...> tags; without `sizes` the browser would assume 100vw."""
+    def replace(match):
+        tag = match.group(0)
+        src = IMG_SRC.search(tag)
+        if src is None or "srcset" in tag.lower() or "sizes=" not in tag.lower():
+            return tag
+        entry = files.get(src.group(2))
+        if entry is None or "widths" not in entry:
+            return tag
+        srcset = ", ".join(f"/static/dist/{path} {width}w" for width, path in sorted(entry["widths"].items()))
+        return tag[:src.end()] + f' srcset="{srcset}"' + tag[src.end():]
+    return IMG_TAG.sub(replace, html)
+
+
+def build(source, output, widths=DEFAULT_WIDTHS, webp_quality=80, keep=KEEP_BUILDS):
+    """Add a build generation to `output` and make it current.
+
+    Hashed names never change meaning, so files are added next to the previous
+    build's instead of replacing them: pages already open in a browser, and
+    servers that haven't picked up the new manifest yet, keep working. Files
+    only referenced by builds older than the last `keep` are pruned.
+    """
+    now = time.time()
+    build_id = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f"{now % 1:.3f}"[1:] + f"-{os.getpid()}"
+    names = sorted(name for name in os.listdir(source) if os.path.isfile(os.path.join(source, name)))
+    files, pages = {}, {}
+
+    # Images first: CSS and JS may refer to them
+    for name in names:
+        if name.lower().endswith(IMAGE_TYPES):
+            with open(os.path.join(source, name), "rb") as f:
+                files[name] = build_image(name, f.read(), output, widths, webp_quality)
+    for name in names:
+        ext = os.path.splitext(name)[1].lower()
+        if ext in IMAGE_TYPES or ext == ".html":
+            continue
+        with open(os.path.join(source, name), "rb") as f:
+            data = f.read()
+        if ext in (".css", ".js"):
+            data = rewrite_references(data.decode("utf-8"), files).encode("utf-8")
+        path = hashed_name(name, content_hash(data))
+        _write(os.path.join(output, path), data)
+        if ext in TEXT_TYPES:
+            _compress_variants(os.path.join(output, path), data)
+        files[name] = {"path": path}
+    for name in names:
+        if not name.lower().endswith(".html"):
+            continue
+        with open(os.path.join(source, name), "r", encoding="utf-8") as f:
+            html = f.read()
+        data = rewrite_references(add_srcset(html, files), files).encode("utf-8")
+        # Pages keep their names, so each build gets its own directory
+        path = os.path.join(PAGES_DIR, build_id, name)
+        _write(os.path.join(output, path), data)
+        _compress_variants(os.path.join(output, path), data)
+        pages[name] = path
+
+    manifest = json.dumps({"build": build_id, "built": now, "files": files, "pages": pages}, indent=2).encode()
+    _write(os.path.join(output, BUILDS_DIR, build_id + ".json"), manifest)
+    # Replacing manifest.json is what switches running servers to this build
+    _write(os.path.join(output, MANIFEST), manifest)
+    prune(output, keep)
+    return files, pages
+
+
+def manifest_paths(manifest, include_pages=True):
+    """Every file a build serves, relative to the dist directory (compressed and WebP siblings aside)."""
+    paths = set(manifest["pages"].values()) if include_pages else set()
+    for entry in manifest["files"].values():
+        paths.add(entry["path"])
+        paths.update(entry.get("widths", {}).values())
+    return paths
+
+
+def load_builds(directory):
+    """Manifests of the generations still on disk, oldest first."""
+    builds = os.path.join(directory, BUILDS_DIR)
+    if not os.path.isdir(builds):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(builds)):
+        if name.endswith(".json"):
+            with open(os.path.join(builds, name), "r") as f:
+                manifests.append(json.load(f))
+    return manifests
+
+
+def prune(output, keep=KEEP_BUILDS):
+    """Delete build manifests beyond the newest `keep` and every file none of the kept builds serves."""
+    builds = os.path.join(output, BUILDS_DIR)
+    generations = sorted(name for name in os.listdir(builds) if name.endswith(".json"))
+    for name in generations[:-keep]:
+        os.remove(os.path.join(builds, name))
+    referenced = set()
+    for manifest in load_builds(output):
+        referenced |= manifest_paths(manifest)
+    removed = 0
+    for root, _, names in os.walk(output, topdown=False):
+        relative_root = os.path.relpath(root, output)
+        if relative_root.split(os.sep)[0] == BUILDS_DIR:
+            continue
+        for name in names:
+            path = os.path.normpath(os.path.join(relative_root, name))
+            if path == MANIFEST or path.endswith(".tmp"):
+                continue
+            owners = {path, *(path[:-len(suffix)] for suffix in (".br", ".gz", ".webp") if path.endswith(suffix))}
+            if not owners & referenced:
+                os.remove(os.path.join(root, name))
+                removed += 1
+        if root != output and not os.listdir(root):
+            os.rmdir(root)
+    return removed
+
+
+# ==== Serving ====
+def _etag(data):
+    return '"' + hashlib.sha256(data).hexdigest()[:20] + '"'
+
+
+def _accepts(header, token):
+    """True if an Accept/Accept-Encoding header lists token without q=0.
+
+    Media types must be named: browsers that can't decode WebP still send */*.
+    """
+    names = (token,) if "/" in token else (token, "*")
+    for item in header.split(","):
+        value, _, params = item.strip().partition(";")
+        if value.strip().lower() in names:
+            q = params.replace(" ", "").lower()
+            if not q.startswith("q=") or q[2:].strip("0.") != "":
+                return True
+    return False
+
+
+def _not_modified(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+class _Variant:
+    __slots__ = ("path", "size", "etag", "body")
+
+    def __init__(self, path, keep_in_memory):
+        with open(path, "rb") as f:
+            data = f.read()
+        self.path = path
+        self.size = len(data)
+        self.etag = _etag(data)
+        self.body = data if keep_in_memory else None
+
+    def read(self):
+        if self.body is not None:
+            return self.body
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class _Asset:
+    """Every encoded form of one URL: {(format suffix, encoding): variant}."""
+
+    def __init__(self, path, content_type, keep_in_memory):
+        self.content_type = content_type
+        self.variants = {}
+        for format_suffix in ("", ".webp"):
+            for encoding, encoding_suffix in (("identity", ""), *ENCODINGS):
+                candidate = path + format_suffix + encoding_suffix
+                if os.path.exists(candidate):
+                    self.variants[(format_suffix, encoding)] = _Variant(candidate, keep_in_memory)
+        self.vary = ", ".join(name for name, present in (
+            ("Accept", any(key[0] == ".webp" for key in self.variants)),
+            ("Accept-Encoding", any(key[1] != "identity" for key in self.variants)),
+        ) if present)
+
+    def select(self, accept, accept_encoding):
+        """(variant, Content-Type, Content-Encoding or None) for the client's Accept headers."""
+        webp = (".webp", "identity") in self.variants and _accepts(accept, "image/webp")
+        format_suffix, content_type = (".webp", "image/webp") if webp else ("", self.content_type)
+        for encoding, _ in ENCODINGS:
+            variant = self.variants.get((format_suffix, encoding))
+            if variant is not None and _accepts(accept_encoding, encoding):
+                return variant, content_type, encoding
+        return self.variants[(format_suffix, "identity")], content_type, None
+
+    def respond(self, headers, cache_control):
+        """(status, response headers, body) honouring If-None-Match."""
+        variant, content_type, encoding = self.select(headers.get("accept", ""), headers.get("accept-encoding", ""))
+        response = {"content-type": content_type, "etag": variant.etag, "cache-control": cache_control}
+        if self.vary:
+            response["vary"] = self.vary
+        if encoding:
+            response["content-encoding"] = encoding
+        if _not_modified(headers.get("if-none-match"), variant.etag):
+            return 304, response, b""
+        response["content-length"] = str(variant.size)
+        return 200, response, variant.read()
+
+
+def _content_type(name):
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+        content_type += "; charset=utf-8"
+    return content_type
+
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+class _BuildWatcher:
+    """Notices a new build by manifest.json changing, checked at most every `interval` seconds."""
+
+    def __init__(self, directory, interval=RELOAD_INTERVAL):
+        self.path = os.path.join(directory, MANIFEST)
+        self.interval = interval
+        self._checked = 0.0
+        self._stamp = None
+
+    def changed(self):
+        now = time.monotonic()
+        if now - self._checked < self.interval:
+            return False
+        self._checked = now
+        try:
+            stat = os.stat(self.path)
+            stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return True
+
+
+class StaticAssets:
+    """ASGI app for the built, content-hashed files under /static/dist.
+
+    Serves the files of every build generation still on disk, and picks up a
+    new build (and drops pruned ones) without a restart.
+    """
+
+    def __init__(self, directory, reload_interval=RELOAD_INTERVAL):
+        self.directory = directory
+        self.assets = {}
+        self._watcher = _BuildWatcher(directory, reload_interval)
+        self._watcher.changed()
+        self._load()
+        if not self.assets:
+            logger.info("No static build in %s; run `python -m app.assets build`", directory)
+
+    def _load(self):
+        assets = {}
+        for manifest in load_builds(self.directory):
+            for path in manifest_paths(manifest, include_pages=False):
+                full = os.path.join(self.directory, path)
+                if path in self.assets:
+                    assets[path] = self.assets[path]  # same name, same bytes: nothing to re-read
+                elif os.path.exists(full):
+                    small = os.path.getsize(full) <= MAX_MEMORY_FILE_BYTES
+                    assets[path] = _Asset(full, _content_type(path), keep_in_memory=small)
+        self.assets = assets
+        logger.info("Serving %d hashed static assets from %s", len(assets), self.directory)
+
+    @staticmethod
+    def _route_path(scope):
+        # Newer Starlette keeps the mount prefix in path (and in root_path); older versions strip it
+        path, root_path = scope["path"], scope.get("root_path", "")
+        if root_path and path.startswith(root_path + "/"):
+            return path[len(root_path):]
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if self._watcher.changed():
+            self._load()
+        asset = self.assets.get(self._route_path(scope).lstrip("/")) if scope["type"] == "http" else None
+        response = None
+        if asset is not None and scope["method"] in ("GET", "HEAD"):
+            request_headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+            try:
+                response = asset.respond(request_headers, IMMUTABLE)
+            except FileNotFoundError:
+                pass  # a large file pruned since the last reload
+        status, headers, body = response or (404, {"content-type": "text/plain; charset=utf-8"}, b"Not Found")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(key.encode(), value.encode()) for key, value in headers.items()]})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+
+
+class PageCache:
+    """Built HTML pages held in memory with their compressed variants; app/static as a fallback.
+
+    Reloaded when a new build replaces manifest.json.
+    """
+
+    def __init__(self, directory, source, reload_interval=RELOAD_INTERVAL):
+        self.directory = directory
+        self.source = source
+        self.pages = {}
+        self._watcher = _BuildWatcher(directory, reload_interval)
+        self._watcher.changed()
+        self._load()
+
+    def _load(self):
+        manifest = load_manifest(self.directory)
+        self.pages = {name: _Asset(os.path.join(self.directory, path), "text/html; charset=utf-8", keep_in_memory=True)
+                      for name, path in (manifest or {}).get("pages", {}).items()}
+
+    def respond(self, name, headers):
+        """(status, headers, body), or None when the page isn't built (serve the source file instead)."""
+        if self._watcher.changed():
+            self._load()
+        page = self.pages.get(name)
+        return page.respond(headers, REVALIDATE) if page is not None else None
+
+    def source_path(self, name):
+        return os.path.join(self.source, name)
+
+
+# ==== CLI ====
+def main():
+    from app import settings
+
+    parser = argparse.ArgumentParser(description="Static asset pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="hash, compress and resize app/static into the dist directory")
+    build_parser.add_argument("--source", default=settings.STATIC_DIR)
+    build_parser.add_argument("--output", default=settings.STATIC_DIST_DIR)
+    build_parser.add_argument("--widths", default=",".join(str(w) for w in DEFAULT_WIDTHS))
+    build_parser.add_argument("--webp-quality", type=int, default=80)
+    build_parser.add_argument("--keep", type=int, default=KEEP_BUILDS, help="earlier builds whose files stay served")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        widths = [int(w) for w in args.widths.split(",") if w]
+        files, pages = build(args.source, args.output, widths, args.webp_quality, args.keep)
+        before = sum(os.path.getsize(os.path.join(args.source, name)) for name in [*files, *pages])
+        after = sum(os.path.getsize(os.path.join(root, name))
+                    for root, _, names in os.walk(args.output) for name in names)
+        print(f"✅ Built {len(files)} assets and {len(pages)} pages into {args.output} "
+              f"in {time.perf_counter() - started:.1f} s ({before / 1e3:.0f} kB source, "
+              f"{after / 1e3:.0f} kB on disk for the last {args.keep} builds)")
+
+
+if __name__ == "__main__":
+    main()
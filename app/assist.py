@@ -0,0 +1,164 @@
+# ==== AI Assist Query Engine ====
+# Built once at startup from disease_info.json:
+#   * normalized display names and an exact-name lookup
+#   * an inverted index over name + symptom/treatment text, scored with BM25
+#     (name tokens are counted NAME_BOOST times so crop/disease names dominate);
+#     an entry only answers if the query names its crop or disease, so a shared
+#     symptom word alone never picks an unrelated entry
+#   * character trigrams over the vocabulary to find typo candidates, confirmed
+#     with a bounded edit distance
+#   * an LRU cache of final answers keyed by the normalized query
+import math
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+GREETINGS = {"hi", "hello", "hey", "hai", "hii", "helo"}
+THANKS = {"thank you", "thanks", "thanku", "thankyou", "thx", "ty", "thank u"}
+LIST_QUERIES = {"diseases", "disease list", "show diseases", "list diseases", "all diseases"}
+# Query words that choose which sections to answer with rather than what to search for
+SECTION_KEYWORDS = {
+    "fertilizer": ("Fertilizer", "fertilizer"),
+    "treatment": ("Treatment", "treatment"),
+    "organic": ("Organic Treatment", "organic_treatment"),
+    "chemical": ("Chemical Treatment", "chemical_treatment"),
+    "tips": ("Tips", "tips"),
+}
+STOPWORDS = {"the", "and", "for", "what", "how", "can", "with", "does", "about", "my", "is", "of", "to", "in", "on", "a",
+             "an", "i", "do", "me", "give", "tell", "show", "plant", "leaf", "leaves", "disease", "info", "information"}
+INDEXED_FIELDS = ("symptoms", "causes", "treatment", "organic_treatment", "chemical_treatment", "tips")
+NAME_BOOST = 3
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text):
+    return " ".join(TOKEN_RE.findall(text.lower().replace("_", " ")))
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower().replace("_", " ")) if t not in STOPWORDS]
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 as soon as it is known to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        best = current[0]
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            best = min(best, current[j])
+        if best > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class AssistIndex:
+    def __init__(self, disease_info, k1=1.2, b=0.75, cache_size=4096):
+        self.info = disease_info
+        self.keys = list(disease_info)
+        self.display_names = [key.replace("_", " ").replace("__", " ") for key in self.keys]
+        self.exact = {normalize(key): i for i, key in enumerate(self.keys)}
+        self.name_terms = [set(tokenize(key)) for key in self.keys]
+        self.k1 = k1
+        self.b = b
+
+        # term -> {doc id: term frequency}
+        self.postings = defaultdict(dict)
+        self.doc_lengths = []
+        for doc_id, key in enumerate(self.keys):
+            counts = Counter(tokenize(key))
+            for term in counts:
+                counts[term] *= NAME_BOOST
+            entry = disease_info[key]
+            for field in INDEXED_FIELDS:
+                counts.update(tokenize(entry.get(field, "")))
+            for term, tf in counts.items():
+                self.postings[term][doc_id] = tf
+            self.doc_lengths.append(sum(counts.values()))
+        self.avg_length = sum(self.doc_lengths) / max(len(self.doc_lengths), 1)
+        n_docs = len(self.keys)
+        self.idf = {term: math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for term, docs in self.postings.items()}
+
+        self.trigram_index = defaultdict(set)
+        for term in self.postings:
+            for gram in trigrams(term):
+                self.trigram_index[gram].add(term)
+
+        self.answer = lru_cache(maxsize=cache_size)(self._answer)
+
+    # ---- Search ----
+    def expand_term(self, term):
+        """Exact vocabulary term, or the closest terms within edit distance 1 (2 for long words)."""
+        if term in self.postings:
+            return [term]
+        limit = 1 if len(term) <= 5 else 2
+        candidates = Counter()
+        for gram in trigrams(term):
+            for candidate in self.trigram_index.get(gram, ()):
+                candidates[candidate] += 1
+        matches = []
+        for candidate, shared in candidates.most_common(50):
+            distance = bounded_edit_distance(term, candidate, limit)
+            if distance <= limit:
+                matches.append((distance, candidate))
+        if not matches:
+            return []
+        best = min(distance for distance, _ in matches)
+        return [candidate for distance, candidate in matches if distance == best]
+
+    def search(self, query, top_k=1):
+        scores = defaultdict(float)
+        named = set()
+        for term in tokenize(query):
+            if term in SECTION_KEYWORDS or len(term) < 2:
+                continue
+            for expanded in self.expand_term(term):
+                idf = self.idf[expanded]
+                for doc_id, tf in self.postings[expanded].items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+                    if expanded in self.name_terms[doc_id]:
+                        named.add(doc_id)
+        ranked = sorted(((doc_id, score) for doc_id, score in scores.items() if doc_id in named),
+                        key=lambda item: (-item[1], item[0]))
+        return [self.keys[doc_id] for doc_id, _ in ranked[:top_k]]
+
+    # ---- Answers ----
+    def _answer(self, query):
+        """Response body for a normalized query; cached per query string."""
+        if query in GREETINGS or re.match(r"^(hi|hello|hey)[.! ]*$", query):
+            return {"response": "Hello, how can I assist you?"}
+        if query in THANKS or re.match(r"^(thank(s| you|u)?)[.! ]*$", query):
+            return {"response": "You're welcome! If you have more questions, just ask."}
+        if query in LIST_QUERIES:
+            return {"diseases": list(self.display_names), "response": "Select a disease from the list above to get details."}
+        if query in self.exact:
+            info = self.info[self.keys[self.exact[query]]]
+            return {"response": f"Fertilizer: {info.get('fertilizer', 'N/A')}\nTreatment: {info.get('treatment', 'N/A')}\nOrganic: {info.get('organic_treatment', 'N/A')}\nChemical: {info.get('chemical_treatment', 'N/A')}\nTips: {info.get('tips', 'N/A')}"}
+
+        matches = self.search(query)
+        if not matches:
+            return {"response": "Sorry, I couldn't find info for your query."}
+        info = self.info[matches[0]]
+        # Build response based on keywords
+        response = ""
+        for keyword, (label, field) in SECTION_KEYWORDS.items():
+            if keyword in query:
+                response += f"{label}: {info.get(field, 'N/A')}\n"
+        # If no keyword, give summary
+        if not response:
+            response = f"Symptoms: {info.get('symptoms', 'N/A')}\nTreatment: {info.get('treatment', 'N/A')}\nFertilizer: {info.get('fertilizer', 'N/A')}\nTips: {info.get('tips', 'N/A')}"
+        return {"response": response.strip()}
+
+    def query(self, text):
+        return self.answer(normalize(text))
@@ -0,0 +1,249 @@
+# ==== Passwords & Sessions ====
+# Passwords are stored as scrypt hashes ("scrypt$n$r$p$salt$hash"). The cost
+# parameters are settings, and hashes record their own parameters, so raising
+# the cost only affects new and re-hashed passwords. Hashing is CPU-bound and
+# runs on the CPU pool (scrypt releases the GIL). Plaintext rows from before
+# hashing still verify and are re-hashed on their next successful login, or all
+# at once with `python -m app.auth rehash`.
+#
+# A session cookie is "<session id>.<HMAC-SHA256 of the id>". The signature is
+# checked first, so forged or mangled cookies never reach the cache or the
+# database. Valid ids are resolved through an in-memory LRU (bounded, O(1)) in
+# front of the sessions table, which stores only sha256(id) and an expiry.
+# Cached entries are re-checked against the table every `recheck_seconds`, so
+# a logout in one worker process reaches the others within that window.
+# Expired rows are swept periodically.
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SCRYPT_PREFIX = "scrypt"
+
+
+# ---- Passwords ----
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    # scrypt needs 128 * n * r * p bytes; leave headroom over OpenSSL's 32 MB default
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p + (1 << 20), dklen=32)
+
+
+def hash_password(password, n=2 ** 14, r=8, p=1):
+    salt = os.urandom(16)
+    return f"{SCRYPT_PREFIX}${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def verify_password(password, stored):
+    """True if password matches a stored hash (or a legacy plaintext value)."""
+    if stored is None:
+        return False
+    if not stored.startswith(SCRYPT_PREFIX + "$"):
+        return hmac.compare_digest(stored.encode(), password.encode())
+    try:
+        _, n, r, p, salt, expected = stored.split("$")
+        return hmac.compare_digest(_scrypt(password, _unb64(salt), int(n), int(r), int(p)), _unb64(expected))
+    except ValueError:
+        # Truncated or mangled hash (binascii.Error is a ValueError too)
+        logger.warning("Malformed password hash")
+        return False
+
+
+def needs_rehash(stored, n=2 ** 14, r=8, p=1):
+    """Plaintext, or hashed with other cost parameters than the current ones."""
+    if not stored.startswith(SCRYPT_PREFIX + "$"):
+        return True
+    return stored.split("$")[1:4] != [str(n), str(r), str(p)]
+
+
+# ---- Signing ----
+def load_secret(path):
+    """The signing key shared by every worker process, created on first use."""
+    if not os.path.exists(path):
+        # Written to a private temp file and linked into place, so no process ever reads a partial key
+        temp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(32))
+        try:
+            os.link(temp, path)
+        except FileExistsError:
+            pass  # another worker won the race; use its key
+        finally:
+            os.unlink(temp)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _sign(secret, session_id):
+    return _b64(hmac.new(secret, session_id.encode(), hashlib.sha256).digest())
+
+
+def _session_key(session_id):
+    # Only a hash of the id is stored, so a copy of the database can't be replayed as cookies
+    return hashlib.sha256(session_id.encode()).hexdigest()
+
+
+# ---- Sessions ----
+class SessionStore:
+    def __init__(self, repo, secret, ttl_seconds=7 * 24 * 3600, max_entries=100_000, recheck_seconds=30.0):
+        self.repo = repo
+        self.secret = secret
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.recheck_seconds = recheck_seconds
+        self._entries = OrderedDict()   # key -> (email, expires, checked)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._sweep_task = None
+
+    async def start(self, sweep_interval=600.0):
+        if self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweeper(sweep_interval))
+
+    async def stop(self):
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            await asyncio.gather(self._sweep_task, return_exceptions=True)
+            self._sweep_task = None
+
+    def create(self, email):
+        """Start a session and return its cookie value."""
+        session_id = secrets.token_urlsafe(32)
+        now = time.time()
+        expires = now + self.ttl_seconds
+        key = _session_key(session_id)
+        self.repo.create_session(key, email, now, expires)
+        self._remember(key, (email, expires, now))
+        return f"{session_id}.{_sign(self.secret, session_id)}"
+
+    def _verified_key(self, token):
+        if not token:
+            return None
+        session_id, _, signature = token.partition(".")
+        # Bytes, not str: compare_digest raises on non-ASCII text, and cookies are client input
+        if not session_id or not hmac.compare_digest(signature.encode(), _sign(self.secret, session_id).encode()):
+            self.rejected += 1
+            return None
+        return _session_key(session_id)
+
+    def cached(self, token):
+        """(True, email or None) when the answer needs no database read, else (False, None)."""
+        key = self._verified_key(token)
+        if key is None:
+            return True, None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[2] < self.recheck_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, (entry[0] if entry[1] > now else None)
+        return False, None
+
+    def get(self, token):
+        """Email of the session's user, or None for a missing, forged, expired or revoked session."""
+        resolved, email = self.cached(token)
+        if resolved:
+            return email
+        key = self._verified_key(token)
+        now = time.time()
+        self.misses += 1
+        row = self.repo.find_session(key)
+        if row is None or row[1] <= now:
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        self._remember(key, (row[0], row[1], now))
+        return row[0]
+
+    def delete(self, token):
+        key = self._verified_key(token)
+        if key is None:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+        self.repo.delete_session(key)
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def sweep(self):
+        """Drop expired sessions from the table and the cache; returns how many rows were deleted."""
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, expires, _) in self._entries.items() if expires <= now]:
+                del self._entries[key]
+        return self.repo.delete_expired_sessions(now)
+
+    async def _sweeper(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                swept = await asyncio.to_thread(self.sweep)
+                if swept:
+                    logger.info("Swept %d expired sessions", swept)
+            except Exception:
+                logger.exception("Session sweep failed")
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            "cached": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# ==== CLI ====
+def main():
+    from app import settings
+    from app.db import Repository
+
+    parser = argparse.ArgumentParser(description="Password maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rehash", help="hash every remaining plaintext password now instead of at next login")
+    args = parser.parse_args()
+
+    repo = Repository(settings.DB_PATH, pool_size=1)
+    try:
+        if args.command == "rehash":
+            cost = (settings.PASSWORD_SCRYPT_N, settings.PASSWORD_SCRYPT_R, settings.PASSWORD_SCRYPT_P)
+            updated = 0
+            for email, stored in repo.list_passwords():
+                # Hashes with older cost parameters need the plaintext, so they wait for the next login
+                if stored is None or stored.startswith(SCRYPT_PREFIX + "$"):
+                    continue
+                repo.update_password(email, hash_password(stored, *cost))
+                updated += 1
+            print(f"Hashed {updated} plaintext passwords")
+    finally:
+        repo.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# ==== Inference Backends ====
+# The server can run the eager timm model or one of the artifacts produced by
+# export_model.py. Every backend is a callable taking a (N, 3, 224, 224) float
+# tensor and returning (N, num_classes) logits, so the inference engine does
+# not care which one is loaded. forward_with_features() also returns the pooled
+# feature vector from the same pass where the backend allows it.
+#
+# "auto" (the default) serves the frozen TorchScript artifact when one has been
+# exported and only falls back to building the timm graph from model.pth when
+# it hasn't: loading a serialized module skips timm's import and model
+# construction, which dominates worker cold start.
+import os
+
+import torch
+
+BACKENDS = ("auto", "eager", "torchscript", "onnx", "int8")
+
+
+def resolve_backend(backend, model_path):
+    """Concrete backend for "auto": torchscript if exported next to the checkpoint, else eager."""
+    if backend != "auto":
+        return backend
+    return "torchscript" if os.path.exists(backend_path("torchscript", model_path)) else "eager"
+
+
+def backend_path(backend, model_path):
+    """Artifact file for a backend, next to the fp32 checkpoint."""
+    base, _ = os.path.splitext(model_path)
+    return {
+        "eager": model_path,
+        "torchscript": base + ".ts",
+        "onnx": base + ".onnx",
+        "int8": base + "_int8.ts",
+    }[backend]
+
+
+def build_eager_model(model_name, num_classes, model_path, device, mmap=False):
+    """timm model with the checkpoint's weights.
+
+    With mmap=True the state dict is memory-mapped from model_path and assigned
+    to the module as-is instead of being copied into freshly allocated
+    parameters, so every worker process serving the same file shares one copy
+    of the weights through the page cache. The graph is built on the meta
+    device in that case, which also skips timm's random initialisation.
+    """
+    import timm
+    if mmap and device.type == "cpu":
+        state_dict = torch.load(model_path, map_location="cpu", mmap=True, weights_only=True)
+        with torch.device("meta"):
+            model = timm.create_model(model_name, pretrained=False, num_classes=num_classes)
+        model.load_state_dict(state_dict, assign=True)
+        if not any(t.is_meta for t in (*model.parameters(), *model.buffers())):
+            model.eval()
+            return model
+        # Some tensor is not in the checkpoint (non-persistent buffer): build it the normal way
+    model = timm.create_model(model_name, pretrained=False, num_classes=num_classes)
+    model.load_state_dict(torch.load(model_path, map_location=device))
+    model.to(device)
+    model.eval()
+    return model
+
+
+class OnnxModel:
+    """Wraps an onnxruntime session so it can be called like a torch module."""
+
+    def __init__(self, path, intra_op_threads=0):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, inputs):
+        logits = self.session.run(None, {self.input_name: inputs.detach().cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+    def eval(self):
+        return self
+
+
+def forward_with_features(model, inputs):
+    """(logits, pooled pre-classifier features) from one forward pass.
+
+    The features are None for backends that only expose logits (ONNX, int8 and
+    TorchScript exported before forward_embed existed).
+    """
+    if hasattr(model, "forward_embed"):
+        # TorchScript from export_model.py traces this method next to forward()
+        return model.forward_embed(inputs)
+    if hasattr(model, "forward_head"):
+        # Eager timm model: forward() is forward_features() then forward_head()
+        pooled = model.forward_head(model.forward_features(inputs), pre_logits=True)
+        return model.get_classifier()(pooled), pooled
+    return model(inputs), None
+
+
+def load_model(backend, model_name, num_classes, model_path, device, mmap=False):
+    """Return (model, artifact_path) for the configured backend; mmap only applies to eager."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}', expected one of {BACKENDS}")
+    backend = resolve_backend(backend, model_path)
+    path = backend_path(backend, model_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found, run export_model.py to build the '{backend}' backend")
+    if backend == "eager":
+        return build_eager_model(model_name, num_classes, path, device, mmap=mmap), path
+    if backend == "onnx":
+        return OnnxModel(path), path
+    # TorchScript fp32 and int8 artifacts are both frozen ScriptModules
+    model = torch.jit.load(path, map_location="cpu" if backend == "int8" else device)
+    model.eval()
+    return model, path
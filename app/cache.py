@@ -0,0 +1,189 @@
+# ==== Content-Addressed Prediction Cache ====
+# Predictions are keyed by sha256(image bytes) + the model checkpoint version,
+# so an identical upload never hits the model twice. A memory-bounded LRU sits
+# in front of an optional sqlite tier that survives restarts.
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """sha256 of a file, used as the model checkpoint version."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def image_key(source, chunk_size=1 << 20):
+    """sha256 of upload bytes or of a file object, read in chunks and rewound."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(chunk_size), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    def __init__(self, model_version, max_bytes=32 * 1024 * 1024, disk_path=None,
+                 watch_path=None, watch_interval=5.0):
+        self.model_version = model_version
+        self.max_bytes = max_bytes
+        self.watch_path = watch_path
+        self.watch_interval = watch_interval
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._watch_mtime = self._mtime()
+        self._stale = False
+        self._disk = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in self._disk.execute("PRAGMA table_info(prediction_cache)")]
+            if columns and "result" not in columns:
+                # Tables from before top-k/calibration only hold the top-1 fields; nothing in them is reusable
+                self._disk.execute("DROP TABLE prediction_cache")
+            self._disk.execute("""
+            CREATE TABLE IF NOT EXISTS prediction_cache (
+                key TEXT PRIMARY KEY,
+                model_version TEXT,
+                prediction TEXT,
+                confidence REAL,
+                loss REAL,
+                result TEXT,
+                created REAL
+            )
+            """)
+            # Rows from older checkpoints can never be hit again
+            self._disk.execute("DELETE FROM prediction_cache WHERE model_version != ?", (model_version,))
+            self._disk.commit()
+
+    # ---- Invalidation ----
+    def _mtime(self):
+        if not self.watch_path:
+            return None
+        try:
+            return os.stat(self.watch_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _check_checkpoint(self):
+        """Stop serving cached results once the checkpoint on disk no longer matches the loaded model."""
+        if not self.watch_path or self._stale:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.watch_interval:
+            return
+        self._last_check = now
+        if self._mtime() != self._watch_mtime:
+            logger.info("%s changed on disk, prediction cache disabled until the model is reloaded", self.watch_path)
+            self._stale = True
+            self.clear()
+
+    def set_model_version(self, model_version):
+        """Call after (re)loading the model; drops every entry from the previous version."""
+        with self._lock:
+            self.model_version = model_version
+            self._watch_mtime = self._mtime()
+            self._stale = False
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM prediction_cache WHERE model_version != ?", (self.model_version,))
+                if self._stale:
+                    self._disk.execute("DELETE FROM prediction_cache")
+                self._disk.commit()
+
+    # ---- Lookup ----
+    def _key(self, digest):
+        return f"{self.model_version}:{digest}"
+
+    def get(self, digest):
+        self._check_checkpoint()
+        if self._stale:
+            self.misses += 1
+            return None
+        key = self._key(digest)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0], model_version=self.model_version)
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT result FROM prediction_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    result = json.loads(row[0])
+                    self._store(key, result)
+                    self.disk_hits += 1
+                    return dict(result, model_version=self.model_version)
+            self.misses += 1
+            return None
+
+    def put(self, digest, result):
+        # Results from a model that was swapped out while they were computed are not cached
+        if self._stale or result.get("model_version", self.model_version) != self.model_version:
+            return
+        key = self._key(digest)
+        result = {k: v for k, v in result.items() if k != "model_version"}
+        with self._lock:
+            self._store(key, result)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO prediction_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, self.model_version, result["prediction"], result["confidence"], result["loss"],
+                     json.dumps(result), time.time()),
+                )
+                self._disk.commit()
+
+    def _store(self, key, result):
+        size = sys.getsizeof(key) + len(json.dumps(result)) + 64
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (result, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def metrics(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "model_version": self.model_version,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "disk_tier": self._disk is not None,
+            "stale": self._stale,
+        }
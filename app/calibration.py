@@ -0,0 +1,66 @@
+# ==== Confidence Calibration ====
+# Softmax confidence from a fine-tuned network is usually over-confident. A
+# single temperature T, fitted offline on the validation split by calibrate.py
+# (minimising NLL of softmax(logits / T)), rescales it without changing the
+# argmax. The fitted value lives next to the checkpoint as
+# <model>_calibration.json and travels with it into the registry.
+import json
+import os
+
+import torch
+import torch.nn.functional as F
+
+
+def calibration_path(model_path):
+    base, _ = os.path.splitext(model_path)
+    return base + "_calibration.json"
+
+
+def load_temperature(model_path):
+    """Fitted temperature for a checkpoint, or 1.0 (uncalibrated) if none was fitted."""
+    path = calibration_path(model_path)
+    if not os.path.exists(path):
+        return 1.0
+    with open(path, "r") as f:
+        return float(json.load(f)["temperature"])
+
+
+def fit_temperature(logits, labels, max_iter=100):
+    """Temperature minimising the NLL of softmax(logits / T) on held-out (logits, labels)."""
+    logits = logits.float()
+    log_t = torch.zeros(1, requires_grad=True)   # optimise log T so T stays positive
+    optimizer = torch.optim.LBFGS([log_t], lr=0.1, max_iter=max_iter, line_search_fn="strong_wolfe")
+
+    def closure():
+        optimizer.zero_grad()
+        loss = F.cross_entropy(logits / log_t.exp(), labels)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return float(log_t.detach().exp())
+
+
+def expected_calibration_error(probabilities, labels, bins=15):
+    """Gap between confidence and accuracy, averaged over equal-width confidence bins."""
+    confidences, predicted = probabilities.max(dim=1)
+    correct = (predicted == labels).float()
+    ece = 0.0
+    edges = torch.linspace(0, 1, bins + 1)
+    for low, high in zip(edges[:-1], edges[1:]):
+        in_bin = (confidences > low) & (confidences <= high)
+        if in_bin.any():
+            ece += in_bin.float().mean().item() * abs(confidences[in_bin].mean().item() - correct[in_bin].mean().item())
+    return ece
+
+
+def calibration_report(logits, labels, temperature):
+    """NLL / ECE / accuracy before and after scaling, for calibrate.py's output."""
+    report = {"temperature": temperature, "samples": len(labels)}
+    for name, t in (("before", 1.0), ("after", temperature)):
+        scaled = logits.float() / t
+        report[f"nll_{name}"] = F.cross_entropy(scaled, labels).item()
+        report[f"ece_{name}"] = expected_calibration_error(F.softmax(scaled, dim=1), labels)
+    report["accuracy"] = (logits.argmax(dim=1) == labels).float().mean().item() * 100
+    return report
+
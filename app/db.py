@@ -0,0 +1,476 @@
+# ==== SQLite Data-Access Layer ====
+# One place for every users/history query:
+#   * a thread-safe pool of long-lived connections (no connect() per request)
+#   * WAL journaling + tuned pragmas so readers never block the writer
+#   * fixed SQL strings, which sqlite3 keeps prepared in each connection's statement cache
+#   * versioned migrations tracked with PRAGMA user_version, applied on startup
+#   * a write-behind queue so /predict never waits for a history commit
+import base64
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from app.metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",      # durable across app crashes; fsync only at checkpoints
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",       # ~16 MB page cache per connection
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+def _has_column(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def _add_history_loss(conn):
+    # Was add_loss_column.py: databases created before the loss column existed
+    if not _has_column(conn, "history", "loss"):
+        conn.execute("ALTER TABLE history ADD COLUMN loss REAL")
+
+
+def _add_history_model_version(conn):
+    # Registry version that produced each prediction (see app/registry.py)
+    if not _has_column(conn, "history", "model_version"):
+        conn.execute("ALTER TABLE history ADD COLUMN model_version TEXT")
+
+
+def _add_history_needs_review(conn):
+    # Set when the calibrated confidence is below LOW_CONFIDENCE_THRESHOLD
+    if not _has_column(conn, "history", "needs_review"):
+        conn.execute("ALTER TABLE history ADD COLUMN needs_review INTEGER NOT NULL DEFAULT 0")
+
+
+def _add_history_embedding_row(conn):
+    # Row of the prediction's feature vector in the model version's embedding store (see app/embeddings.py)
+    if not _has_column(conn, "history", "embedding_row"):
+        conn.execute("ALTER TABLE history ADD COLUMN embedding_row INTEGER")
+
+
+# (version, list of SQL strings or callables taking the connection)
+MIGRATIONS = [
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE,
+            password TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT,
+            prediction TEXT,
+            confidence REAL,
+            timestamp TEXT
+        )
+        """,
+    ]),
+    (2, [_add_history_loss]),
+    (3, [
+        # Serves WHERE email = ? ORDER BY timestamp DESC (rowid breaks ties inside the index)
+        "CREATE INDEX IF NOT EXISTS idx_history_email_timestamp ON history (email, timestamp)",
+        # Per user, day and class aggregates, kept current by the triggers below
+        """
+        CREATE TABLE IF NOT EXISTS history_daily (
+            email TEXT NOT NULL,
+            day TEXT NOT NULL,
+            prediction TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            confidence_sum REAL NOT NULL DEFAULT 0,
+            loss_sum REAL NOT NULL DEFAULT 0,
+            loss_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (email, day, prediction)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS history_daily_insert AFTER INSERT ON history BEGIN
+            INSERT INTO history_daily (email, day, prediction, count, confidence_sum, loss_sum, loss_count)
+            VALUES (NEW.email, substr(NEW.timestamp, 1, 10), NEW.prediction, 1,
+                    COALESCE(NEW.confidence, 0), COALESCE(NEW.loss, 0), NEW.loss IS NOT NULL)
+            ON CONFLICT (email, day, prediction) DO UPDATE SET
+                count = count + 1,
+                confidence_sum = confidence_sum + excluded.confidence_sum,
+                loss_sum = loss_sum + excluded.loss_sum,
+                loss_count = loss_count + excluded.loss_count;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS history_daily_delete AFTER DELETE ON history BEGIN
+            UPDATE history_daily SET
+                count = count - 1,
+                confidence_sum = confidence_sum - COALESCE(OLD.confidence, 0),
+                loss_sum = loss_sum - COALESCE(OLD.loss, 0),
+                loss_count = loss_count - (OLD.loss IS NOT NULL)
+            WHERE email = OLD.email AND day = substr(OLD.timestamp, 1, 10) AND prediction = OLD.prediction;
+            DELETE FROM history_daily
+            WHERE email = OLD.email AND day = substr(OLD.timestamp, 1, 10) AND prediction = OLD.prediction AND count <= 0;
+        END
+        """,
+        # Backfill from rows written before the rollup existed
+        """
+        INSERT OR REPLACE INTO history_daily (email, day, prediction, count, confidence_sum, loss_sum, loss_count)
+        SELECT email, substr(timestamp, 1, 10), prediction, COUNT(*),
+               COALESCE(SUM(confidence), 0), COALESCE(SUM(loss), 0), COUNT(loss)
+        FROM history WHERE email IS NOT NULL AND timestamp IS NOT NULL AND prediction IS NOT NULL
+        GROUP BY email, substr(timestamp, 1, 10), prediction
+        """,
+    ]),
+    (4, [
+        # Background report jobs (see app/jobs.py); the thumbnail is dropped once the PDF exists
+        """
+        CREATE TABLE IF NOT EXISTS report_jobs (
+            id TEXT PRIMARY KEY,
+            email TEXT,
+            status TEXT NOT NULL,
+            prediction TEXT NOT NULL,
+            confidence REAL,
+            timestamp TEXT,
+            thumbnail BLOB,
+            error TEXT,
+            created REAL NOT NULL,
+            finished REAL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_report_jobs_status ON report_jobs (status, created)",
+    ]),
+    (5, [_add_history_model_version]),
+    (6, [
+        _add_history_needs_review,
+        # Partial index: only flagged rows, so the review queue stays small and cheap to page
+        "CREATE INDEX IF NOT EXISTS idx_history_review ON history (email, timestamp, id) WHERE needs_review = 1",
+    ]),
+    (7, [
+        _add_history_embedding_row,
+        "CREATE INDEX IF NOT EXISTS idx_history_embedding ON history (model_version, embedding_row) "
+        "WHERE embedding_row IS NOT NULL",
+    ]),
+    (8, [
+        # Server-side sessions (see app/auth.py); id is sha256 of the session id in the cookie
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            email TEXT NOT NULL,
+            created REAL NOT NULL,
+            expires REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)",
+    ]),
+]
+
+# ==== Statements ====
+SQL_INSERT_USER = "INSERT INTO users (email, password) VALUES (?, ?)"
+SQL_FIND_USER = "SELECT id, email, password FROM users WHERE email = ?"
+SQL_UPDATE_PASSWORD = "UPDATE users SET password = ? WHERE email = ?"
+SQL_LIST_PASSWORDS = "SELECT email, password FROM users"
+SQL_INSERT_SESSION = "INSERT INTO sessions (id, email, created, expires) VALUES (?, ?, ?, ?)"
+SQL_FIND_SESSION = "SELECT email, expires FROM sessions WHERE id = ?"
+SQL_DELETE_SESSION = "DELETE FROM sessions WHERE id = ?"
+SQL_DELETE_EXPIRED_SESSIONS = "DELETE FROM sessions WHERE expires <= ?"
+SQL_INSERT_HISTORY = (
+    "INSERT INTO history (email, prediction, confidence, loss, timestamp, model_version, needs_review, embedding_row) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+SQL_LIST_HISTORY = (
+    "SELECT id, prediction, confidence, timestamp, needs_review FROM history WHERE email = ? "
+    "ORDER BY timestamp DESC, id DESC LIMIT ?"
+)
+SQL_LIST_HISTORY_AFTER = (
+    "SELECT id, prediction, confidence, timestamp, needs_review FROM history WHERE email = ? AND (timestamp, id) < (?, ?) "
+    "ORDER BY timestamp DESC, id DESC LIMIT ?"
+)
+SQL_LIST_REVIEW = (
+    "SELECT id, prediction, confidence, timestamp, needs_review FROM history WHERE email = ? AND needs_review = 1 "
+    "ORDER BY timestamp DESC, id DESC LIMIT ?"
+)
+SQL_LIST_REVIEW_AFTER = (
+    "SELECT id, prediction, confidence, timestamp, needs_review FROM history "
+    "WHERE email = ? AND needs_review = 1 AND (timestamp, id) < (?, ?) "
+    "ORDER BY timestamp DESC, id DESC LIMIT ?"
+)
+# Rows arrive as one JSON array so the statement text (and its cached plan) never changes
+SQL_SIMILAR_CASES = (
+    "SELECT embedding_row, prediction, confidence, timestamp FROM history "
+    "WHERE email = ? AND model_version = ? AND embedding_row IN (SELECT value FROM json_each(?))"
+)
+SQL_OWN_CASES = (
+    "SELECT embedding_row, prediction, confidence, timestamp FROM history "
+    "WHERE email = ? AND model_version = ? AND embedding_row IS NOT NULL"
+)
+SQL_CLASS_COUNTS = (
+    "SELECT prediction, SUM(count) FROM history_daily WHERE email = ? "
+    "GROUP BY prediction ORDER BY SUM(count) DESC"
+)
+SQL_DAILY_STATS = (
+    "SELECT day, SUM(count), SUM(confidence_sum) / SUM(count), SUM(loss_sum) / NULLIF(SUM(loss_count), 0) "
+    "FROM history_daily WHERE email = ? GROUP BY day ORDER BY day"
+)
+SQL_CLEAR_HISTORY = "DELETE FROM history WHERE email = ?"
+
+
+def encode_cursor(timestamp, row_id):
+    """Opaque keyset cursor for the next history page."""
+    return base64.urlsafe_b64encode(json.dumps([timestamp, row_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Raises ValueError on a malformed cursor."""
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(timestamp), int(row_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+class ConnectionPool:
+    def __init__(self, path, size=4):
+        self.path = path
+        self._pool = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._pool.put(self._connect())
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            with conn:  # commit on success, rollback on error
+                yield conn
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+def migrate(pool):
+    """Apply every migration newer than the database's user_version."""
+    with pool.transaction() as conn:
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, steps in MIGRATIONS:
+            if version <= current:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {version}")
+            logger.info("Database migrated to schema version %d", version)
+
+
+# Queued by flush(): ends the writer's batching window so a waiting reader isn't held for it
+_FLUSH = object()
+
+
+class HistoryWriter:
+    """Write-behind queue: rows are committed in batches on a background thread.
+
+    Rows are numbered as they are queued, so flush() waits only for the rows
+    queued before it was called, not for rows other requests keep adding.
+    """
+
+    def __init__(self, pool, max_batch=256, flush_interval=0.5):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._done = threading.Condition()
+        self._queued = 0      # rows ever queued
+        self._finished = 0    # rows committed (or given up on), in queue order
+        self.written = 0
+        self.failed = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def add(self, row):
+        self.add_many([row])
+
+    def add_many(self, rows):
+        # Numbered and queued under one lock so sequence numbers follow queue order
+        with self._done:
+            for row in rows:
+                self._queue.put(row)
+            self._queued += len(rows)
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def pending(self):
+        return self._queued - self._finished
+
+    def flush(self):
+        """Block until every row queued before this call has been committed."""
+        if self._thread is None:
+            return
+        with self._done:
+            target = self._queued
+            if self._finished >= target:
+                return
+            self._queue.put(_FLUSH)
+            self._done.wait_for(lambda: self._finished >= target)
+
+    def _run(self):
+        running = True
+        while running:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            rows = []
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None and item is not _FLUSH:
+                rows.append(item)
+                if len(rows) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if item is None:
+                running = False
+            if rows:
+                self._write(rows)
+
+    def _write(self, rows):
+        started = time.perf_counter()
+        try:
+            with self.pool.transaction() as conn:
+                conn.executemany(SQL_INSERT_HISTORY, rows)
+            self.written += len(rows)
+        except Exception:
+            self.failed += len(rows)
+            logger.exception("Failed to save %d history rows", len(rows))
+        finally:
+            observe_stage("db_write", time.perf_counter() - started)
+            with self._done:
+                self._finished += len(rows)
+                self._done.notify_all()
+
+
+class Repository:
+    def __init__(self, path, pool_size=4):
+        self.pool = ConnectionPool(path, size=pool_size)
+        migrate(self.pool)
+        self.history_writer = HistoryWriter(self.pool)
+
+    # ---- Users ----
+    def create_user(self, email, password):
+        """Returns False if the email is already registered."""
+        try:
+            with self.pool.transaction() as conn:
+                conn.execute(SQL_INSERT_USER, (email, password))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def find_user(self, email):
+        """(id, email, password hash) or None; the hash is checked by app.auth.verify_password."""
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_FIND_USER, (email,)).fetchone()
+
+    def update_password(self, email, password_hash):
+        with self.pool.transaction() as conn:
+            conn.execute(SQL_UPDATE_PASSWORD, (password_hash, email))
+
+    def list_passwords(self):
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_LIST_PASSWORDS).fetchall()
+
+    # ---- Sessions ----
+    def create_session(self, session_key, email, created, expires):
+        with self.pool.transaction() as conn:
+            conn.execute(SQL_INSERT_SESSION, (session_key, email, created, expires))
+
+    def find_session(self, session_key):
+        """(email, expires) or None."""
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_FIND_SESSION, (session_key,)).fetchone()
+
+    def delete_session(self, session_key):
+        with self.pool.transaction() as conn:
+            conn.execute(SQL_DELETE_SESSION, (session_key,))
+
+    def delete_expired_sessions(self, now):
+        with self.pool.transaction() as conn:
+            return conn.execute(SQL_DELETE_EXPIRED_SESSIONS, (now,)).rowcount
+
+    # ---- History ----
+    def add_history(self, rows):
+        """Queue rows for the write-behind writer; returns immediately."""
+        self.history_writer.add_many(rows)
+
+    def list_history(self, email, limit=100, after=None, review_only=False):
+        """One page of history, newest first. `after` is the (timestamp, id) of the last row already seen.
+
+        review_only=True lists just the rows flagged as low confidence.
+        """
+        self.history_writer.flush()  # include rows still waiting in the write-behind queue
+        first, following = (SQL_LIST_REVIEW, SQL_LIST_REVIEW_AFTER) if review_only else (SQL_LIST_HISTORY, SQL_LIST_HISTORY_AFTER)
+        with self.pool.connection() as conn:
+            if after is None:
+                return conn.execute(first, (email, limit)).fetchall()
+            return conn.execute(following, (email, after[0], after[1], limit)).fetchall()
+
+    def similar_cases(self, email, model_version, embedding_rows):
+        """{embedding_row: (prediction, confidence, timestamp)} for the rows that are still in `email`'s history."""
+        self.history_writer.flush()
+        with self.pool.connection() as conn:
+            rows = conn.execute(SQL_SIMILAR_CASES, (email, model_version, json.dumps(embedding_rows))).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def own_cases(self, email, model_version):
+        """{embedding_row: (prediction, confidence, timestamp)} of every case in `email`'s history for a model version."""
+        self.history_writer.flush()
+        with self.pool.connection() as conn:
+            rows = conn.execute(SQL_OWN_CASES, (email, model_version)).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def history_stats(self, email):
+        self.history_writer.flush()
+        with self.pool.connection() as conn:
+            classes = conn.execute(SQL_CLASS_COUNTS, (email,)).fetchall()
+            daily = conn.execute(SQL_DAILY_STATS, (email,)).fetchall()
+        return classes, daily
+
+    def clear_history(self, email):
+        self.history_writer.flush()
+        with self.pool.transaction() as conn:
+            conn.execute(SQL_CLEAR_HISTORY, (email,))
+
+    def start(self):
+        self.history_writer.start()
+
+    def close(self):
+        self.history_writer.stop()
+        self.pool.close()
@@ -0,0 +1,297 @@
+# ==== Embedding Index ====
+# Pooled EfficientNet features of past predictions, for "similar cases" and
+# near-duplicate lookups. One store per model version (features from different
+# weights are not comparable), under EMBEDDINGS_DIR/<version>/:
+#   vectors.f16    L2-normalised float16 rows, append-only, memory-mapped for search
+#   lists.i32      IVF list of every row (-1 while the index is untrained)
+#   centroids.npy  IVF centroids, from `python -m app.embeddings train`
+# Row numbers are stable, and history.embedding_row links them to predictions.
+# Appends take an flock, so every worker process can write to the same store;
+# readers just re-map the files when they grow.
+#
+# Search is cosine similarity. With centroids it scans only the NPROBE lists
+# closest to the query (plus rows appended before training), so latency depends
+# on the list size instead of the store size. Untrained stores are scanned exactly,
+# and so is an explicit allow-list of rows (one user's own cases).
+import argparse
+import base64
+import fcntl
+import json
+import os
+import threading
+
+import numpy as np
+
+SCAN_CHUNK = 65536   # rows converted to float32 at a time during a scan
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def pack(vector):
+    """Normalised float16 vector as base64 text, small enough to cache with its prediction (3 kB at 1536 dims)."""
+    return base64.b64encode(normalize(vector).astype(np.float16).tobytes()).decode()
+
+
+def unpack(text):
+    return np.frombuffer(base64.b64decode(text), dtype=np.float16).astype(np.float32)
+
+
+class EmbeddingStore:
+    def __init__(self, directory, nprobe=8):
+        self.directory = directory
+        self.nprobe = nprobe
+        self.vectors_path = os.path.join(directory, "vectors.f16")
+        self.lists_path = os.path.join(directory, "lists.i32")
+        self.centroids_path = os.path.join(directory, "centroids.npy")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._rows = 0
+        self._centroids = None
+        self._centroids_mtime = None
+        self._members = []        # list id -> rows, for the probed lists
+        self._unassigned = np.empty(0, dtype=np.int64)
+        self._indexed = 0         # rows already sorted into _members / _unassigned
+        os.makedirs(directory, exist_ok=True)
+        self.dim = self._read_dim()
+
+    # ---- Writes ----
+    def add(self, vector):
+        """Append one feature vector (normalised here); returns its row number."""
+        return self.add_many(np.asarray(vector).reshape(1, -1))[0]
+
+    def add_many(self, vectors):
+        """Append (N, dim) feature vectors in one locked write; returns their row numbers."""
+        vectors = normalize(vectors)
+        with self._lock, open(os.path.join(self.directory, "lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self.dim is None:
+                    self.dim = self._read_dim()
+                if self.dim is None:
+                    self.dim = vectors.shape[1]
+                    with open(self.meta_path, "w") as f:
+                        json.dump({"dim": self.dim}, f)
+                if vectors.shape[1] != self.dim:
+                    raise ValueError(f"Expected {self.dim}-d vectors, got {vectors.shape[1]}")
+                centroids = self._load_centroids()
+                lists = assign(vectors, centroids) if centroids is not None else np.full(len(vectors), -1, dtype=np.int32)
+                first = os.path.getsize(self.vectors_path) // self.row_bytes if os.path.exists(self.vectors_path) else 0
+                with open(self.vectors_path, "ab") as f:
+                    f.write(vectors.astype(np.float16).tobytes())
+                with open(self.lists_path, "ab") as f:
+                    f.write(lists.astype(np.int32).tobytes())
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return list(range(first, first + len(vectors)))
+
+    def _read_dim(self):
+        """Vector size, fixed by the first add() (None for an empty store)."""
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path, "r") as f:
+            return json.load(f)["dim"]
+
+    @property
+    def row_bytes(self):
+        return self.dim * 2
+
+    # ---- Reads ----
+    def _load_centroids(self):
+        """Current centroids, reloaded when train() replaced them (possibly from another process)."""
+        try:
+            mtime = os.stat(self.centroids_path).st_mtime_ns
+        except OSError:
+            return None
+        if mtime != self._centroids_mtime:
+            self._centroids = np.load(self.centroids_path)
+            self._centroids_mtime = mtime
+            self._indexed = 0   # list ids changed: regroup every row
+        return self._centroids
+
+    def _refresh(self):
+        """Map rows appended since the last search and sort them into their IVF lists."""
+        if self.dim is None:
+            self.dim = self._read_dim()
+            if self.dim is None:
+                return
+        centroids = self._load_centroids()
+        try:
+            rows = min(os.path.getsize(self.vectors_path) // self.row_bytes, os.path.getsize(self.lists_path) // 4)
+        except OSError:
+            return
+        if rows == 0:
+            return
+        if rows != self._rows or self._indexed == 0:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(rows, self.dim))
+            self._rows = rows
+        if self._indexed >= rows:
+            return
+        lists = np.memmap(self.lists_path, dtype=np.int32, mode="r", shape=(rows,))
+        if self._indexed == 0:
+            self._members = [np.empty(0, dtype=np.int64) for _ in range(len(centroids) if centroids is not None else 0)]
+            self._unassigned = np.empty(0, dtype=np.int64)
+        new_rows = np.arange(self._indexed, rows, dtype=np.int64)
+        new_lists = np.asarray(lists[self._indexed:rows])
+        # Ids beyond the loaded centroids come from a train() still being published: scan those rows exactly
+        assigned = (new_lists >= 0) & (new_lists < len(self._members))
+        self._unassigned = np.concatenate([self._unassigned, new_rows[~assigned]])
+        if assigned.any():
+            order = np.argsort(new_lists[assigned], kind="stable")
+            sorted_rows, sorted_lists = new_rows[assigned][order], new_lists[assigned][order]
+            ids, starts = np.unique(sorted_lists, return_index=True)
+            for list_id, group in zip(ids, np.split(sorted_rows, starts[1:])):
+                self._members[list_id] = np.concatenate([self._members[list_id], group])
+        self._indexed = rows
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._rows
+
+    def vector(self, row):
+        """Stored (normalised) vector of a row, as float32."""
+        with self._lock:
+            self._refresh()
+            if not 0 <= row < self._rows:
+                raise KeyError(f"No embedding row {row}")
+            return np.asarray(self._vectors[row], dtype=np.float32)
+
+    def search(self, vector, k=5, exclude=None, rows=None):
+        """[(row, cosine similarity)] of the k most similar stored vectors, best first.
+
+        With `rows`, only those rows are candidates, scored exactly.
+        """
+        query = normalize(np.asarray(vector).reshape(-1))
+        with self._lock:
+            self._refresh()
+            if self._rows == 0:
+                return []
+            vectors, count = self._vectors, self._rows
+            candidates = None
+            if rows is not None:
+                allowed = np.unique(np.asarray(list(rows), dtype=np.int64))
+                candidates = allowed[(allowed >= 0) & (allowed < self._rows)]
+            elif self._centroids is not None:
+                probe = np.argsort(self._centroids @ query)[-self.nprobe:]
+                candidates = np.concatenate([self._members[i] for i in probe] + [self._unassigned])
+        if candidates is None:
+            scores = np.concatenate([np.asarray(vectors[start:start + SCAN_CHUNK], dtype=np.float32) @ query
+                                     for start in range(0, count, SCAN_CHUNK)])
+            candidates = np.arange(count)
+        else:
+            if not len(candidates):
+                return []
+            candidates.sort()   # ascending rows read the memory map front to back
+            scores = np.concatenate([np.asarray(vectors[candidates[start:start + SCAN_CHUNK]], dtype=np.float32) @ query
+                                     for start in range(0, len(candidates), SCAN_CHUNK)])
+        if exclude is not None:
+            scores[candidates == exclude] = -np.inf
+        k = min(k, len(candidates))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(candidates[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {
+                "rows": self._rows,
+                "dim": self.dim,
+                "lists": len(self._centroids) if self._centroids is not None else 0,
+                "unassigned": len(self._unassigned),
+                "bytes": self._rows * self.row_bytes if self.dim else 0,
+            }
+
+
+# ==== IVF Training ====
+def kmeans(sample, clusters, iterations=10, seed=0):
+    """Spherical k-means: unit-length centroids maximising cosine similarity to their members."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = assign(sample, centroids)
+        order = np.argsort(assignment, kind="stable")
+        present, starts = np.unique(assignment[order], return_index=True)
+        sums = np.zeros_like(centroids)
+        sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = np.ones(clusters, dtype=bool)
+        empty[present] = False
+        # Re-seed empty lists from random points so no list stays unused
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+def assign(vectors, centroids, chunk=8192):
+    """Nearest centroid of every row, in chunks so the score matrix stays small."""
+    return np.concatenate([np.argmax(np.asarray(vectors[start:start + chunk], dtype=np.float32) @ centroids.T, axis=1)
+                           for start in range(0, len(vectors), chunk)]).astype(np.int32)
+
+
+def train(store, lists=None, sample_size=100_000, iterations=10, seed=0):
+    """Fit IVF centroids on a sample of the store and re-assign every row.
+
+    Rows appended while this runs are assigned under the store's lock before
+    the new lists and centroids replace the old ones.
+    """
+    with store._lock:
+        store._refresh()
+        vectors, rows = store._vectors, store._rows
+    if rows == 0:
+        raise ValueError(f"{store.directory} is empty")
+    lists = lists or max(1, int(np.sqrt(rows)))
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(rows, min(rows, max(sample_size, lists)), replace=False))
+    centroids = kmeans(np.asarray(vectors[sample_rows], dtype=np.float32), min(lists, len(sample_rows)), iterations, seed)
+    assignment = assign(vectors, centroids)
+    with store._lock, open(os.path.join(store.directory, "lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            total = os.path.getsize(store.vectors_path) // store.row_bytes
+            if total > rows:
+                tail = np.memmap(store.vectors_path, dtype=np.float16, mode="r", shape=(total, store.dim))[rows:]
+                assignment = np.concatenate([assignment, assign(tail, centroids)])
+            # Lists first: a reader only regroups rows when it sees the new centroids
+            assignment.tofile(store.lists_path + ".tmp")
+            os.replace(store.lists_path + ".tmp", store.lists_path)
+            with open(store.centroids_path + ".tmp", "wb") as f:
+                np.save(f, centroids.astype(np.float32))
+            os.replace(store.centroids_path + ".tmp", store.centroids_path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return len(centroids)
+
+
+# ==== CLI ====
+def main():
+    from app import settings
+
+    parser = argparse.ArgumentParser(description="Manage the prediction embedding index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_cmd = sub.add_parser("train", help="fit IVF centroids so searches only scan a few lists")
+    train_cmd.add_argument("version", help="model version whose store to index")
+    train_cmd.add_argument("--lists", type=int, default=0, help="IVF lists (default: sqrt(rows))")
+    train_cmd.add_argument("--sample", type=int, default=100_000, help="vectors used to fit the centroids")
+    train_cmd.add_argument("--iterations", type=int, default=10)
+    stats_cmd = sub.add_parser("stats", help="rows, dimensions and index state of a store")
+    stats_cmd.add_argument("version")
+    parser.add_argument("--root", default=settings.EMBEDDINGS_DIR)
+    args = parser.parse_args()
+
+    store = EmbeddingStore(os.path.join(args.root, args.version))
+    if args.command == "train":
+        lists = train(store, args.lists or None, args.sample, args.iterations)
+        print(f"Indexed {len(store)} vectors into {lists} lists")
+    else:
+        print(json.dumps(store.stats(), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# ==== Dynamic Micro-Batching Inference Engine ====
+# Concurrent /predict calls are queued and grouped into one batch per forward
+# pass. A batch is closed when it reaches MAX_BATCH_SIZE images or when the
+# oldest image has waited MAX_WAIT_MS, whichever comes first. The forward pass
+# runs on a dedicated worker thread so the event loop keeps serving requests.
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+import torch.nn.functional as F
+
+from app.backends import forward_with_features
+from app.metrics import BATCH_SIZE, observe_stage
+
+
+class InferenceEngine:
+    def __init__(self, model, index_to_class, max_batch_size=8, max_wait_ms=10.0,
+                 max_queue_size=256, device=None, model_version=None, top_k=3):
+        # Swapped as one tuple so a batch never mixes one model with another's class map
+        self._active = (model, index_to_class, model_version)
+        # Extra (model, version) pairs sharing the class map, run only for ensemble requests
+        self._ensemble = ()
+        self._per_image_ms = None   # EWMA of forward time per image, for latency estimates
+        self.temperatures = {}      # model version -> fitted softmax temperature (see app/calibration.py)
+        self.top_k = top_k
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue_size = max_queue_size
+        self.device = device or torch.device("cpu")
+        self._queue = None
+        self._worker = None
+        # One thread: torch already parallelises a single forward pass internally
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "batched_images": 0,
+            "max_batch_size_seen": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "forward_ms_total": 0.0,
+            "forward_ms_max": 0.0,
+            "errors": 0,
+        }
+
+    # ---- Lifecycle ----
+    async def start(self):
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._batch_loop())
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        # Fail anything still waiting so callers don't hang
+        while not self._queue.empty():
+            _, future, _, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Inference engine stopped"))
+        self._executor.shutdown(wait=False)
+
+    # ---- Model ----
+    @property
+    def model_version(self):
+        return self._active[2]
+
+    @property
+    def index_to_class(self):
+        return self._active[1]
+
+    def swap_model(self, model, index_to_class, model_version):
+        """Atomically replace the serving model; batches already running finish on the old one."""
+        previous = self._active
+        self._active = (model, index_to_class, model_version)
+        return previous
+
+    def set_ensemble(self, members):
+        """[(model, version)] run after the active model on requests made with mode="ensemble"."""
+        self._ensemble = tuple(members)
+
+    @property
+    def ensemble_versions(self):
+        return [version for _, version in self._ensemble]
+
+    def estimate_ms(self, images):
+        """Rough time until `images` more images would be through the model, given the current queue."""
+        if self._per_image_ms is None:
+            return 0.0
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return (queued + images) * self._per_image_ms
+
+    # ---- Public API ----
+    async def predict(self, tensor, mode=None):
+        """Queue one preprocessed (C, H, W) tensor and wait for its result.
+
+        mode=None returns the described result (top-k, entropy, calibrated
+        confidence) and "embed" the same plus the pooled feature vector under
+        "embedding" (None if the backend can't expose it); "probs" returns the
+        softmax and calibrated softmax vectors and "ensemble" one such pair per
+        model (active model first).
+        """
+        if self._worker is None:
+            raise RuntimeError("Inference engine is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._stats["requests"] += 1
+        await self._queue.put((tensor, future, time.perf_counter(), mode))
+        return await future
+
+    def metrics(self):
+        stats = dict(self._stats)
+        batches = stats["batches"] or 1
+        stats["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        stats["avg_batch_size"] = round(stats["batched_images"] / batches, 3)
+        stats["avg_wait_ms"] = round(stats["wait_ms_total"] / max(stats["batched_images"], 1), 3)
+        stats["avg_forward_ms"] = round(stats["forward_ms_total"] / batches, 3)
+        stats["max_batch_size"] = self.max_batch_size
+        stats["max_wait_ms"] = self.max_wait * 1000.0
+        stats["model_version"] = self.model_version
+        return stats
+
+    # ---- Batching ----
+    async def _collect_batch(self):
+        batch = [await self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Still drain whatever is already queued without waiting
+                if self._queue.empty():
+                    break
+                batch.append(self._queue.get_nowait())
+                continue
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            started = time.perf_counter()
+            tensors = [item[0] for item in batch]
+            modes = [item[3] for item in batch]
+            try:
+                results, forward_ms, postprocess_ms = await loop.run_in_executor(
+                    self._executor, self._forward, tensors, modes)
+            except Exception as e:
+                self._stats["errors"] += 1
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self._record(batch, started, forward_ms, postprocess_ms)
+            for (_, future, _, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _record(self, batch, started, forward_ms, postprocess_ms):
+        BATCH_SIZE.observe(len(batch))
+        observe_stage("forward", forward_ms / 1000.0)
+        observe_stage("softmax_loss", postprocess_ms / 1000.0)
+        stats = self._stats
+        stats["batches"] += 1
+        stats["batched_images"] += len(batch)
+        stats["max_batch_size_seen"] = max(stats["max_batch_size_seen"], len(batch))
+        for _, _, enqueued, _ in batch:
+            wait_ms = (started - enqueued) * 1000.0
+            observe_stage("queue_wait", wait_ms / 1000.0)
+            stats["wait_ms_total"] += wait_ms
+            stats["wait_ms_max"] = max(stats["wait_ms_max"], wait_ms)
+        per_image = forward_ms / len(batch)
+        self._per_image_ms = per_image if self._per_image_ms is None else 0.8 * self._per_image_ms + 0.2 * per_image
+        stats["forward_ms_total"] += forward_ms
+        stats["forward_ms_max"] = max(stats["forward_ms_max"], forward_ms)
+
+    # ---- Worker thread ----
+    def _forward(self, tensors, modes):
+        started = time.perf_counter()
+        model, index_to_class, model_version = self._active
+        ensemble = self._ensemble
+        inputs = torch.stack(tensors).to(self.device)
+        features = None
+        with torch.inference_mode():
+            if "embed" in modes:
+                # Same pass, split at the pooling layer so the pre-classifier features come out too
+                outputs, features = forward_with_features(model, inputs)
+            else:
+                outputs = model(inputs)
+            outputs = outputs.float()
+            # Ensemble members only see the rows that asked for them, on the same input tensor
+            ensemble_rows = [i for i, mode in enumerate(modes) if mode == "ensemble"]
+            ensemble_position = {row: i for i, row in enumerate(ensemble_rows)}
+            member_outputs = []
+            if ensemble_rows and ensemble:
+                subset = inputs[ensemble_rows]
+                member_outputs = [(member(subset).float(), version) for member, version in ensemble]
+            forwarded = time.perf_counter()
+            # Everything below comes from the logits already in memory: no second pass, no loss module
+            probabilities, calibrated = self._softmax(outputs, model_version)
+            described = describe(probabilities, calibrated, index_to_class, self.top_k)
+            members_by_model = [self._softmax(logits, version) + (version,) for logits, version in member_outputs]
+        probabilities, calibrated = probabilities.cpu(), calibrated.cpu()
+        members_by_model = [(p.cpu(), c.cpu(), version) for p, c, version in members_by_model]
+        if features is not None:
+            features = features.float().cpu()
+        results = []
+        for row, mode in enumerate(modes):
+            if mode is None:
+                results.append(dict(described[row], model_version=model_version))
+                continue
+            if mode == "embed":
+                embedding = features[row] if features is not None else None
+                results.append(dict(described[row], model_version=model_version, embedding=embedding))
+                continue
+            members = [(probabilities[row], calibrated[row], model_version)]
+            if mode == "ensemble":
+                position = ensemble_position[row]
+                members += [(p[position], c[position], version) for p, c, version in members_by_model]
+            results.append({"probabilities": members, "index_to_class": index_to_class})
+        finished = time.perf_counter()
+        return results, (forwarded - started) * 1000.0, (finished - forwarded) * 1000.0
+
+    def _softmax(self, logits, version):
+        """(softmax, temperature-scaled softmax) for one model's logits."""
+        probabilities = F.softmax(logits, dim=1)
+        temperature = self.temperatures.get(version, 1.0)
+        if temperature == 1.0:
+            return probabilities, probabilities
+        return probabilities, F.softmax(logits / temperature, dim=1)
+
+
+def describe(probabilities, calibrated, index_to_class, top_k=3):
+    """Result fields for every row of an (N, C) softmax and its calibrated counterpart."""
+    top_p, top_i = probabilities.topk(min(top_k, probabilities.shape[1]), dim=1)
+    calibrated_confidence = calibrated.gather(1, top_i[:, :1]).squeeze(1)
+    # entr() is -p * log(p) with 0 for p == 0, so saturated rows don't turn into NaN
+    entropy = torch.special.entr(probabilities).sum(dim=1)
+    rows = []
+    for ps, indices, ent, cal in zip(top_p.tolist(), top_i.tolist(), entropy.tolist(), calibrated_confidence.tolist()):
+        rows.append({
+            "prediction": index_to_class[indices[0]],
+            "confidence": round(ps[0] * 100, 2),
+            # Cross-entropy against the predicted class, i.e. -log(max probability)
+            "loss": -math.log(max(ps[0], 1e-12)),
+            "calibrated_confidence": round(cal * 100, 2),
+            "entropy": round(ent, 4),
+            "top_k": [{"prediction": index_to_class[i], "probability": round(p * 100, 2)} for p, i in zip(ps, indices)],
+        })
+    return rows
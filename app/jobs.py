@@ -0,0 +1,187 @@
+# ==== Background Report Jobs ====
+# /predict can enqueue a PDF report instead of the browser re-uploading the
+# image to /generate_report. Jobs live in the report_jobs table (so queued work
+# survives a restart) and are rendered by a few asyncio workers on the CPU
+# pool. Finished PDFs go to a size-capped artifact directory with TTL eviction.
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from report.pdf_generator import render_pdf_report
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, EXPIRED = "queued", "running", "done", "failed", "expired"
+
+
+class ArtifactStore:
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, ttl_seconds=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.pdf")
+
+    def put(self, job_id, data):
+        tmp_path = self._path(job_id) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(job_id))
+
+    def get(self, job_id):
+        path = self._path(job_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def sweep(self):
+        """Delete expired artifacts, then the oldest ones until under max_bytes. Returns evicted job ids."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pdf"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[:-4], path))
+        entries.sort()
+        now = time.time()
+        total = sum(size for _, size, _, _ in entries)
+        evicted = []
+        for mtime, size, job_id, path in entries:
+            if now - mtime <= self.ttl_seconds and total <= self.max_bytes:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted.append(job_id)
+        return evicted
+
+
+class ReportJobQueue:
+    def __init__(self, pool, cpu_pool, store, workers=2, sweep_interval=60.0):
+        self.pool = pool
+        self.cpu_pool = cpu_pool
+        self.store = store
+        self.workers = workers
+        self.sweep_interval = sweep_interval
+        self._queue = None
+        self._tasks = []
+
+    # ---- Lifecycle ----
+    async def start(self):
+        self._queue = asyncio.Queue()
+        # Anything queued or interrupted mid-render before a restart is picked up again
+        pending = await asyncio.to_thread(self._requeue_unfinished)
+        for job_id in pending:
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---- Public API ----
+    async def submit(self, email, prediction, confidence, timestamp, thumbnail):
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self._insert, job_id, email, prediction, confidence, timestamp, thumbnail)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    def status(self, job_id):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT id, email, status, prediction, confidence, error, created, finished FROM report_jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("job_id", "email", "status", "prediction", "confidence", "error", "created", "finished")
+        return dict(zip(keys, row))
+
+    def artifact(self, job_id):
+        return self.store.get(job_id)
+
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # ---- Workers ----
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = await asyncio.to_thread(self._claim, job_id)
+            if job is None:
+                continue
+            prediction, confidence, timestamp, thumbnail = job
+            try:
+                pdf_bytes = await self.cpu_pool.run("pdf_render", render_pdf_report,
+                                                    prediction, thumbnail, timestamp, confidence or 0.0)
+                await asyncio.to_thread(self.store.put, job_id, pdf_bytes)
+                await asyncio.to_thread(self._finish, job_id, DONE, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Report job %s failed", job_id)
+                await asyncio.to_thread(self._finish, job_id, FAILED, str(e))
+
+    async def _sweeper(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                evicted = await asyncio.to_thread(self.store.sweep)
+                if evicted:
+                    await asyncio.to_thread(self._expire, evicted)
+            except Exception:
+                logger.exception("Report artifact sweep failed")
+
+    # ---- SQL ----
+    def _insert(self, job_id, email, prediction, confidence, timestamp, thumbnail):
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "INSERT INTO report_jobs (id, email, status, prediction, confidence, timestamp, thumbnail, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, email, QUEUED, prediction, confidence, timestamp, thumbnail, time.time()),
+            )
+
+    def _claim(self, job_id):
+        with self.pool.transaction() as conn:
+            row = conn.execute(
+                "SELECT prediction, confidence, timestamp, thumbnail FROM report_jobs WHERE id = ? AND status IN (?, ?)",
+                (job_id, QUEUED, RUNNING),
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE report_jobs SET status = ? WHERE id = ?", (RUNNING, job_id))
+        return row
+
+    def _finish(self, job_id, status, error):
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "UPDATE report_jobs SET status = ?, error = ?, finished = ?, thumbnail = NULL WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def _expire(self, job_ids):
+        with self.pool.transaction() as conn:
+            conn.executemany("UPDATE report_jobs SET status = ? WHERE id = ?", [(EXPIRED, j) for j in job_ids])
+
+    def _requeue_unfinished(self):
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT id FROM report_jobs WHERE status IN (?, ?) ORDER BY created", (QUEUED, RUNNING)
+            ).fetchall()
+        return [row[0] for row in rows]
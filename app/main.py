@@ -1,87 +1,366 @@
 # ==== FastAPI App ====
 
 # ==== Imports (move all to top) ====
-import io
 import json
+import asyncio
+import zipfile
+from typing import List
 import torch
-import timm
-from torch import nn
-from torchvision import transforms
-from PIL import Image
 from fastapi import FastAPI, File, UploadFile, Form, Request
-from fastapi.responses import JSONResponse, FileResponse, RedirectResponse, Response
+from fastapi.responses import JSONResponse, FileResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from datetime import datetime
 import os
-import sqlite3
-from report.pdf_generator import generate_pdf_report
-import re
+import logging
+from report.pdf_generator import get_report_engine, pdf_response, render_pdf_report
+import time
+from app import settings
+from app.inference import InferenceEngine
+from app.cache import PredictionCache, image_key
+from app.calibration import load_temperature
+from app.embeddings import EmbeddingStore, pack, unpack
+from app.backends import load_model
+from app.preprocessing import (IMAGE_SIZE, ImageRejected, check_size, preprocess_timed, probe_image,
+                               upload_thumbnail)
+from app.workers import AdmissionGate, Overloaded, StagePool
+from app.db import Repository, decode_cursor, encode_cursor
+from app.jobs import DONE, ArtifactStore, ReportJobQueue
+from app.assist import AssistIndex
+from app.assets import PageCache, StaticAssets
+from app.auth import SessionStore, hash_password, load_secret, needs_rehash, verify_password
+from app.registry import ModelManager, ModelRegistry
+from app.tta import combine, tta_views, view_budget
+from app.uploads import UploadLimit
+from app import logs, metrics
+from app.metrics import observe_stage
+
+logs.configure(settings.LOG_LEVEL, settings.LOG_JSON)
+logger = logging.getLogger("app.main")
 
 app = FastAPI()
 
+# ==== Upload Limits ====
+# Bodies over the cap get a 413 while streaming, before they are spooled (see app/uploads.py)
+FORM_OVERHEAD_BYTES = 64 * 1024  # multipart boundaries and the small form fields
+app.add_middleware(UploadLimit, measure_memory=settings.MEASURE_PEAK_MEMORY, limits={
+    "/predict": settings.MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES,
+    "/generate_report": settings.MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES,
+    "/api/reports": settings.MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES,
+    "/predict/batch": settings.MAX_BATCH_UPLOAD_BYTES,
+})
+
 # ==== Helper ==== 
+def current_user(request: Request):
+    """Email of the signed-in user from the session cookie, or None (resolved once per request)."""
+    if not hasattr(request.state, "user"):
+        request.state.user = sessions.get(request.cookies.get(settings.SESSION_COOKIE))
+    return request.state.user
+
+async def current_user_async(request: Request):
+    """current_user for async routes: only a session-cache miss touches the database, on the DB pool."""
+    if not hasattr(request.state, "user"):
+        token = request.cookies.get(settings.SESSION_COOKIE)
+        resolved, email = sessions.cached(token)
+        request.state.user = email if resolved else await db_pool.run("session", sessions.get, token)
+    return request.state.user
+
 def is_logged_in(request: Request):
-    return request.cookies.get("logged_in") == "true"
+    return current_user(request) is not None
+
+def page(request: Request, name: str):
+    """A built page from memory (precompressed, ETag/304), or the source file when there is no build."""
+    built = pages.respond(name, request.headers)
+    if built is None:
+        return FileResponse(pages.source_path(name))
+    status, headers, body = built
+    return Response(content=body, status_code=status, headers=headers)
 
 # ==== Mount Static Folder ====
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+# Hashed, precompressed build output first (see app/assets.py); the raw folder serves anything not built
+pages = PageCache(settings.STATIC_DIST_DIR, settings.STATIC_DIR)
+app.mount("/static/dist", StaticAssets(settings.STATIC_DIST_DIR), name="static_dist")
+app.mount("/static", StaticFiles(directory=settings.STATIC_DIR), name="static")
 
 # ==== Database Setup ====
-DB_PATH = "users.db"
-if not os.path.exists(DB_PATH):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT UNIQUE,
-        password TEXT
-    )
-    """)
-    conn.commit()
-    conn.close()
-    print("✅ Users database created.")
-# ==== Prediction History Table ====
-def create_history_table():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT,
-        prediction TEXT,
-        confidence REAL,
-        loss REAL,
-        timestamp TEXT
-    )
-    """)
-    conn.commit()
-    conn.close()
-create_history_table()
-
-# ==== Load Class Indices ====
-with open("model/class_indices.json", "r") as f:
-    class_indices = json.load(f)
-index_to_class = {int(k): v for k, v in class_indices.items()}
-
-# ==== Load Model ====
-model_path = "model/model.pth"
+# Pooled WAL connections; the schema is migrated automatically (see app/db.py)
+DB_PATH = settings.DB_PATH
+repo = Repository(DB_PATH, pool_size=settings.DB_POOL_SIZE)
+
+@app.on_event("startup")
+def start_repository():
+    repo.start()
+
+@app.on_event("shutdown")
+def stop_repository():
+    repo.close()  # flushes the write-behind history queue
+
+# ==== Sessions ====
+# Signed session cookies resolved through an LRU in front of the sessions table (see app/auth.py)
+sessions = SessionStore(repo, settings.SESSION_SECRET.encode() or load_secret(settings.SESSION_SECRET_PATH),
+                        ttl_seconds=settings.SESSION_TTL, max_entries=settings.SESSION_CACHE_SIZE,
+                        recheck_seconds=settings.SESSION_RECHECK_SECONDS)
+PASSWORD_COST = (settings.PASSWORD_SCRYPT_N, settings.PASSWORD_SCRYPT_R, settings.PASSWORD_SCRYPT_P)
+# Verified against when the email is unknown, so a miss costs as much as a wrong password.
+# Hashed on the CPU pool at the first such login, not at import (scrypt would hold up cold start).
+dummy_password = {"hash": None}
+
+async def dummy_password_hash():
+    if dummy_password["hash"] is None:
+        dummy_password["hash"] = await cpu_pool.run("password_hash", hash_password, "", *PASSWORD_COST)
+    return dummy_password["hash"]
+
+@app.on_event("startup")
+async def start_sessions():
+    await sessions.start(settings.SESSION_SWEEP_INTERVAL)
+
+@app.on_event("shutdown")
+async def stop_sessions():
+    await sessions.stop()
+
+# ==== Model Registry ====
+# Versioned models under settings.MODEL_REGISTRY_DIR (see app/registry.py)
+registry = ModelRegistry(settings.MODEL_REGISTRY_DIR)
+if registry.active_version() is None:
+    bootstrapped = registry.register(settings.MODEL_PATH, settings.CLASS_INDICES_PATH, note="bootstrapped from MODEL_PATH")
+    logger.info("Registered %s as model version %s", settings.MODEL_PATH, bootstrapped)
+
+# ==== Torch Threads ====
+# One intra-op pool per process sized to its share of the cores, so N workers don't oversubscribe the CPU
+torch.set_num_threads(settings.TORCH_THREADS)
+if settings.WORKERS > 1:
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # can only be set before the first parallel op in this process
+
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = timm.create_model("tf_efficientnetv2_b3", pretrained=False, num_classes=len(index_to_class))
-model.load_state_dict(torch.load(model_path, map_location=device))
-model.eval()
-
-# ==== Transform ====
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],
-                         [0.229, 0.224, 0.225])
-])
+if settings.MODEL_BACKEND not in ("eager", "auto"):
+    device = torch.device("cpu")  # exported backends target CPU serving
+
+def load_version(version):
+    """(model, index_to_class, artifact_path) for a registry version."""
+    model_path, class_indices_path = registry.paths(version)
+    with open(class_indices_path, "r") as f:
+        class_indices = json.load(f)
+    index_to_class = {int(k): v for k, v in class_indices.items()}
+    model, artifact = load_model(settings.MODEL_BACKEND, settings.MODEL_NAME, len(index_to_class), model_path, device,
+                                 mmap=settings.MMAP_WEIGHTS)
+    # Fitted by calibrate.py; registered before the swap so the first batch is already calibrated
+    engine.temperatures[version] = load_temperature(model_path)
+    return model, index_to_class, artifact
+
+def warm_up(model):
+    """Run the batch sizes the engine will use so the first real requests don't pay for lazy init."""
+    with torch.inference_mode():
+        for batch_size in sorted({1, settings.MAX_BATCH_SIZE}):
+            model(torch.zeros(batch_size, 3, IMAGE_SIZE, IMAGE_SIZE, device=device))
+
+# ==== Inference Engine ====
+# Starts without a model; the active version is loaded and swapped in by warm_up_service()
+active_version = registry.active_version()
+engine = InferenceEngine(None, None,
+                         max_batch_size=settings.MAX_BATCH_SIZE,
+                         max_wait_ms=settings.MAX_WAIT_MS,
+                         max_queue_size=settings.MAX_QUEUE_SIZE,
+                         device=device,
+                         top_k=settings.TOP_K)
+
+@app.on_event("startup")
+async def start_engine():
+    await engine.start()
+
+@app.on_event("shutdown")
+async def stop_engine():
+    await engine.stop()
+
+# ==== Prediction Cache ====
+# Registry versions are immutable, so the version name alone identifies the weights
+prediction_cache = None
+if settings.CACHE_MAX_MB > 0:
+    prediction_cache = PredictionCache(active_version,
+                                       max_bytes=int(settings.CACHE_MAX_MB * 1024 * 1024),
+                                       disk_path=settings.CACHE_DB_PATH or None)
+
+# ==== Hot Reload ====
+def on_model_swap(version, artifact):
+    if prediction_cache is not None:
+        prediction_cache.watch_path = artifact
+        prediction_cache.set_model_version(version)
+
+model_manager = ModelManager(registry, engine, load_version, warmup_fn=warm_up, on_swap=on_model_swap,
+                             watch_interval=settings.MODEL_WATCH_INTERVAL)
+
+@app.on_event("shutdown")
+async def stop_model_manager():
+    await model_manager.stop_watching()
+
+# ==== Worker Pools & Backpressure ====
+cpu_pool = StagePool("cpu", settings.CPU_WORKERS, kind=settings.CPU_POOL_KIND)
+db_pool = StagePool("db", settings.DB_WORKERS)
+admission = AdmissionGate(settings.MAX_PENDING_REQUESTS, retry_after=settings.RETRY_AFTER_SECONDS)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(content={"error": str(exc)}, status_code=503,
+                        headers={"Retry-After": str(exc.retry_after)})
+
+@app.on_event("shutdown")
+def stop_pools():
+    cpu_pool.shutdown()
+    db_pool.shutdown()
+
+# ==== Prediction Pipeline ====
+CACHED_EMBEDDING = "embedding_f16"  # packed feature vector stored next to a cached result
+
+def pool_source(source):
+    """What to hand the CPU pool: the spooled upload file itself, or its bytes when the pool is a process pool."""
+    if cpu_pool.kind == "process" and not isinstance(source, (bytes, bytearray)):
+        source.seek(0)
+        return source.read()
+    return source
+
+async def run_prediction(image_bytes, with_thumbnail=False, embed=False):
+    """Cache lookup, then decode on the CPU pool and predict through the batching engine.
+
+    image_bytes may be bytes or the upload's spooled file, which is hashed and decoded in place.
+    Returns (result, thumbnail); the JPEG thumbnail for reports comes from the same decode when requested.
+    With embed=True result["embedding"] holds the pooled feature vector, which is cached with the result.
+    """
+    if not startup_state["ready"]:
+        raise Overloaded(settings.RETRY_AFTER_SECONDS, "Model is still warming up, please retry shortly.")
+    check_size(image_bytes, settings.MAX_UPLOAD_BYTES)
+    image_bytes = pool_source(image_bytes)
+    digest = None
+    cached = None
+    if prediction_cache is not None:
+        # Reading a spooled file may touch disk, so it is hashed on the I/O pool
+        digest = await db_pool.run("image_key", image_key, image_bytes)
+        if settings.CACHE_DB_PATH:
+            cached = await db_pool.run("cache_lookup", prediction_cache.get, digest)
+        else:
+            cached = prediction_cache.get(digest)
+        # Entries cached by a request that didn't embed (e.g. anonymous) have no features to reuse
+        if cached is not None and embed and CACHED_EMBEDDING not in cached:
+            cached = None
+    if cached is not None:
+        packed = cached.pop(CACHED_EMBEDDING, None)
+        if embed:
+            cached["embedding"] = unpack(packed) if packed else None
+        if not with_thumbnail:
+            return cached, None
+    # JPEG draft decoding + LUT normalization, see app/preprocessing.py
+    tensor, thumbnail, timings = await cpu_pool.run("image", preprocess_timed, image_bytes, with_thumbnail,
+                                                    max_bytes=settings.MAX_UPLOAD_BYTES)
+    for stage, seconds in timings.items():
+        observe_stage(stage, seconds)
+    if cached is not None:
+        return cached, thumbnail
+    result = await engine.predict(tensor, "embed" if embed else None)
+    embedding = result.pop("embedding", None)
+    if prediction_cache is not None:
+        # An embed request stores its features too (None when the backend has none), so repeats skip the model
+        entry = dict(result, **{CACHED_EMBEDDING: pack(embedding) if embedding is not None else ""}) if embed else result
+        await db_pool.run("cache_store", prediction_cache.put, digest, entry)
+    if embed:
+        result["embedding"] = embedding
+    return result, thumbnail
+
+async def run_tta_prediction(image_bytes, views, ensemble=False, with_thumbnail=False):
+    """Flip/crop views of one decode, batched through the engine and averaged (see app/tta.py)."""
+    if not startup_state["ready"]:
+        raise Overloaded(settings.RETRY_AFTER_SECONDS, "Model is still warming up, please retry shortly.")
+    members = 1 + (len(engine.ensemble_versions) if ensemble else 0)
+    count = view_budget(engine, views, members, settings.TTA_LATENCY_BUDGET_MS)
+    names, tensors, thumbnail, timings = await cpu_pool.run("image", tta_views, pool_source(image_bytes), count,
+                                                            with_thumbnail, max_bytes=settings.MAX_UPLOAD_BYTES)
+    for stage, seconds in timings.items():
+        observe_stage(stage, seconds)
+    mode = "ensemble" if ensemble else "probs"
+    results = await asyncio.gather(*(engine.predict(tensor, mode) for tensor in tensors))
+    result = combine(names, results, settings.TOP_K)
+    result["tta"]["requested_views"] = views
+    return result, thumbnail
+
+# ==== Ensemble ====
+async def load_ensemble():
+    """Load settings.ENSEMBLE_VERSIONS next to the active model; members must share its class map."""
+    members = []
+    for version in settings.ENSEMBLE_VERSIONS:
+        try:
+            model, index_to_class, _ = await asyncio.to_thread(load_version, version)
+        except Exception:
+            logger.exception("Skipping ensemble member %s", version)
+            continue
+        if index_to_class != engine.index_to_class:
+            logger.warning("Skipping ensemble member %s: its classes differ from the active model", version)
+            continue
+        await asyncio.to_thread(warm_up, model)
+        members.append((model, version))
+    engine.set_ensemble(members)
+    if members:
+        logger.info("Ensemble members: %s", ", ".join(version for _, version in members))
+
+# ==== Startup & Readiness ====
+# Importing this module only reads the registry manifest. The model is loaded,
+# warmed up and swapped into the engine in the background once the server is
+# accepting connections; /api/ready answers 503 until that has finished, so a
+# load balancer only routes traffic to warm workers.
+startup_state = {"ready": False, "error": None, "started": time.perf_counter(), "ready_after_s": None}
+warmup_task = None
+
+async def warm_up_service():
+    try:
+        await model_manager.load(active_version)
+    except Exception as e:
+        startup_state["error"] = str(e)
+        logger.exception("Failed to load model version %s", active_version)
+        return
+    await load_ensemble()
+    startup_state["ready"] = True
+    startup_state["ready_after_s"] = round(time.perf_counter() - startup_state["started"], 3)
+    logger.info("Ready after %.3f s", startup_state["ready_after_s"])
+    model_manager.start_watching()
+    # Chart, QR codes and class info are rendered once, off the event loop, after
+    # the model: they are only needed once someone asks for a PDF
+    await cpu_pool.run("report_assets", get_report_engine)
+
+@app.on_event("startup")
+async def start_warm_up():
+    global warmup_task
+    warmup_task = asyncio.create_task(warm_up_service())
+
+@app.on_event("shutdown")
+async def stop_warm_up():
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+
+@app.get("/api/ready")
+def readiness():
+    status = {"ready": startup_state["ready"], "model_version": engine.model_version,
+              "ready_after_s": startup_state["ready_after_s"], "error": startup_state["error"]}
+    return JSONResponse(content=status, status_code=200 if startup_state["ready"] else 503)
+
+# ==== Report Jobs ====
+report_jobs = ReportJobQueue(repo.pool, cpu_pool,
+                             ArtifactStore(settings.REPORT_ARTIFACT_DIR,
+                                           max_bytes=int(settings.REPORT_ARTIFACT_MAX_MB * 1024 * 1024),
+                                           ttl_seconds=settings.REPORT_ARTIFACT_TTL),
+                             workers=settings.REPORT_WORKERS)
+
+@app.on_event("startup")
+async def start_report_jobs():
+    await report_jobs.start()
+
+@app.on_event("shutdown")
+async def stop_report_jobs():
+    await report_jobs.stop()
 
 # Load disease info JSON once
 with open("report/disease_info.json", "r", encoding="utf-8") as f:
     DISEASE_INFO = json.load(f)
+# Search index for /api/aiassist, built once (see app/assist.py)
+ASSIST_INDEX = AssistIndex(DISEASE_INFO)
 
 # ==== Routes ====
 # Prediction graph page route
@@ -89,170 +368,517 @@ with open("report/disease_info.json", "r", encoding="utf-8") as f:
 def prediction_graph_page(request: Request):
     if not is_logged_in(request):
         return RedirectResponse(url="/login")
-    return FileResponse("app/static/prediction_graph.html")
+    return page(request, "prediction_graph.html")
 @app.get("/about")
 def about(request: Request):
     if not is_logged_in(request):
         return RedirectResponse(url="/login")
-    return FileResponse("app/static/about.html")
+    return page(request, "about.html")
 
 @app.get("/services")
 def services(request: Request):
     if not is_logged_in(request):
         return RedirectResponse(url="/login")
-    return FileResponse("app/static/services.html")
+    return page(request, "services.html")
 
 @app.get("/aiassist")
 def aiassist(request: Request):
     if not is_logged_in(request):
         return RedirectResponse(url="/login")
-    return FileResponse("app/static/aiassist.html")
+    return page(request, "aiassist.html")
 
 @app.get("/")
 def root(request: Request):
     if not is_logged_in(request):
-        return FileResponse("app/static/login.html")
-    return FileResponse("app/static/index.html")
+        return page(request, "login.html")
+    return page(request, "index.html")
 
 @app.get("/login")
-def login_page():
-    return FileResponse("app/static/login.html")
+def login_page(request: Request):
+    return page(request, "login.html")
 
 @app.get("/history")
 def history_page(request: Request):
     if not is_logged_in(request):
         return RedirectResponse(url="/login")
-    return FileResponse("app/static/history.html")
+    return page(request, "history.html")
 
 @app.get("/api/history")
-def api_history(request: Request):
-    print("[DEBUG] /api/history endpoint called")
+def api_history(request: Request, limit: int = 100, cursor: str = None, review: bool = False):
+    if not is_logged_in(request):
+        return JSONResponse(content={"error": "Not logged in."}, status_code=401)
+    email = current_user(request)
+    # Keyset pagination: pass back next_cursor to get the following page
+    limit = max(1, min(limit, settings.HISTORY_MAX_PAGE_SIZE))
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    # review=true pages through just the low-confidence rows flagged by /predict
+    rows = repo.list_history(email, limit=limit, after=after, review_only=review)
+    logger.debug("history page: %d rows", len(rows), extra={"email": email})
+    next_cursor = encode_cursor(rows[-1][3], rows[-1][0]) if len(rows) == limit else None
+    return JSONResponse(content={
+        "history": [[prediction, confidence, timestamp, bool(needs_review)]
+                    for _, prediction, confidence, timestamp, needs_review in rows],
+        "next_cursor": next_cursor,
+    })
+
+@app.get("/api/history/stats")
+def api_history_stats(request: Request):
     if not is_logged_in(request):
-        print("[DEBUG] Not logged in, redirecting to /login")
         return JSONResponse(content={"error": "Not logged in."}, status_code=401)
-    email = request.cookies.get("email")
-    print(f"[DEBUG] Email from cookie: {email}")
+    email = current_user(request)
+    # Read from the history_daily rollup, maintained by triggers on every insert/delete
+    classes, daily = repo.history_stats(email)
+    return JSONResponse(content={
+        "total": sum(count for _, count in classes),
+        "classes": [{"prediction": prediction, "count": count} for prediction, count in classes],
+        "daily": [{
+            "day": day,
+            "count": count,
+            "mean_confidence": round(mean_confidence, 2) if mean_confidence is not None else None,
+            "mean_loss": round(mean_loss, 4) if mean_loss is not None else None,
+        } for day, count, mean_confidence, mean_loss in daily],
+    })
+
+@app.get("/api/similar")
+def api_similar(request: Request, embedding_row: int, k: int = 0, version: str = None):
+    """Past cases closest to a stored prediction (embedding_row comes from the /predict response)."""
+    email = current_user(request)
     if not email:
-        print("[DEBUG] No email found in cookie")
-        return JSONResponse(content={"error": "User not found."}, status_code=401)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT prediction, confidence, timestamp FROM history WHERE email = ? ORDER BY timestamp DESC", (email,))
-    rows = cursor.fetchall()
-    conn.close()
-    print(f"[DEBUG] History rows for user '{email}': {rows}")
-    return JSONResponse(content={"history": rows})
+        return JSONResponse(content={"error": "Not logged in."}, status_code=401)
+    version = version or engine.model_version
+    if not version or not os.path.isdir(os.path.join(settings.EMBEDDINGS_DIR, version)):
+        return JSONResponse(content={"error": f"No embeddings for model version '{version}'."}, status_code=404)
+    k = max(1, min(k or settings.SIMILAR_K, settings.HISTORY_MAX_PAGE_SIZE))
+    started = time.perf_counter()
+    # Only the caller's own cases, as a query and as results
+    if embedding_row not in repo.similar_cases(email, version, [embedding_row]):
+        return JSONResponse(content={"error": f"No case {embedding_row} in your history."}, status_code=404)
+    try:
+        vector = embedding_store(version).vector(embedding_row)
+    except KeyError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=404)
+    similar = find_similar(email, version, vector, k, exclude=embedding_row)
+    return JSONResponse(content={"model_version": version, "similar": similar,
+                                 "took_ms": round((time.perf_counter() - started) * 1000.0, 2)})
 
 @app.post("/api/clear_history")
 def clear_history(request: Request):
-    print("[DEBUG] /api/clear_history called")
     if not is_logged_in(request):
-        print("[DEBUG] Not logged in")
         return JSONResponse(content={"error": "Not logged in."}, status_code=401)
-    email = request.cookies.get("email")
-    print(f"[DEBUG] Email from cookie: {email}")
-    if not email:
-        print("[DEBUG] No email found in cookie")
-        return JSONResponse(content={"error": "User not found."}, status_code=401)
+    email = current_user(request)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM history WHERE email = ?", (email,))
-        conn.commit()
-        conn.close()
-        print(f"[DEBUG] Cleared history for user: {email}")
+        repo.clear_history(email)
+        logger.info("Cleared history", extra={"email": email})
         return JSONResponse(content={"success": True})
     except Exception as e:
-        print(f"[ERROR] Failed to clear history: {e}")
+        logger.exception("Failed to clear history", extra={"email": email})
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
 @app.post("/signup")
-def signup(email: str = Form(...), password: str = Form(...)):
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO users (email, password) VALUES (?, ?)", (email, password))
-        conn.commit()
-        conn.close()
-        print(f"✅ New user registered: {email}")
-        return RedirectResponse(url="/login", status_code=303)
-    except sqlite3.IntegrityError:
+async def signup(email: str = Form(...), password: str = Form(...)):
+    # scrypt is deliberately slow, so it runs on the CPU pool rather than the event loop
+    password_hash = await cpu_pool.run("password_hash", hash_password, password, *PASSWORD_COST)
+    if not await db_pool.run("db_user", repo.create_user, email, password_hash):
         return JSONResponse(content={"error": "Email already exists"}, status_code=400)
+    logger.info("New user registered", extra={"email": email})
+    return RedirectResponse(url="/login", status_code=303)
 
 @app.post("/login")
-def login(email: str = Form(...), password: str = Form(...)):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE email = ? AND password = ?", (email, password))
-    user = cursor.fetchone()
-    conn.close()
-    if user:
-        print(f"✅ User logged in: {email}")
-        response = RedirectResponse(url="/", status_code=303)
-        response.set_cookie(key="logged_in", value="true", httponly=True)
-        response.set_cookie(key="email", value=email, httponly=True)
-        return response
-    else:
+async def login(email: str = Form(...), password: str = Form(...)):
+    user = await db_pool.run("db_user", repo.find_user, email)
+    stored = user[2] if user else await dummy_password_hash()
+    verified = await cpu_pool.run("password_verify", verify_password, password, stored)
+    if not (user and verified):
         return JSONResponse(content={"error": "Invalid email or password"}, status_code=401)
+    if needs_rehash(stored, *PASSWORD_COST):
+        # Plaintext rows from before hashing (or an older cost) are upgraded on their first successful login
+        password_hash = await cpu_pool.run("password_hash", hash_password, password, *PASSWORD_COST)
+        await db_pool.run("db_user", repo.update_password, email, password_hash)
+    token = await db_pool.run("session", sessions.create, email)
+    logger.info("User logged in", extra={"email": email})
+    response = RedirectResponse(url="/", status_code=303)
+    response.set_cookie(key=settings.SESSION_COOKIE, value=token, max_age=settings.SESSION_TTL, httponly=True,
+                        secure=settings.SESSION_COOKIE_SECURE, samesite="lax")
+    # Cookies of the old scheme, which trusted the email cookie as-is
+    response.delete_cookie("logged_in")
+    response.delete_cookie("email")
+    return response
+
+@app.post("/logout")
+async def logout(request: Request):
+    await db_pool.run("session", sessions.delete, request.cookies.get(settings.SESSION_COOKIE))
+    response = JSONResponse(content={"success": True})
+    response.delete_cookie(settings.SESSION_COOKIE)
+    return response
+
+# ==== Embedding Index ====
+embedding_stores = {}
+
+def embedding_store(version):
+    """The append-only feature store of one model version, opened on first use."""
+    store = embedding_stores.get(version)
+    if store is None:
+        store = embedding_stores.setdefault(version, EmbeddingStore(os.path.join(settings.EMBEDDINGS_DIR, version),
+                                                                    nprobe=settings.SIMILAR_NPROBE))
+    return store
+
+def find_similar(email, version, vector, k, exclude=None):
+    """`email`'s nearest past cases; only their own rows are searched, so other users' never crowd them out."""
+    cases = repo.own_cases(email, version)
+    if not cases:
+        return []
+    hits = embedding_store(version).search(vector, k, exclude=exclude, rows=cases.keys())
+    return [{"embedding_row": row, "similarity": round(similarity, 4), "prediction": cases[row][0],
+             "confidence": cases[row][1], "timestamp": cases[row][2]} for row, similarity in hits]
+
+def needs_review(result):
+    """Low calibrated confidence: saved to history flagged for a second look."""
+    return result["calibrated_confidence"] < settings.LOW_CONFIDENCE_THRESHOLD
 
 @app.post("/predict")
-async def predict(file: UploadFile = File(...), request: Request = None):
+async def predict(file: UploadFile = File(...), request: Request = None, report: bool = Form(False),
+                  tta: bool = Form(False), views: int = Form(0), ensemble: bool = Form(False),
+                  similar: bool = Form(False)):
+    # Rejected with 503 + Retry-After when too many heavy requests are in flight
+    async with admission:
+        try:
+            # The spooled upload is decoded (and thumbnailed) in place, never copied into bytes
+            image_bytes = file.file
+            email = await current_user_async(request) if request else None
+            # Features come out of the same forward pass; kept for signed-in history and its similar-case lookup
+            embed = settings.EMBEDDINGS_ENABLED and bool(email) and not (tta or ensemble)
+            if tta or ensemble:
+                # Several views (and models) in one batched pass; not cached
+                result, thumbnail = await run_tta_prediction(
+                    image_bytes, (views or settings.TTA_MAX_VIEWS) if tta else 1, ensemble, with_thumbnail=report)
+            else:
+                # Served from the cache or batched with other in-flight requests by the engine
+                result, thumbnail = await run_prediction(image_bytes, with_thumbnail=report, embed=embed)
+            embedding = result.pop("embedding", None)
+            class_name = result["prediction"]
+            confidence_score = result["confidence"]
+            loss = result["loss"]
+            review = needs_review(result)
+
+            # Anonymous uploads and backends without a feature output (ONNX, int8) return no neighbours
+            neighbours, embedding_row = ([] if similar else None), None
+            if embedding is not None:
+                version = result["model_version"]
+                if similar:
+                    # Searched before this upload is added, so it can't match itself
+                    neighbours = await db_pool.run("similar", find_similar, email, version, embedding, settings.SIMILAR_K)
+                if email:
+                    embedding_row = await db_pool.run("embedding_store", embedding_store(version).add, embedding)
+
+            if email:
+                row = (email, class_name, confidence_score, loss, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                       result["model_version"], int(review), embedding_row)
+                # Write-behind: committed in batches off the request path
+                repo.add_history([row])
+            else:
+                logger.debug("Anonymous prediction, not saved to history")
+
+            response = {"prediction": class_name, "confidence": confidence_score, "loss": loss,
+                        "top_k": result["top_k"], "entropy": result["entropy"],
+                        "calibrated_confidence": result["calibrated_confidence"], "needs_review": review,
+                        "model_version": result["model_version"]}
+            if "tta" in result:
+                response["tta"] = result["tta"]
+            if embedding_row is not None:
+                response["embedding_row"] = embedding_row
+            if neighbours is not None:
+                response["similar"] = neighbours
+                # A re-compressed or resized copy of an earlier upload lands almost on top of it
+                response["duplicate"] = bool(neighbours) and neighbours[0]["similarity"] >= settings.DUPLICATE_SIMILARITY
+            if report:
+                # Rendered in the background from the decode above, with the real confidence
+                response["report_job_id"] = await report_jobs.submit(
+                    email, class_name, confidence_score, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), thumbnail)
+            return response
+
+        except Overloaded:
+            raise  # warming up: 503 + Retry-After from overloaded_handler, not a 500
+        except ImageRejected as e:
+            return JSONResponse(content={"error": str(e)}, status_code=400)
+        except Exception as e:
+            logger.exception("Exception in /predict")
+            return JSONResponse(content={"error": str(e)}, status_code=500)
+
+# ==== Batch Prediction ====
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+def read_capped(stream, limit):
+    """Up to `limit` bytes, or None when the stream holds more; judged by bytes read, not declared sizes."""
+    data = stream.read(limit + 1)
+    return data if len(data) <= limit else None
+
+def expand_upload(filename, source):
+    """Yield (name, bytes) for a single spooled image upload or every image inside a zip archive.
+
+    Images over MAX_UPLOAD_BYTES yield None. A zip entry is skipped unread when its declared
+    size is over the limit, and inflation stops at the limit whatever the header claims.
+    """
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if info.file_size > settings.MAX_UPLOAD_BYTES:
+                    yield info.filename, None
+                    continue
+                with archive.open(info) as entry:
+                    yield info.filename, read_capped(entry, settings.MAX_UPLOAD_BYTES)
+    else:
+        source.seek(0)
+        # Read now: the results stream after the handler returns, when the upload may be closed
+        yield filename, read_capped(source, settings.MAX_UPLOAD_BYTES)
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """Releases the admission slot when the response ends, even if its body is never iterated."""
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.release()
+
+async def predict_one(index, name, data):
+    if data is None:
+        return {"index": index, "filename": name, "error": f"Upload too large (max {settings.MAX_UPLOAD_BYTES} bytes)"}
     try:
-        image_bytes = await file.read()
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        image = transform(image).unsqueeze(0)
-
-        with torch.no_grad():
-            outputs = model(image)
-            probabilities = torch.nn.functional.softmax(outputs, dim=1)[0]
-            confidence, predicted_idx = torch.max(probabilities, 0)
-            class_name = index_to_class[predicted_idx.item()]
-            confidence_score = round(confidence.item() * 100, 2)
-            # Example loss calculation (cross-entropy with predicted class)
-            criterion = nn.CrossEntropyLoss()
-            target = torch.tensor([predicted_idx.item()])
-            loss = criterion(outputs, target).item()
-
-        # Debug: print username from cookie
-        email = None
-        if request:
-            email = request.cookies.get("email")
-            print(f"[DEBUG] Email from cookie: {email}")
-        if email:
-            try:
-                conn = sqlite3.connect(DB_PATH)
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO history (email, prediction, confidence, loss, timestamp) VALUES (?, ?, ?, ?, ?)",
-                               (email, class_name, confidence_score, loss, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-                conn.commit()
-                conn.close()
-                print(f"[DEBUG] Saved prediction to history for user: {email}")
-            except Exception as db_exc:
-                print(f"[ERROR] Failed to save history: {db_exc}")
+        result, _ = await run_prediction(data)
+        return {"index": index, "filename": name, **result, "needs_review": needs_review(result)}
+    except Exception as e:
+        return {"index": index, "filename": name, "error": str(e)}
+
+@app.post("/predict/batch")
+async def predict_batch(request: Request, files: List[UploadFile] = File(...)):
+    if not startup_state["ready"]:
+        # Checked up front: once streaming starts, per-image errors can no longer become a 503
+        raise Overloaded(settings.RETRY_AFTER_SECONDS, "Model is still warming up, please retry shortly.")
+    uploads = []
+    inflated = 0
+    for upload in files:
+        try:
+            for name, data in expand_upload(upload.filename, upload.file):
+                uploads.append((name, data))
+                inflated += len(data) if data is not None else 0
+                # Checked per image so an oversized archive stops being inflated at the limit
+                if len(uploads) > settings.MAX_BATCH_FILES:
+                    return JSONResponse(content={"error": f"Too many images (max {settings.MAX_BATCH_FILES})."},
+                                        status_code=413)
+                # Everything is held until the stream starts, so the decompressed total is capped like the body
+                if inflated > settings.MAX_BATCH_UPLOAD_BYTES:
+                    return JSONResponse(content={"error": f"Batch too large: images exceed "
+                                                          f"{settings.MAX_BATCH_UPLOAD_BYTES} bytes uncompressed."},
+                                        status_code=413)
+        except zipfile.BadZipFile as e:
+            return JSONResponse(content={"error": f"{upload.filename}: {e}"}, status_code=400)
+    if not uploads:
+        return JSONResponse(content={"error": "No images found in upload."}, status_code=400)
+
+    email = await current_user_async(request)
+
+    async def stream_results():
+        # Decode in parallel; the engine stacks concurrent images into shared forward passes
+        tasks = [asyncio.create_task(predict_one(i, name, data)) for i, (name, data) in enumerate(uploads)]
+        rows = []
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                if email and "error" not in result:
+                    rows.append((email, result["prediction"], result["confidence"], result["loss"],
+                                 datetime.now().strftime("%Y-%m-%d %H:%M:%S"), result["model_version"],
+                                 int(result["needs_review"]), None))
+                yield json.dumps(result) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            if rows:
+                repo.add_history(rows)
+
+    # One admission slot for the whole batch (503 if none is free), held until the response is done
+    admission.acquire()
+    try:
+        return AdmittedStreamingResponse(stream_results(), media_type="application/x-ndjson")
+    except BaseException:
+        admission.release()
+        raise
+
+# ==== Metrics ====
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route templates (/api/reports/{job_id}) keep the label set bounded
+        route = request.scope.get("route")
+        if route is not None:
+            path = route.path
         else:
-            print("[DEBUG] No email found in cookie. Prediction not saved to history.")
+            path = "/static" if request.url.path.startswith("/static/") else "unmatched"
+        metrics.REQUESTS.inc(request.method, path, str(status))
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, path)
+
+def cache_stats():
+    if prediction_cache is None:
+        return {}
+    stats = prediction_cache.metrics()
+    return {("memory",): stats["hits"], ("disk",): stats["disk_hits"], ("miss",): stats["misses"]}
+
+metrics.REGISTRY.register(metrics.Gauge(
+    "plant_inference_queue_depth", "Images waiting for a forward pass.", lambda: engine.metrics()["queue_depth"]))
+metrics.REGISTRY.register(metrics.Gauge(
+    "plant_admission_pending", "Heavy requests in flight.", lambda: admission.pending))
+metrics.REGISTRY.register(metrics.Gauge(
+    "plant_admission_rejected_total", "Requests rejected with 503.", lambda: admission.rejected, kind="counter"))
+metrics.REGISTRY.register(metrics.Gauge(
+    "plant_history_write_pending", "History rows waiting in the write-behind queue.", lambda: repo.history_writer.pending()))
+metrics.REGISTRY.register(metrics.Gauge(
+    "plant_prediction_cache_lookups_total", "Prediction cache lookups by outcome.", cache_stats, ("result",),
+    kind="counter"))
+metrics.REGISTRY.register(metrics.Gauge(
+    "plant_prediction_cache_hit_ratio", "Share of lookups served from the cache.",
+    lambda: prediction_cache.metrics()["hit_rate"] if prediction_cache is not None else None))
+metrics.REGISTRY.register(metrics.Gauge(
+    "plant_session_cache_hit_ratio", "Share of session lookups served without a database read.",
+    lambda: sessions.metrics()["hit_rate"]))
+metrics.REGISTRY.register(metrics.Gauge(
+    "plant_ready", "1 once the model is loaded and warmed up.", lambda: int(startup_state["ready"])))
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/inference/metrics")
+def inference_metrics():
+    return JSONResponse(content=engine.metrics())
+
+@app.get("/api/admission/metrics")
+def admission_metrics():
+    return JSONResponse(content=admission.metrics())
 
-        return {"prediction": class_name, "confidence": confidence_score, "loss": loss}
+@app.get("/api/cache/metrics")
+def cache_metrics():
+    if prediction_cache is None:
+        return JSONResponse(content={"enabled": False})
+    return JSONResponse(content={"enabled": True, **prediction_cache.metrics()})
 
+# ==== Model Admin ====
+def is_admin(request: Request):
+    return bool(settings.ADMIN_TOKEN) and request.headers.get("X-Admin-Token") == settings.ADMIN_TOKEN
+
+@app.get("/api/admin/models")
+def list_models(request: Request):
+    if not is_admin(request):
+        return JSONResponse(content={"error": "Forbidden"}, status_code=403)
+    manifest = registry.manifest()
+    return JSONResponse(content={**manifest, "serving": engine.model_version,
+                                 "rollback_available": model_manager.previous is not None})
+
+@app.post("/api/admin/models/reload")
+async def reload_model(request: Request, version: str = Form(None)):
+    """Load `version` (default: the manifest's active version) and swap it in without downtime."""
+    if not is_admin(request):
+        return JSONResponse(content={"error": "Forbidden"}, status_code=403)
+    try:
+        requested = bool(version)
+        if not requested:
+            version = await asyncio.to_thread(registry.active_version)
+        swapped = await model_manager.load(version)
+        # Recorded as active only once it serves, so a failed load leaves the manifest (and other workers) alone
+        if requested:
+            await asyncio.to_thread(registry.activate, version)
+    except KeyError as e:
+        return JSONResponse(content={"error": str(e.args[0])}, status_code=404)
     except Exception as e:
-        print(f"[ERROR] Exception in /predict: {e}")
+        logger.exception("Model reload failed")
         return JSONResponse(content={"error": str(e)}, status_code=500)
-# API endpoint for graph data (confidence & loss)
+    return JSONResponse(content={"serving": engine.model_version, "swapped": swapped})
+
+@app.post("/api/admin/models/rollback")
+async def rollback_model(request: Request):
+    if not is_admin(request):
+        return JSONResponse(content={"error": "Forbidden"}, status_code=403)
+    try:
+        version = await model_manager.rollback()
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=409)
+    return JSONResponse(content={"serving": version})
 
 @app.post("/generate_report")
 async def generate_report(prediction: str = Form(...), image: UploadFile = File(...)):
-    try:
-        image_bytes = await image.read()
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        return generate_pdf_report(prediction, image_bytes, timestamp)
-    except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+    async with admission:
+        try:
+            # Size, format and dimensions from the header, before any pixel is decoded
+            check_size(image.file, settings.MAX_UPLOAD_BYTES)
+            probe_image(image.file)
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            # matplotlib/FPDF/PIL work runs on the CPU pool, not the event loop; the spooled upload is read in place
+            pdf_bytes = await cpu_pool.run("pdf_render", render_pdf_report, prediction, pool_source(image.file), timestamp)
+            return pdf_response(pdf_bytes)
+        except ImageRejected as e:
+            return JSONResponse(content={"error": str(e)}, status_code=400)
+        except Exception as e:
+            return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.post("/api/reports")
+async def create_report(request: Request, prediction: str = Form(...), confidence: float = Form(0.0),
+                        image: UploadFile = File(...)):
+    """Queue a PDF for a prediction the client already has (e.g. when the user asks to download it)."""
+    async with admission:
+        try:
+            check_size(image.file, settings.MAX_UPLOAD_BYTES)
+            probe_image(image.file)
+            thumbnail = await cpu_pool.run("thumbnail", upload_thumbnail, pool_source(image.file))
+        except ImageRejected as e:
+            return JSONResponse(content={"error": str(e)}, status_code=400)
+        email = await current_user_async(request)
+        job_id = await report_jobs.submit(email, prediction, confidence,
+                                          datetime.now().strftime("%Y-%m-%d %H:%M:%S"), thumbnail)
+    return JSONResponse(content={"report_job_id": job_id}, status_code=202)
+
+def find_report_job(request: Request, job_id: str):
+    job = report_jobs.status(job_id)
+    # Jobs created by a logged-in user are only visible to that user
+    if job is None or (job["email"] and job["email"] != current_user(request)):
+        return None
+    return job
+
+@app.get("/api/reports/{job_id}")
+def report_status(request: Request, job_id: str):
+    job = find_report_job(request, job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Report not found."}, status_code=404)
+    job.pop("email")
+    if job["status"] == DONE:
+        job["download_url"] = f"/api/reports/{job_id}/download"
+    return JSONResponse(content=job)
+
+@app.get("/api/reports/{job_id}/download")
+def report_download(request: Request, job_id: str):
+    job = find_report_job(request, job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Report not found."}, status_code=404)
+    if job["status"] != DONE:
+        return JSONResponse(content={"error": f"Report is {job['status']}."}, status_code=409)
+    pdf_bytes = report_jobs.artifact(job_id)
+    if pdf_bytes is None:
+        return JSONResponse(content={"error": "Report has expired."}, status_code=410)
+    return pdf_response(pdf_bytes)
 
 @app.get("/calculator")
 def calculator_page(request: Request):
     if not is_logged_in(request):
         return RedirectResponse(url="/login")
-    return FileResponse("app/static/calculator.html")
+    return page(request, "calculator.html")
 
 @app.post("/api/calculate_cost")
 def calculate_cost(request: Request, farm_size: float = Form(...), unit: str = Form(...)):
@@ -279,55 +905,5 @@ def calculate_cost(request: Request, farm_size: float = Form(...), unit: str = F
 @app.post("/api/aiassist")
 async def aiassist_api(request: Request):
     data = await request.json()
-    query = data.get("query", "").lower().strip()
-    # Greeting detection
-    if query in ["hi", "hello", "hey", "hai", "hii", "helo"] or re.match(r"^(hi|hello|hey)[.! ]*$", query):
-        return JSONResponse(content={"response": "Hello, how can I assist you?"})
-    # Thank you detection
-    if query in ["thank you", "thanks", "thanku", "thankyou", "thx", "ty","THANK U"] or re.match(r"^(thank(s| you|u)?)[.! ]*$", query):
-        return JSONResponse(content={"response": "You're welcome! If you have more questions, just ask."})
-    # If user asks for disease list
-    if query in ["diseases", "disease list", "show diseases", "list diseases", "all diseases"]:
-        disease_names = [key.replace("_", " ").replace("__", " ") for key in DISEASE_INFO.keys()]
-        return JSONResponse(content={"diseases": disease_names, "response": "Select a disease from the list above to get details."})
-    # If user selects a disease name
-    for key in DISEASE_INFO.keys():
-        norm_key = key.replace("_", " ").replace("__", " ").replace("-", " ").lower()
-        if query == norm_key:
-            info = DISEASE_INFO[key]
-            response = f"Fertilizer: {info.get('fertilizer', 'N/A')}\nTreatment: {info.get('treatment', 'N/A')}\nOrganic: {info.get('organic_treatment', 'N/A')}\nChemical: {info.get('chemical_treatment', 'N/A')}\nTips: {info.get('tips', 'N/A')}"
-            return JSONResponse(content={"response": response})
-    # Find disease/crop in query
-    best_match = None
-    for key in DISEASE_INFO.keys():
-        # Normalize key for matching
-        norm_key = key.replace("_", " ").replace("__", " ").replace("-", " ").lower()
-        if all(word in norm_key for word in query.split() if len(word) > 2):
-            best_match = key
-            break
-        # Fuzzy match: check if any main word in key is in query
-        for part in norm_key.split():
-            if part in query:
-                best_match = key
-                break
-        if best_match:
-            break
-    if not best_match:
-        return JSONResponse(content={"response": "Sorry, I couldn't find info for your query."})
-    info = DISEASE_INFO[best_match]
-    # Build response based on keywords
-    response = ""
-    if "fertilizer" in query:
-        response += f"Fertilizer: {info.get('fertilizer', 'N/A')}\n"
-    if "treatment" in query:
-        response += f"Treatment: {info.get('treatment', 'N/A')}\n"
-    if "organic" in query:
-        response += f"Organic Treatment: {info.get('organic_treatment', 'N/A')}\n"
-    if "chemical" in query:
-        response += f"Chemical Treatment: {info.get('chemical_treatment', 'N/A')}\n"
-    if "tips" in query:
-        response += f"Tips: {info.get('tips', 'N/A')}\n"
-    # If no keyword, give summary
-    if not response:
-        response = f"Symptoms: {info.get('symptoms', 'N/A')}\nTreatment: {info.get('treatment', 'N/A')}\nFertilizer: {info.get('fertilizer', 'N/A')}\nTips: {info.get('tips', 'N/A')}"
-    return JSONResponse(content={"response": response.strip()})
\ No newline at end of file
+    query = data.get("query", "")
+    return JSONResponse(content=ASSIST_INDEX.query(query))
@@ -0,0 +1,147 @@
+# ==== Prometheus Metrics ====
+# A minimal in-process registry rendered in the Prometheus text format by
+# GET /metrics. Recording is a dict lookup plus a bisect under a lock, so the
+# hooks stay on in production; gauges are callbacks evaluated only at scrape
+# time. Each uvicorn worker keeps its own registry (scrape workers separately
+# or aggregate by instance).
+import bisect
+import threading
+
+# Seconds; covers sub-millisecond cache hits up to multi-second PDF renders
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, total in items:
+            lines.append(f"{self.name}{_labels(self.label_names, values)} {_number(total)}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time; the callback returns a number or {label tuple: number}.
+
+    kind="counter" exposes a monotonic total that another component already keeps (cache hits, ...).
+    """
+
+    def __init__(self, name, help_text, callback, labels=(), kind="gauge"):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.label_names = tuple(labels)
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        value = self.callback()
+        items = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        for values, number in items:
+            if number is not None:
+                lines.append(f"{self.name}{_labels(self.label_names, values)} {_number(number)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((values, list(series)) for values, series in self._series.items())
+        for values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, values, (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, values)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, values)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                continue  # a failing gauge callback must not break the whole scrape
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ==== Application Metrics ====
+REQUESTS = REGISTRY.register(Counter(
+    "plant_http_requests_total", "HTTP requests by method, route and status code.", ("method", "route", "status")))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "plant_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route")))
+# decode, preprocess, queue_wait, forward, softmax_loss, db_write and every StagePool task (pdf_render, ...)
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "plant_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage",)))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    "plant_inference_batch_size", "Images per forward pass.", buckets=(1, 2, 4, 8, 16, 32, 64)))
+# Only recorded with PLANT_MEASURE_PEAK_MEMORY=1 (see app/uploads.py)
+REQUEST_PEAK_MEMORY = REGISTRY.register(Histogram(
+    "plant_request_peak_memory_bytes", "Peak RSS above the starting RSS while an upload request ran.", ("route",),
+    buckets=tuple(mb * 1024 * 1024 for mb in (1, 2, 4, 8, 16, 32, 64, 128, 256, 512))))
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+
+
+def render():
+    return REGISTRY.render()
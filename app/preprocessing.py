@@ -0,0 +1,164 @@
+# ==== Fast Image Preprocessing ====
+# Shared by app/main.py and train.py. Equivalent to
+#   Resize((224, 224)) -> ToTensor() -> Normalize(mean, std)
+# but much cheaper for large phone photos:
+#   * the header (format and dimensions) is checked before any pixel is decoded, so
+#     oversized or unexpected inputs are rejected early
+#   * uploads are read from the spooled file Starlette already holds, never copied into bytes
+#   * JPEGs are decoded with PIL draft(), which downscales in the DCT domain (1/2, 1/4, 1/8)
+#     so a 12 MP photo is never fully decoded just to be shrunk to 224x224
+#   * uint8 -> normalized float goes through a per-channel lookup table in one pass,
+#     written straight into a (preallocated) output tensor
+import io
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+IMAGE_SIZE = 224
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+MAX_INPUT_BYTES = 25 * 1024 * 1024
+MAX_IMAGE_PIXELS = 50_000_000
+# What the server accepts (MPO is the multi-picture JPEG many phone cameras write)
+UPLOAD_FORMATS = frozenset({"JPEG", "MPO", "PNG", "WEBP", "BMP"})
+
+# NORMALIZE_LUT[c, v] == (v / 255 - MEAN[c]) / STD[c]
+NORMALIZE_LUT = ((np.arange(256, dtype=np.float32)[None, :] / 255.0
+                  - np.array(MEAN, dtype=np.float32)[:, None])
+                 / np.array(STD, dtype=np.float32)[:, None]).astype(np.float32)
+
+
+class ImageRejected(ValueError):
+    """Raised when an upload is too large or not a decodable image."""
+
+
+def source_size(source):
+    """Byte length of upload bytes or a seekable file object (whose position is left unchanged)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    position = source.tell()
+    size = source.seek(0, io.SEEK_END)
+    source.seek(position)
+    return size
+
+
+def check_size(source, max_bytes=MAX_INPUT_BYTES):
+    size = source_size(source)
+    if size > max_bytes:
+        raise ImageRejected(f"Upload too large: {size} bytes exceeds {max_bytes}")
+
+
+def open_header(source, max_pixels=MAX_IMAGE_PIXELS, formats=None):
+    """PIL image with only its header parsed, after the format and pixel-count checks."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif hasattr(source, "seek"):
+        source.seek(0)  # the same spooled upload may already have been hashed or probed
+    try:
+        image = Image.open(source)
+    except Exception as e:
+        raise ImageRejected(f"Unsupported image: {e}") from e
+    if formats is not None and image.format not in formats:
+        raise ImageRejected(f"Unsupported image format: {image.format}")
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageRejected(f"Image too large: {width}x{height} exceeds {max_pixels} pixels")
+    return image
+
+
+def probe_image(source, max_pixels=MAX_IMAGE_PIXELS, formats=UPLOAD_FORMATS):
+    """(format, width, height) from the header alone; raises ImageRejected like decode_image would."""
+    image = open_header(source, max_pixels, formats)
+    return image.format, image.size[0], image.size[1]
+
+
+def decode_image(source, size=IMAGE_SIZE, max_pixels=MAX_IMAGE_PIXELS, formats=None):
+    """Open bytes, a path or a file object as RGB, decoded at the smallest JPEG scale still >= size."""
+    image = open_header(source, max_pixels, formats)
+    # No-op for non-JPEG formats; for JPEG picks the largest DCT scale still >= size
+    image.draft("RGB", (size, size))
+    return image.convert("RGB")
+
+
+def open_image(source, size=IMAGE_SIZE, max_pixels=MAX_IMAGE_PIXELS):
+    """Open bytes, a path or a file object and return a (size x size) RGB PIL image."""
+    image = decode_image(source, size, max_pixels)
+    if image.size != (size, size):
+        image = image.resize((size, size), Image.BILINEAR)
+    return image
+
+
+def to_tensor(image, out=None):
+    """Normalize an RGB PIL image into a (3, H, W) float32 tensor, reusing `out` if given."""
+    pixels = np.asarray(image, dtype=np.uint8)
+    height, width, _ = pixels.shape
+    if out is None:
+        out = torch.empty((3, height, width), dtype=torch.float32)
+    target = out.numpy()
+    for channel in range(3):
+        np.take(NORMALIZE_LUT[channel], pixels[:, :, channel], out=target[channel])
+    return out
+
+
+def preprocess(image_bytes, out=None, max_bytes=MAX_INPUT_BYTES):
+    """Raw upload bytes (or a file object) -> normalized model input tensor."""
+    check_size(image_bytes, max_bytes)
+    return to_tensor(open_image(image_bytes), out=out)
+
+
+def jpeg_thumbnail(image, size=100, quality=95):
+    thumbnail = image.copy()
+    thumbnail.thumbnail((size, size))
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def upload_thumbnail(source, size=100):
+    """JPEG thumbnail for a report, decoded at the smallest JPEG scale that covers it."""
+    return jpeg_thumbnail(decode_image(source, size=size, formats=UPLOAD_FORMATS), size=size)
+
+
+def preprocess_with_thumbnail(image_bytes, thumbnail_size=100, max_bytes=MAX_INPUT_BYTES):
+    """Like preprocess(), but also returns an aspect-preserving JPEG thumbnail from the same decode."""
+    tensor, thumbnail, _ = preprocess_timed(image_bytes, True, thumbnail_size, max_bytes)
+    return tensor, thumbnail
+
+
+def preprocess_timed(image_bytes, with_thumbnail=False, thumbnail_size=100, max_bytes=MAX_INPUT_BYTES):
+    """(tensor, thumbnail or None, {"decode": s, "preprocess": s}) for upload bytes or a spooled upload file.
+
+    The thumbnail comes from the same decode. Timings are returned rather than
+    recorded here so they survive a process pool.
+    """
+    check_size(image_bytes, max_bytes)
+    started = time.perf_counter()
+    image = decode_image(image_bytes, formats=UPLOAD_FORMATS)
+    decoded = time.perf_counter()
+    thumbnail = jpeg_thumbnail(image, thumbnail_size) if with_thumbnail else None
+    if image.size != (IMAGE_SIZE, IMAGE_SIZE):
+        image = image.resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR)
+    tensor = to_tensor(image)
+    return tensor, thumbnail, {"decode": decoded - started, "preprocess": time.perf_counter() - decoded}
+
+
+def load_image(path):
+    """ImageFolder loader: opens with JPEG draft mode and resizes in one step."""
+    with open(path, "rb") as f:
+        image = open_image(f)
+        image.load()
+    return image
+
+
+class Preprocess:
+    """Drop-in replacement for the Resize/ToTensor/Normalize transform in train.py."""
+
+    def __init__(self, size=IMAGE_SIZE):
+        self.size = size
+
+    def __call__(self, image):
+        if image.size != (self.size, self.size) or image.mode != "RGB":
+            image = image.convert("RGB").resize((self.size, self.size), Image.BILINEAR)
+        return to_tensor(image)
@@ -0,0 +1,218 @@
+# ==== Versioned Model Registry ====
+# model/registry/
+#   manifest.json              {"active": "v2", "previous": "v1", "versions": {...}}
+#   v1/model.pth, v1/class_indices.json (+ any exported .ts/.onnx/_int8.ts, _calibration.json)
+#   v2/...
+# Version directories are immutable once registered; deploying a model means
+# registering it and flipping "active" in the manifest. The server's
+# ModelManager loads the new version in the background, warms it up and swaps
+# it into the inference engine without dropping in-flight requests.
+#
+# CLI:
+#   python -m app.registry register model/model.pth model/class_indices.json --activate
+#   python -m app.registry activate v3
+#   python -m app.registry rollback
+#   python -m app.registry list
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+
+MANIFEST = "manifest.json"
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    def __init__(self, root):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST)
+
+    # ---- Manifest ----
+    def manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"active": None, "previous": None, "versions": {}}
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, self.manifest_path)
+
+    def manifest_mtime(self):
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def active_version(self):
+        return self.manifest()["active"]
+
+    def paths(self, version):
+        """(model_path, class_indices_path) for a registered version."""
+        entry = self.manifest()["versions"].get(version)
+        if entry is None:
+            raise KeyError(f"Unknown model version '{version}'")
+        directory = os.path.join(self.root, version)
+        return os.path.join(directory, entry["model"]), os.path.join(directory, entry["class_indices"])
+
+    # ---- Changes ----
+    def register(self, model_path, class_indices_path, version=None, activate=False, note=""):
+        manifest = self.manifest()
+        if version is None:
+            version = f"v{len(manifest['versions']) + 1}"
+            while version in manifest["versions"]:
+                version = f"v{int(version[1:]) + 1}"
+        if version in manifest["versions"]:
+            raise ValueError(f"Model version '{version}' already exists")
+        directory = os.path.join(self.root, version)
+        os.makedirs(directory)
+        model_name = os.path.basename(model_path)
+        shutil.copy2(model_path, os.path.join(directory, model_name))
+        shutil.copy2(class_indices_path, os.path.join(directory, "class_indices.json"))
+        # Exported backends (see export_model.py) travel with their checkpoint
+        base, _ = os.path.splitext(model_path)
+        for suffix in (".ts", ".onnx", "_int8.ts", "_calibration.json"):
+            if os.path.exists(base + suffix):
+                shutil.copy2(base + suffix, os.path.join(directory, os.path.basename(base + suffix)))
+        manifest["versions"][version] = {
+            "model": model_name,
+            "class_indices": "class_indices.json",
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "note": note,
+        }
+        if activate or manifest["active"] is None:
+            manifest["previous"], manifest["active"] = manifest["active"], version
+        self._write_manifest(manifest)
+        return version
+
+    def activate(self, version):
+        manifest = self.manifest()
+        if version not in manifest["versions"]:
+            raise KeyError(f"Unknown model version '{version}'")
+        if manifest["active"] != version:
+            manifest["previous"], manifest["active"] = manifest["active"], version
+            self._write_manifest(manifest)
+        return version
+
+    def rollback(self):
+        manifest = self.manifest()
+        if not manifest["previous"]:
+            raise ValueError("No previous model version to roll back to")
+        return self.activate(manifest["previous"])
+
+
+class ModelManager:
+    """Loads registry versions into the inference engine: background load, warm-up, atomic swap."""
+
+    def __init__(self, registry, engine, load_fn, warmup_fn=None, on_swap=None, watch_interval=0.0, artifact=None):
+        self.registry = registry
+        self.engine = engine
+        self.load_fn = load_fn            # version -> (model, index_to_class, artifact_path)
+        self.warmup_fn = warmup_fn        # model -> None, run before the swap
+        self.on_swap = on_swap            # (version, artifact_path) -> None
+        self.watch_interval = watch_interval
+        self.artifact = artifact          # file the serving model was loaded from
+        self.previous = None              # (model, index_to_class, version, artifact) kept for rollback
+        self._lock = asyncio.Lock()
+        self._watcher = None
+        self._manifest_mtime = registry.manifest_mtime()
+
+    @property
+    def version(self):
+        return self.engine.model_version
+
+    async def load(self, version):
+        """Load, warm up and swap in `version`; returns False if it is already serving."""
+        async with self._lock:
+            if version == self.engine.model_version:
+                return False
+            model, index_to_class, artifact = await asyncio.to_thread(self.load_fn, version)
+            if self.warmup_fn is not None:
+                await asyncio.to_thread(self.warmup_fn, model)
+            current = self.engine.swap_model(model, index_to_class, version)
+            # Nothing to roll back to on the initial load
+            self.previous = (*current, self.artifact) if current[0] is not None else None
+            self.artifact = artifact
+            if self.on_swap is not None:
+                self.on_swap(version, artifact)
+            logger.info("Now serving model version %s from %s", version, artifact)
+            return True
+
+    async def rollback(self):
+        """Swap the previous in-memory model back in and record it as active in the manifest."""
+        async with self._lock:
+            if self.previous is None:
+                raise ValueError("No previous model version loaded")
+            model, index_to_class, version, artifact = self.previous
+            current = self.engine.swap_model(model, index_to_class, version)
+            self.previous = (*current, self.artifact)
+            self.artifact = artifact
+            await asyncio.to_thread(self.registry.activate, version)
+            self._manifest_mtime = self.registry.manifest_mtime()
+            if self.on_swap is not None:
+                self.on_swap(version, artifact)
+            logger.info("Rolled back to model version %s", version)
+            return version
+
+    # ---- Manifest watcher ----
+    def start_watching(self):
+        if self.watch_interval > 0 and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            mtime = self.registry.manifest_mtime()
+            if mtime == self._manifest_mtime:
+                continue
+            self._manifest_mtime = mtime
+            try:
+                version = await asyncio.to_thread(self.registry.active_version)
+                if version:
+                    await self.load(version)
+            except Exception:
+                logger.exception("Failed to hot-reload model")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the versioned model registry")
+    parser.add_argument("--root", default=os.path.join("model", "registry"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    register = commands.add_parser("register")
+    register.add_argument("model_path")
+    register.add_argument("class_indices_path")
+    register.add_argument("--version")
+    register.add_argument("--note", default="")
+    register.add_argument("--activate", action="store_true")
+    activate = commands.add_parser("activate")
+    activate.add_argument("version")
+    commands.add_parser("rollback")
+    commands.add_parser("list")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+    if args.command == "register":
+        version = registry.register(args.model_path, args.class_indices_path, args.version, args.activate, args.note)
+        print(f"✅ Registered {version}")
+    elif args.command == "activate":
+        print(f"✅ Active version: {registry.activate(args.version)}")
+    elif args.command == "rollback":
+        print(f"↩️ Active version: {registry.rollback()}")
+    print(json.dumps(registry.manifest(), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# ==== Server Settings ====
+# Every value can be overridden with an environment variable of the same name
+# prefixed with PLANT_, e.g. PLANT_MAX_BATCH_SIZE=16 uvicorn app.main:app
+import os
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(f"PLANT_{name}")
+    if value is None or value == "":
+        return default
+    if cast is bool:
+        return value.lower() in ("1", "true", "yes", "on")
+    return cast(value)
+
+
+# ==== Paths ====
+DB_PATH = _env("DB_PATH", "users.db")
+MODEL_PATH = _env("MODEL_PATH", "model/model.pth")
+CLASS_INDICES_PATH = _env("CLASS_INDICES_PATH", "model/class_indices.json")
+MODEL_NAME = _env("MODEL_NAME", "tf_efficientnetv2_b3")
+
+# ==== Model Registry ====
+# Versions live under MODEL_REGISTRY_DIR; MODEL_PATH is registered as v1 on first start
+MODEL_REGISTRY_DIR = _env("MODEL_REGISTRY_DIR", "model/registry")
+MODEL_WATCH_INTERVAL = _env("MODEL_WATCH_INTERVAL", 5.0, float)   # seconds between manifest checks, 0 disables
+ADMIN_TOKEN = _env("ADMIN_TOKEN", "")                             # X-Admin-Token for /api/admin/*; empty disables
+
+# ==== Model Backend ====
+# auto (torchscript if exported, else eager), eager (timm + model.pth), torchscript, onnx or int8;
+# see export_model.py
+MODEL_BACKEND = _env("MODEL_BACKEND", "auto")
+
+# ==== Inference Engine ====
+MAX_BATCH_SIZE = _env("MAX_BATCH_SIZE", 8, int)      # images per forward pass
+MAX_WAIT_MS = _env("MAX_WAIT_MS", 10.0, float)       # how long a batch waits to fill up
+MAX_QUEUE_SIZE = _env("MAX_QUEUE_SIZE", 256, int)    # pending images before /predict blocks
+
+# ==== Uncertainty ====
+TOP_K = _env("TOP_K", 3, int)                                            # ranked classes in every prediction
+LOW_CONFIDENCE_THRESHOLD = _env("LOW_CONFIDENCE_THRESHOLD", 60.0, float)  # calibrated % below which history is flagged
+
+# ==== Test-Time Augmentation & Ensembles ====
+TTA_MAX_VIEWS = _env("TTA_MAX_VIEWS", 6, int)                   # views per TTA request (flips, crops)
+TTA_LATENCY_BUDGET_MS = _env("TTA_LATENCY_BUDGET_MS", 250.0, float)  # fewer views when the engine is busier; 0 = off
+ENSEMBLE_VERSIONS = [v for v in _env("ENSEMBLE_VERSIONS", "").split(",") if v]  # extra registry versions
+
+# ==== Embedding Index ====
+EMBEDDINGS_ENABLED = _env("EMBEDDINGS_ENABLED", True, bool)   # store features of logged-in users' predictions
+EMBEDDINGS_DIR = _env("EMBEDDINGS_DIR", "embeddings")          # one store per model version (see app/embeddings.py)
+SIMILAR_K = _env("SIMILAR_K", 5, int)                          # neighbours returned by /predict and /api/similar
+SIMILAR_NPROBE = _env("SIMILAR_NPROBE", 8, int)                # IVF lists scanned per search
+DUPLICATE_SIMILARITY = _env("DUPLICATE_SIMILARITY", 0.97, float)  # cosine at or above which an upload is a repeat
+
+# ==== Batch Prediction ====
+MAX_BATCH_FILES = _env("MAX_BATCH_FILES", 1000, int)  # images per /predict/batch call
+
+# ==== Prediction Cache ====
+CACHE_MAX_MB = _env("CACHE_MAX_MB", 32.0, float)      # 0 disables the cache
+CACHE_DB_PATH = _env("CACHE_DB_PATH", "")             # e.g. prediction_cache.db for a persistent tier
+
+# ==== Serving Processes ====
+# serve.py exports WORKERS so each process can size its own thread pools
+WORKERS = _env("WORKERS", 1, int)                                  # uvicorn worker processes
+CORES_PER_WORKER = max(1, (os.cpu_count() or 1) // max(1, WORKERS))
+TORCH_THREADS = _env("TORCH_THREADS", CORES_PER_WORKER, int)       # intra-op threads per process
+MMAP_WEIGHTS = _env("MMAP_WEIGHTS", True, bool)                    # share eager weights between processes via mmap
+
+# ==== Worker Pools & Backpressure ====
+CPU_POOL_KIND = _env("CPU_POOL_KIND", "thread")                   # thread | process (decode, PDF rendering)
+CPU_WORKERS = _env("CPU_WORKERS", min(8, CORES_PER_WORKER), int)
+DB_WORKERS = _env("DB_WORKERS", 2, int)
+DB_POOL_SIZE = _env("DB_POOL_SIZE", 4, int)
+HISTORY_MAX_PAGE_SIZE = _env("HISTORY_MAX_PAGE_SIZE", 500, int)
+MAX_PENDING_REQUESTS = _env("MAX_PENDING_REQUESTS", 64, int)      # /predict + /generate_report in flight
+RETRY_AFTER_SECONDS = _env("RETRY_AFTER_SECONDS", 2, int)
+
+# ==== Uploads ====
+MAX_UPLOAD_BYTES = _env("MAX_UPLOAD_BYTES", 25 * 1024 * 1024, int)               # one image (or zip entry)
+MAX_BATCH_UPLOAD_BYTES = _env("MAX_BATCH_UPLOAD_BYTES", 512 * 1024 * 1024, int)  # whole /predict/batch body
+MEASURE_PEAK_MEMORY = _env("MEASURE_PEAK_MEMORY", False, bool)  # peak RSS per upload request (metric + header)
+
+# ==== Authentication ====
+PASSWORD_SCRYPT_N = _env("PASSWORD_SCRYPT_N", 2 ** 14, int)   # scrypt cost (power of two); 16 MB and ~80 ms per hash
+PASSWORD_SCRYPT_R = _env("PASSWORD_SCRYPT_R", 8, int)
+PASSWORD_SCRYPT_P = _env("PASSWORD_SCRYPT_P", 1, int)
+SESSION_COOKIE = _env("SESSION_COOKIE", "session")
+SESSION_COOKIE_SECURE = _env("SESSION_COOKIE_SECURE", False, bool)  # set behind HTTPS
+SESSION_TTL = _env("SESSION_TTL", 7 * 24 * 3600, int)              # seconds a login lasts
+SESSION_CACHE_SIZE = _env("SESSION_CACHE_SIZE", 100_000, int)      # sessions held in each worker's LRU
+SESSION_RECHECK_SECONDS = _env("SESSION_RECHECK_SECONDS", 30.0, float)  # how long a logout may take to reach other workers
+SESSION_SWEEP_INTERVAL = _env("SESSION_SWEEP_INTERVAL", 600, int)  # seconds between expired-session sweeps
+SESSION_SECRET = _env("SESSION_SECRET", "")                        # signing key; default: generated into SESSION_SECRET_PATH
+SESSION_SECRET_PATH = _env("SESSION_SECRET_PATH", "session_secret.key")
+
+# ==== Static Assets ====
+STATIC_DIR = _env("STATIC_DIR", "app/static")
+STATIC_DIST_DIR = _env("STATIC_DIST_DIR", "app/static/dist")   # output of `python -m app.assets build`
+
+# ==== Logging ====
+LOG_LEVEL = _env("LOG_LEVEL", "INFO")                 # DEBUG adds per-request and per-stage detail
+LOG_JSON = _env("LOG_JSON", False, bool)              # one JSON object per line
+
+# ==== Report Jobs ====
+REPORT_WORKERS = _env("REPORT_WORKERS", 2, int)
+REPORT_ARTIFACT_DIR = _env("REPORT_ARTIFACT_DIR", "report_artifacts")
+REPORT_ARTIFACT_MAX_MB = _env("REPORT_ARTIFACT_MAX_MB", 256.0, float)
+REPORT_ARTIFACT_TTL = _env("REPORT_ARTIFACT_TTL", 3600, int)   # seconds a finished PDF stays downloadable
@@ -3,8 +3,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const logoutBtn = document.getElementById('logoutBtn');
     if (logoutBtn) {
         logoutBtn.onclick = function() {
-            document.cookie = 'logged_in=; Max-Age=0; path=/;';
-            window.location.href = '/login';
+            fetch('/logout', { method: 'POST' }).finally(() => { window.location.href = '/login'; });
         };
     }
 });
@@ -18,6 +17,7 @@ const dropZoneText = document.getElementById('drop-zone-text');
 
 let selectedFile = null;
 let lastPrediction = "";
+let lastConfidence = 0;
 
 if (dropZone && uploadInput) {
     // Click drop zone opens file dialog
@@ -93,6 +93,7 @@ predictBtn.addEventListener('click', async () => {
             resultBox.innerHTML = `✅ <b>Predicted:</b> ${data.prediction} (${data.confidence}%)`;
             resultBox.style.color = '#111';
             lastPrediction = data.prediction;
+            lastConfidence = data.confidence;
             downloadBtn.disabled = false;
         }, 2500); // 2.5 seconds delay
 
@@ -104,18 +105,50 @@ predictBtn.addEventListener('click', async () => {
     predictBtn.disabled = false;
 });
 
-downloadBtn.addEventListener('click', async () => {
-    if (!selectedFile || !lastPrediction) return;
+// Poll the background report job until its PDF is ready
+async function fetchReportJob(jobId) {
+    for (let attempt = 0; attempt < 60; attempt++) {
+        const res = await fetch(`/api/reports/${jobId}`);
+        if (!res.ok) return null;
+        const job = await res.json();
+        if (job.status === 'done') return await fetch(job.download_url);
+        if (job.status !== 'queued' && job.status !== 'running') return null;
+        await new Promise(resolve => setTimeout(resolve, 500));
+    }
+    return null;
+}
 
+// The PDF is only built once the user asks for it, as a background job
+async function requestReport() {
     const formData = new FormData();
     formData.append('image', selectedFile);
     formData.append('prediction', lastPrediction);
+    formData.append('confidence', lastConfidence);
+    const res = await fetch("/api/reports", { method: "POST", body: formData });
+    if (!res.ok) return null;
+    const job = await res.json();
+    return await fetchReportJob(job.report_job_id);
+}
 
-    const res = await fetch("/generate_report", {
-        method: "POST",
-        body: formData
-    });
+downloadBtn.addEventListener('click', async () => {
+    if (!selectedFile || !lastPrediction) return;
+
+    downloadBtn.disabled = true;
+    let res = await requestReport();
+
+    if (!res || !res.ok) {
+        // Fall back to rendering the report synchronously
+        const formData = new FormData();
+        formData.append('image', selectedFile);
+        formData.append('prediction', lastPrediction);
+
+        res = await fetch("/generate_report", {
+            method: "POST",
+            body: formData
+        });
+    }
 
+    downloadBtn.disabled = false;
     if (!res.ok) {
         alert("❌ Report generation failed.");
         return;
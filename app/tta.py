@@ -0,0 +1,103 @@
+# ==== Test-Time Augmentation & Ensembles ====
+# One upload is decoded once and turned into several views (flips and centre
+# crops at a few scales). The views go through the inference engine as
+# separate images, so they are stacked into the same forward pass as each
+# other and as any concurrent requests. With an ensemble, every registered
+# member model also runs on those same view tensors. The final answer averages
+# the softmax vectors of every (view, model) pair.
+#
+# Views are listed most useful first. Under load, view_budget() cuts the list
+# so the estimated engine latency stays within TTA_LATENCY_BUDGET_MS. The
+# first view is the plain single-crop input, so one view means a normal
+# prediction.
+import math
+import time
+
+import torch
+from PIL import Image
+
+from app.inference import describe
+from app.preprocessing import IMAGE_SIZE, MAX_INPUT_BYTES, UPLOAD_FORMATS, check_size, decode_image, jpeg_thumbnail, to_tensor
+
+# name -> (centre crop fraction, flip); "hflip"/"vflip" flip the tensor of the matching crop
+VIEWS = {
+    "identity": (1.0, None),
+    "hflip": (1.0, "h"),
+    "crop_0.875": (0.875, None),
+    "vflip": (1.0, "v"),
+    "crop_0.875_hflip": (0.875, "h"),
+    "crop_0.75": (0.75, None),
+}
+VIEW_ORDER = tuple(VIEWS)
+
+
+def tta_views(image_bytes, count, with_thumbnail=False, max_bytes=MAX_INPUT_BYTES):
+    """(view names, [(3, H, W) tensors], thumbnail or None, timings) for the first `count` views.
+
+    Each crop scale is resized and normalised once; flips reuse that tensor.
+    """
+    check_size(image_bytes, max_bytes)
+    names = VIEW_ORDER[:max(1, min(count, len(VIEW_ORDER)))]
+    smallest_crop = min(VIEWS[name][0] for name in names)
+    started = time.perf_counter()
+    # Decode large enough that the tightest crop still has IMAGE_SIZE pixels
+    image = decode_image(image_bytes, size=math.ceil(IMAGE_SIZE / smallest_crop), formats=UPLOAD_FORMATS)
+    decoded = time.perf_counter()
+    thumbnail = jpeg_thumbnail(image) if with_thumbnail else None
+    width, height = image.size
+    by_scale = {}
+    views = []
+    for name in names:
+        scale, flip = VIEWS[name]
+        if scale not in by_scale:
+            crop_w, crop_h = width * scale, height * scale
+            left, top = (width - crop_w) / 2, (height - crop_h) / 2
+            box = (round(left), round(top), round(left + crop_w), round(top + crop_h))
+            by_scale[scale] = to_tensor(image.resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR, box=box))
+        tensor = by_scale[scale]
+        if flip == "h":
+            tensor = torch.flip(tensor, dims=(2,))
+        elif flip == "v":
+            tensor = torch.flip(tensor, dims=(1,))
+        views.append(tensor)
+    return names, views, thumbnail, {"decode": decoded - started, "preprocess": time.perf_counter() - decoded}
+
+
+def view_budget(engine, requested, members, budget_ms):
+    """Largest view count <= requested whose estimated engine latency fits the budget (at least 1)."""
+    count = max(1, min(requested, len(VIEW_ORDER)))
+    if budget_ms <= 0:
+        return count
+    while count > 1 and engine.estimate_ms(count * members) > budget_ms:
+        count -= 1
+    return count
+
+
+def combine(view_names, results, top_k=3):
+    """Average the softmax of every (view, model) pair; report the answer and how much the views agree."""
+    index_to_class = results[0]["index_to_class"]
+    rows, calibrated_rows, per_view = [], [], []
+    for name, result in zip(view_names, results):
+        for probabilities, calibrated, version in result["probabilities"]:
+            rows.append(probabilities)
+            calibrated_rows.append(calibrated)
+            confidence, idx = torch.max(probabilities, 0)
+            per_view.append({
+                "view": name,
+                "model_version": version,
+                "prediction": index_to_class[int(idx)],
+                "confidence": round(float(confidence) * 100, 2),
+            })
+    mean = torch.stack(rows).mean(dim=0, keepdim=True)
+    calibrated_mean = torch.stack(calibrated_rows).mean(dim=0, keepdim=True)
+    result = describe(mean, calibrated_mean, index_to_class, top_k)[0]
+    agreement = sum(view["prediction"] == result["prediction"] for view in per_view) / len(per_view)
+    versions = list(dict.fromkeys(view["model_version"] for view in per_view))
+    result["model_version"] = "+".join(versions)
+    result["tta"] = {
+        "views": len(view_names),
+        "models": len(versions),
+        "agreement": round(agreement, 4),
+        "per_view": per_view,
+    }
+    return result
@@ -0,0 +1,138 @@
+# ==== Upload Limits & Peak Memory ====
+# Starlette parses multipart bodies into UploadFile objects backed by a
+# SpooledTemporaryFile (in memory up to 1 MB, then a temporary file). Routes
+# hand that file object straight to decoding, hashing and PDF rendering rather
+# than read()ing it into bytes, so an upload is held once.
+#
+# UploadLimit sits in front of the upload routes and caps the request body:
+#   * a Content-Length over the cap is answered with 413 before any byte is read
+#   * chunked or lying bodies are counted as they stream in and cut off with
+#     413 as soon as they pass the cap, so nothing past it is ever spooled
+# With measure_memory it also records the peak resident memory of the process
+# while each upload request ran (see PeakMemory).
+import json
+import logging
+
+from app.metrics import REQUEST_PEAK_MEMORY
+
+logger = logging.getLogger(__name__)
+
+STATUS_PATH = "/proc/self/status"
+CLEAR_REFS_PATH = "/proc/self/clear_refs"
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit):
+        super().__init__(f"Upload too large: request body exceeds {limit} bytes")
+        self.limit = limit
+
+
+def _status_kb(field):
+    with open(STATUS_PATH, "r") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+class PeakMemory:
+    """Peak RSS above the starting RSS, from VmHWM after resetting it (Linux).
+
+    The high-water mark is per process, so with concurrent requests a reading
+    covers whatever else ran at the same time; bench_uploads.py measures one
+    request at a time for exact per-request numbers.
+    """
+
+    available = None
+
+    def __init__(self):
+        self.start_kb = 0
+
+    @classmethod
+    def _reset(cls):
+        # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux >= 4.0)
+        try:
+            with open(CLEAR_REFS_PATH, "w") as f:
+                f.write("5")
+            return True
+        except OSError:
+            return False
+
+    def start(self):
+        if PeakMemory.available is None:
+            PeakMemory.available = self._reset()
+            if not PeakMemory.available:
+                logger.warning("Peak memory measurement needs a writable %s; disabled", CLEAR_REFS_PATH)
+        if not PeakMemory.available:
+            return False
+        self._reset()
+        self.start_kb = _status_kb("VmRSS")
+        return True
+
+    def peak_bytes(self):
+        return max(0, _status_kb("VmHWM") - self.start_kb) * 1024
+
+
+class UploadLimit:
+    """ASGI middleware: per-path request body caps, plus optional peak-memory reporting."""
+
+    def __init__(self, app, limits, measure_memory=False):
+        self.app = app
+        self.limits = limits  # path -> max body bytes
+        self.measure_memory = measure_memory
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            await self._reject(send, limit)
+            return
+
+        memory = PeakMemory() if self.measure_memory and PeakMemory().start() else None
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise UploadTooLarge(limit)
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                return  # whatever the app made of the aborted body is replaced by the 413 below
+            if message["type"] == "http.response.start":
+                started = True
+                if memory is not None:
+                    peak = memory.peak_bytes()
+                    REQUEST_PEAK_MEMORY.observe(peak, scope["path"])
+                    message = dict(message, headers=[*message.get("headers", []),
+                                                     (b"x-peak-memory-bytes", str(peak).encode())])
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            pass
+        if exceeded and not started:
+            await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit):
+        body = json.dumps({"error": str(UploadTooLarge(limit))}).encode()
+        await send({"type": "http.response.start", "status": 413, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            # The rest of the body is never read, so the connection can't be reused
+            (b"connection", b"close"),
+        ]})
+        await send({"type": "http.response.body", "body": body})
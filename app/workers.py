@@ -0,0 +1,81 @@
+# ==== Worker Pools & Admission Control ====
+# CPU-bound stages (image decode, PDF rendering) run on a configurable thread or
+# process pool and blocking I/O (sqlite) on a small thread pool, so the event
+# loop only ever awaits them. A bounded admission gate in front of the heavy
+# routes turns overload into a fast 503 + Retry-After instead of a timeout.
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from app.metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """Raised when the admission queue is full; mapped to 503 by app/main.py."""
+
+    def __init__(self, retry_after, message="Server is busy, please retry shortly."):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class StagePool:
+    """Runs blocking callables off the event loop and records how long each stage took."""
+
+    def __init__(self, name, max_workers, kind="thread"):
+        self.name = name
+        self.kind = kind
+        if kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        elif kind == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        else:
+            raise ValueError(f"Unknown pool kind '{kind}', expected 'thread' or 'process'")
+
+    async def run(self, stage, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+        finally:
+            # Wall time including the wait for a free worker
+            elapsed = time.perf_counter() - started
+            observe_stage(stage, elapsed)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("stage %s took %.1f ms on the %s pool", stage, elapsed * 1000.0, self.name)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AdmissionGate:
+    """Caps how many heavy requests may be in flight; the event loop is single threaded so a counter is enough."""
+
+    def __init__(self, max_pending, retry_after=2):
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.pending = 0
+        self.rejected = 0
+
+    def acquire(self):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise Overloaded(self.retry_after)
+        self.pending += 1
+
+    def release(self):
+        self.pending = max(0, self.pending - 1)
+
+    async def __aenter__(self):
+        self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def metrics(self):
+        return {"pending": self.pending, "max_pending": self.max_pending, "rejected": self.rejected}
@@ -0,0 +1,75 @@
+"""Benchmark the AI-assist query engine on a synthetic catalogue.
+
+Usage:
+  python bench_assist.py --entries 10000 --queries 2000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.assist import AssistIndex
+
+CROPS = ["tomato", "potato", "pepper", "maize", "wheat", "rice", "cassava", "banana", "grape", "apple",
+         "citrus", "cotton", "soybean", "bean", "cabbage", "onion", "mango", "coffee", "cocoa", "sorghum"]
+PATHOGENS = ["blight", "rust", "mildew", "mosaic", "wilt", "canker", "rot", "spot", "scab", "smut", "curl", "streak"]
+QUALIFIERS = ["early", "late", "leaf", "bacterial", "powdery", "downy", "black", "yellow", "brown", "grey", "stem", "root"]
+WORDS = ["lesions", "yellowing", "spots", "wilting", "fungus", "copper", "neem", "spray", "prune", "drainage",
+         "humidity", "nitrogen", "potassium", "rotation", "resistant", "varieties", "mulch", "fungicide", "soap", "water"]
+
+
+def synthetic_catalogue(entries, rng):
+    catalogue = {}
+    while len(catalogue) < entries:
+        name = f"{rng.choice(CROPS).capitalize()}___{rng.choice(QUALIFIERS).capitalize()}_{rng.choice(PATHOGENS)}_{len(catalogue)}"
+        text = lambda n: " ".join(rng.choice(WORDS) for _ in range(n))
+        catalogue[name] = {
+            "symptoms": text(12), "causes": text(8), "treatment": text(10),
+            "organic_treatment": text(6), "chemical_treatment": text(6), "fertilizer": text(5), "tips": text(8),
+        }
+    return catalogue
+
+
+def make_queries(count, rng):
+    queries = []
+    for _ in range(count):
+        words = [rng.choice(CROPS), rng.choice(QUALIFIERS), rng.choice(PATHOGENS), rng.choice(["", "treatment", "organic", "tips"])]
+        query = " ".join(w for w in words if w)
+        if rng.random() < 0.3:  # typo
+            i = rng.randrange(len(query))
+            query = query[:i] + query[i + 1:]
+        queries.append(query)
+    return queries
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    catalogue = synthetic_catalogue(args.entries, rng)
+    started = time.perf_counter()
+    index = AssistIndex(catalogue)
+    print(f"🔎 Indexed {args.entries} entries in {(time.perf_counter() - started) * 1000:.0f} ms "
+          f"({len(index.postings)} terms)")
+
+    queries = make_queries(args.queries, rng)
+    for label in ("cold", "cached"):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.query(query)
+            timings.append((time.perf_counter() - started) * 1000.0)
+        print(f"   {label:6s}: p50 {statistics.median(timings):.3f} ms  p95 {percentile(timings, 0.95):.3f} ms  "
+              f"p99 {percentile(timings, 0.99):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
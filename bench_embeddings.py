@@ -0,0 +1,78 @@
+"""Benchmark the embedding index on synthetic clustered feature vectors.
+
+Fills a throwaway store, measures exact-scan search, trains the IVF index and
+measures it again, reporting latency and recall@k against the exact answer.
+
+Usage:
+  python bench_embeddings.py --vectors 1000000 --dim 1536 --queries 100
+  python bench_embeddings.py --vectors 200000 --lists 512 --nprobe 16
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.embeddings import EmbeddingStore, train
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def synthetic_vectors(count, dim, clusters, rng):
+    """Non-negative, clustered vectors, roughly like pooled post-ReLU/SiLU features of a few disease classes."""
+    centres = np.abs(rng.standard_normal((clusters, dim), dtype=np.float32))
+    labels = rng.integers(0, clusters, count)
+    return centres[labels] + 0.6 * np.abs(rng.standard_normal((count, dim), dtype=np.float32))
+
+
+def run_queries(store, queries, k):
+    timings, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append([row for row, _ in store.search(query, k)])
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return timings, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=1536, help="tf_efficientnetv2_b3 pools to 1536 features")
+    parser.add_argument("--clusters", type=int, default=38, help="synthetic classes")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--lists", type=int, default=0, help="IVF lists (default: sqrt(vectors))")
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--exact-queries", type=int, default=20, help="queries timed without the index")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = EmbeddingStore(directory, nprobe=args.nprobe)
+        started = time.perf_counter()
+        for start in range(0, args.vectors, 50_000):
+            store.add_many(synthetic_vectors(min(50_000, args.vectors - start), args.dim, args.clusters, rng))
+        print(f"📦 Stored {len(store)} x {args.dim} float16 vectors "
+              f"({store.stats()['bytes'] / 1e6:.0f} MB) in {time.perf_counter() - started:.1f} s")
+
+        queries = synthetic_vectors(args.queries, args.dim, args.clusters, rng)
+        exact_timings, exact = run_queries(store, queries[:args.exact_queries], args.k)
+        print(f"   exact: p50 {statistics.median(exact_timings):.1f} ms  p95 {percentile(exact_timings, 0.95):.1f} ms")
+        # Ground truth for every query, without timing it
+        truth = exact + run_queries(store, queries[args.exact_queries:], args.k)[1]
+
+        started = time.perf_counter()
+        lists = train(store, args.lists or None)
+        print(f"🧭 Trained {lists} IVF lists in {time.perf_counter() - started:.1f} s")
+        ivf_timings, found = run_queries(store, queries, args.k)
+        recall = statistics.mean(len(set(a) & set(b)) / len(b) for a, b in zip(found, truth) if b)
+        print(f"   ivf:   p50 {statistics.median(ivf_timings):.2f} ms  p95 {percentile(ivf_timings, 0.95):.2f} ms  "
+              f"p99 {percentile(ivf_timings, 0.99):.2f} ms  recall@{args.k} {recall:.3f} (nprobe {args.nprobe})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Microbenchmark: torchvision transform vs app.preprocessing on phone-sized photos.
+
+Usage:
+  python bench_preprocess.py                  # synthetic 4000x3000 JPEG
+  python bench_preprocess.py --image leaf.jpg --runs 50
+"""
+import argparse
+import io
+import statistics
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from app.preprocessing import preprocess
+
+transform = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406],
+                         [0.229, 0.224, 0.225])
+])
+
+
+def synthetic_jpeg(width, height):
+    # Smooth gradients plus noise so the JPEG is not trivially compressible
+    y, x = np.mgrid[0:height, 0:width]
+    rgb = np.stack([(x * 255 // width), (y * 255 // height), ((x + y) * 127 // (width + height))], axis=-1)
+    rgb = (rgb + np.random.default_rng(0).integers(0, 40, rgb.shape)).clip(0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(rgb).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def baseline(image_bytes):
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    return transform(image)
+
+
+def fast(image_bytes, out):
+    return preprocess(image_bytes, out=out)
+
+
+def time_it(fn, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return statistics.median(timings), min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", help="JPEG to benchmark with (default: synthetic 12 MP photo)")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image_bytes = f.read()
+    else:
+        image_bytes = synthetic_jpeg(args.width, args.height)
+    print(f"📷 Input: {len(image_bytes) / 1024:.0f} KiB JPEG")
+
+    out = torch.empty((3, 224, 224), dtype=torch.float32)
+    reference = baseline(image_bytes)
+    result = fast(image_bytes, out)
+    # Draft decoding changes the resampling path, so expect small pixel differences
+    print(f"   max |diff| vs torchvision: {(reference - result).abs().max().item():.4f} "
+          f"(mean {(reference - result).abs().mean().item():.4f})")
+
+    base_median, base_min = time_it(lambda: baseline(image_bytes), args.runs)
+    fast_median, fast_min = time_it(lambda: fast(image_bytes, out), args.runs)
+    print(f"   torchvision transform : median {base_median:7.2f} ms  min {base_min:7.2f} ms")
+    print(f"   app.preprocessing     : median {fast_median:7.2f} ms  min {fast_min:7.2f} ms")
+    print(f"✅ Speed-up: {base_median / fast_median:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Benchmark PDF report generation: uncached (every asset rebuilt per call) vs the cached report engine.
+
+Usage:
+  python bench_report.py --reports 50
+"""
+import argparse
+import io
+import time
+from datetime import datetime
+
+from PIL import Image
+
+from report.pdf_generator import ReportEngine
+
+
+def sample_image():
+    buffer = io.BytesIO()
+    Image.new("RGB", (1600, 1200), (60, 140, 60)).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def run(engine, classes, image_bytes, reports):
+    started = time.perf_counter()
+    for i in range(reports):
+        engine.render(classes[i % len(classes)], image_bytes, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 87.5)
+    return reports / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", type=int, default=50)
+    args = parser.parse_args()
+    image_bytes = sample_image()
+
+    uncached = ReportEngine(precompute=False)
+    started = time.perf_counter()
+    cached = ReportEngine()
+    startup_s = time.perf_counter() - started
+    classes = list(cached.disease_info)
+
+    before = run(uncached, classes, image_bytes, args.reports)
+    run(cached, classes, image_bytes, len(classes))  # build the per-class templates once
+    after = run(cached, classes, image_bytes, args.reports)
+    print(f"📄 {args.reports} reports over {len(classes)} classes")
+    print(f"   uncached : {before:8.1f} reports/s")
+    print(f"   cached   : {after:8.1f} reports/s  (one-off startup {startup_s * 1000:.0f} ms)")
+    print(f"✅ Speed-up: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""Load-test the serving stack end to end with a randomly initialised model.
+
+Builds a throwaway workspace (sqlite DB, model registry, report artifacts)
+with a random-init model of the real architecture, starts the app under
+uvicorn (in this process or as a subprocess), and drives a weighted mix of
+routes with synthetic leaf photos at a fixed concurrency. Reports throughput
+and p50/p95/p99 latency per route, writes them as JSON, and can fail when a
+run regresses against a stored baseline.
+
+Usage:
+  python bench_serving.py --duration 30 --concurrency 8 --output bench.json
+  python bench_serving.py --mix predict=1 --concurrency 32
+  python bench_serving.py --output new.json --baseline bench.json --max-regression 0.15
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+DEFAULT_MIX = "predict=6,predict_report=1,generate_report=1,aiassist=3,history=2,history_stats=1"
+ASSIST_QUERIES = ["hi", "tomato late blight", "potato early blight treatment", "pepper bacterial spot organic",
+                  "tomoto leaf mold tips", "yellow leaf curl virus fertilizer", "diseases", "septoria leaf spot"]
+
+
+# ==== Synthetic data ====
+def synthetic_leaf(rng, width, height):
+    """JPEG of a green leaf with brown lesions on a soil-coloured background."""
+    background = tuple(int(v) for v in rng.integers(60, 140, 3))
+    image = Image.new("RGB", (width, height), background)
+    draw = ImageDraw.Draw(image)
+    cx, cy = width // 2, height // 2
+    rx, ry = int(width * rng.uniform(0.25, 0.45)), int(height * rng.uniform(0.2, 0.4))
+    green = (int(rng.integers(30, 90)), int(rng.integers(110, 190)), int(rng.integers(30, 80)))
+    draw.ellipse((cx - rx, cy - ry, cx + rx, cy + ry), fill=green)
+    draw.line((cx - rx, cy, cx + rx, cy), fill=(200, 220, 160), width=max(2, width // 200))
+    for _ in range(int(rng.integers(3, 25))):
+        x, y = int(rng.integers(cx - rx // 2, cx + rx // 2)), int(rng.integers(cy - ry // 2, cy + ry // 2))
+        r = int(rng.integers(3, max(4, width // 40)))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=(int(rng.integers(90, 140)), int(rng.integers(60, 90)), 30))
+    image = image.filter(ImageFilter.GaussianBlur(1.2))
+    # Sensor noise so JPEG sizes look like real photos
+    pixels = np.asarray(image, dtype=np.int16) + rng.integers(-8, 9, (height, width, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, "JPEG", quality=88)
+    return buffer.getvalue()
+
+
+def synthetic_images(count, seed):
+    rng = np.random.default_rng(seed)
+    sizes = [(640, 480), (1280, 960), (2016, 1512), (4032, 3024)]
+    return [synthetic_leaf(rng, *sizes[i % len(sizes)]) for i in range(count)]
+
+
+# ==== Workspace ====
+def build_workspace(root, model_name, backend, class_indices_path):
+    """Random-init model + class map in `root`; returns the PLANT_* environment for the server."""
+    import timm
+    import torch
+
+    with open(class_indices_path) as f:
+        num_classes = len(json.load(f))
+    torch.manual_seed(0)
+    model = timm.create_model(model_name, pretrained=False, num_classes=num_classes).eval()
+    model_path = os.path.join(root, "model.pth")
+    torch.save(model.state_dict(), model_path)
+    if backend == "torchscript":
+        with torch.inference_mode():
+            traced = torch.jit.trace(model, torch.zeros(1, 3, 224, 224))
+        torch.jit.save(torch.jit.freeze(traced), os.path.join(root, "model.ts"))
+    shutil.copy(class_indices_path, os.path.join(root, "class_indices.json"))
+    return {
+        "PLANT_DB_PATH": os.path.join(root, "bench.db"),
+        "PLANT_MODEL_PATH": model_path,
+        "PLANT_CLASS_INDICES_PATH": os.path.join(root, "class_indices.json"),
+        "PLANT_MODEL_NAME": model_name,
+        "PLANT_MODEL_BACKEND": backend,
+        "PLANT_MODEL_REGISTRY_DIR": os.path.join(root, "registry"),
+        "PLANT_REPORT_ARTIFACT_DIR": os.path.join(root, "report_artifacts"),
+        "PLANT_EMBEDDINGS_DIR": os.path.join(root, "embeddings"),
+        "PLANT_SESSION_SECRET_PATH": os.path.join(root, "session_secret.key"),
+        "PLANT_LOG_LEVEL": "WARNING",
+    }
+
+
+# ==== Server ====
+class Server:
+    def __init__(self, mode, port, env):
+        self.mode = mode
+        self.port = port
+        self.env = env
+        self._process = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        if self.mode == "subprocess":
+            self._process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.port), "--log-level", "warning"],
+                env=dict(os.environ, **self.env))
+            return
+        # In-process: same interpreter, uvicorn on a background thread
+        os.environ.update(self.env)
+        import uvicorn
+        config = uvicorn.Config("app.main:app", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+
+    def wait_ready(self, timeout):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                status, _ = request(self.port, "GET", "/api/ready")
+                if status == 200:
+                    return True
+            except OSError:
+                pass
+            if self._process is not None and self._process.poll() is not None:
+                return False
+            time.sleep(0.2)
+        return False
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=30)
+
+
+# ==== Client ====
+_connections = threading.local()
+
+
+def request(port, method, path, body=None, headers=None):
+    """One HTTP request on a per-thread keep-alive connection; returns (status, body)."""
+    connection = getattr(_connections, "connection", None)
+    if connection is None:
+        connection = _connections.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    except (OSError, http.client.HTTPException):
+        connection.close()
+        _connections.connection = None
+        raise
+
+
+def login(port, email, password):
+    """Sign up (if needed) and log in; returns the session cookie to send with each request."""
+    form = {"Content-Type": "application/x-www-form-urlencoded"}
+    body = f"email={email}&password={password}".encode()
+    request(port, "POST", "/signup", body, form)
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        connection.request("POST", "/login", body=body, headers=form)
+        response = connection.getresponse()
+        response.read()
+        cookies = [value.split(";", 1)[0] for key, value in response.getheaders()
+                   if key.lower() == "set-cookie" and "max-age=0" not in value.lower()]
+    finally:
+        connection.close()
+    if response.status != 303 or not cookies:
+        raise RuntimeError(f"Login failed with HTTP {response.status}")
+    return "; ".join(cookies)
+
+
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n".encode())
+    for name, (filename, data) in files.items():
+        parts.append(f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+                     f"Content-Type: image/jpeg\r\n\r\n".encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+class Workload:
+    """Builds the request for each route name; every route returns (method, path, body, headers)."""
+
+    def __init__(self, images, cookie, classes):
+        self.images = images
+        self.cookie = cookie
+        self.classes = classes
+
+    def build(self, route, rng):
+        image = rng.choice(self.images)
+        if route == "predict":
+            body, headers = multipart({}, {"file": ("leaf.jpg", image)})
+            return "POST", "/predict", body, dict(headers, Cookie=self.cookie)
+        if route == "predict_report":
+            body, headers = multipart({"report": "true"}, {"file": ("leaf.jpg", image)})
+            return "POST", "/predict", body, dict(headers, Cookie=self.cookie)
+        if route == "generate_report":
+            body, headers = multipart({"prediction": rng.choice(self.classes)}, {"image": ("leaf.jpg", image)})
+            return "POST", "/generate_report", body, headers
+        if route == "aiassist":
+            body = json.dumps({"query": rng.choice(ASSIST_QUERIES)}).encode()
+            return "POST", "/api/aiassist", body, {"Content-Type": "application/json"}
+        if route == "history":
+            return "GET", "/api/history?limit=50", None, {"Cookie": self.cookie}
+        if route == "history_stats":
+            return "GET", "/api/history/stats", None, {"Cookie": self.cookie}
+        raise ValueError(f"Unknown route '{route}'")
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        route, _, weight = item.partition("=")
+        mix[route.strip()] = float(weight or 1)
+    return mix
+
+
+def run_load(port, workload, mix, concurrency, duration, warmup, seed):
+    """Closed-loop load: `concurrency` clients each send their next request as soon as the previous returns."""
+    routes, weights = list(mix), list(mix.values())
+    samples = {route: [] for route in routes}
+    errors = {route: 0 for route in routes}
+    lock = threading.Lock()
+    started = time.time()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def client(index):
+        rng = random.Random(seed + index)
+        while time.time() < stop_at:
+            route = rng.choices(routes, weights)[0]
+            method, path, body, headers = workload.build(route, rng)
+            sent = time.perf_counter()
+            try:
+                status, _ = request(port, method, path, body, headers)
+                ok = status < 400
+            except (OSError, http.client.HTTPException):
+                ok = False
+            elapsed = (time.perf_counter() - sent) * 1000.0
+            if time.time() < measure_from:
+                continue
+            with lock:
+                if ok:
+                    samples[route].append(elapsed)
+                else:
+                    errors[route] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))], 2)
+
+
+def summarize(samples, errors, duration):
+    routes = {}
+    for route, values in samples.items():
+        values = sorted(values)
+        routes[route] = {
+            "requests": len(values),
+            "errors": errors[route],
+            "throughput_rps": round(len(values) / duration, 2),
+            "mean_ms": round(statistics.fmean(values), 2) if values else None,
+            "p50_ms": percentile(values, 0.50),
+            "p95_ms": percentile(values, 0.95),
+            "p99_ms": percentile(values, 0.99),
+        }
+    total = sum(r["requests"] for r in routes.values())
+    return {"routes": routes, "total_requests": total, "total_throughput_rps": round(total / duration, 2),
+            "total_errors": sum(errors.values())}
+
+
+# ==== Regression gate ====
+def compare(result, baseline, max_regression):
+    """Routes whose p95 grew or whose throughput shrank by more than max_regression (a fraction)."""
+    failures = []
+    for route, current in result["routes"].items():
+        previous = baseline["routes"].get(route)
+        if not previous or not previous["requests"] or not current["requests"]:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            failures.append(f"{route}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - max_regression):
+            failures.append(f"{route}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if current["errors"] > previous["errors"]:
+            failures.append(f"{route}: errors {previous['errors']} -> {current['errors']}")
+    return failures
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", choices=["inprocess", "subprocess"], default="subprocess")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--model-name", default="tf_efficientnetv2_b3")
+    parser.add_argument("--backend", choices=["eager", "torchscript"], default="eager")
+    parser.add_argument("--class-indices", default="model/class_indices.json")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="route=weight,... (predict, predict_report, "
+                        "generate_report, aiassist, history, history_stats)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of load before measuring")
+    parser.add_argument("--images", type=int, default=16, help="distinct synthetic images")
+    parser.add_argument("--cache", action="store_true", help="keep the prediction cache on (off by default)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for /api/ready")
+    parser.add_argument("--output", default="", help="write results as JSON")
+    parser.add_argument("--baseline", default="", help="JSON from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="allowed p95/throughput change vs baseline")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    workspace = tempfile.mkdtemp(prefix="plant_bench_")
+    server = None
+    try:
+        print(f"🧪 Building random-init {args.model_name} ({args.backend}) in {workspace}")
+        env = build_workspace(workspace, args.model_name, args.backend, args.class_indices)
+        if not args.cache:
+            env["PLANT_CACHE_MAX_MB"] = "0"
+        images = synthetic_images(args.images, args.seed)
+        with open(args.class_indices) as f:
+            classes = list(json.load(f).values())
+
+        server = Server(args.server, args.port, env)
+        started = time.perf_counter()
+        server.start()
+        if not server.wait_ready(args.timeout):
+            sys.exit("❌ Server did not become ready")
+        ready_s = time.perf_counter() - started
+
+        cookie = login(args.port, "bench@example.com", "bench")
+        workload = Workload(images, cookie, classes)
+        print(f"🚀 Ready after {ready_s:.1f} s; {args.concurrency} clients for {args.warmup:.0f}+{args.duration:.0f} s, mix {mix}")
+
+        samples, errors = run_load(args.port, workload, mix, args.concurrency, args.duration, args.warmup, args.seed)
+        result = summarize(samples, errors, args.duration)
+    finally:
+        if server is not None:
+            server.stop()
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    result["config"] = {
+        "server": args.server, "backend": args.backend, "model_name": args.model_name, "mix": mix,
+        "concurrency": args.concurrency, "duration_s": args.duration, "cache": args.cache,
+        "images": args.images, "seed": args.seed,
+    }
+    result["environment"] = {"commit": git_commit(), "python": platform.python_version(),
+                             "machine": platform.machine(), "cpus": os.cpu_count()}
+    result["ready_s"] = round(ready_s, 2)
+
+    print(f"{'route':16s} {'req':>7s} {'err':>5s} {'req/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for route, stats in result["routes"].items():
+        print(f"{route:16s} {stats['requests']:7d} {stats['errors']:5d} {stats['throughput_rps']:8.2f} "
+              f"{stats['p50_ms'] or 0:9.1f} {stats['p95_ms'] or 0:9.1f} {stats['p99_ms'] or 0:9.1f}")
+    print(f"{'total':16s} {result['total_requests']:7d} {result['total_errors']:5d} {result['total_throughput_rps']:8.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=4)
+        print(f"📝 Wrote {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare(result, baseline, args.max_regression)
+        if failures:
+            print(f"❌ Regressed more than {args.max_regression:.0%} against {args.baseline}:")
+            for failure in failures:
+                print(f"   {failure}")
+            sys.exit(1)
+        print(f"✅ Within {args.max_regression:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
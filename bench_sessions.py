@@ -0,0 +1,98 @@
+"""Session lookup throughput as the number of live sessions grows.
+
+Creates N sessions in a throwaway database, then resolves random session
+cookies from several threads, the way request handlers do:
+  cached   every session fits in the LRU (steady state for active users)
+  cold     an LRU of --cache-size entries, so most lookups go to SQLite
+It also times one password hash at the configured scrypt cost.
+
+Usage:
+  python bench_sessions.py --sessions 1000,100000,1000000 --threads 8
+"""
+import argparse
+import os
+import random
+import secrets
+import tempfile
+import threading
+import time
+
+from app import settings
+from app.auth import SessionStore, _session_key, _sign, hash_password, verify_password
+from app.db import SQL_INSERT_SESSION, Repository
+
+SECRET = b"bench-secret"
+
+
+def fill(repo, count, secret):
+    """Insert `count` sessions in one transaction; returns their cookies."""
+    tokens, rows = [], []
+    now = time.time()
+    for i in range(count):
+        session_id = secrets.token_urlsafe(32)
+        tokens.append(f"{session_id}.{_sign(secret, session_id)}")
+        rows.append((_session_key(session_id), f"user{i}@example.com", now, now + 3600))
+    with repo.pool.transaction() as conn:
+        conn.executemany(SQL_INSERT_SESSION, rows)
+    return tokens
+
+
+def lookups_per_second(store, tokens, threads, duration):
+    done = [0] * threads
+    stop = time.perf_counter() + duration
+
+    def worker(index):
+        rng = random.Random(index)
+        count = 0
+        while time.perf_counter() < stop:
+            for _ in range(100):
+                if store.get(rng.choice(tokens)) is None:
+                    raise RuntimeError("Session lookup failed")
+            count += 100
+        done[index] = count
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(done) / duration
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", default="1000,100000,1000000")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--cache-size", type=int, default=1000, help="LRU size for the cold run")
+    args = parser.parse_args()
+
+    cost = (settings.PASSWORD_SCRYPT_N, settings.PASSWORD_SCRYPT_R, settings.PASSWORD_SCRYPT_P)
+    started = time.perf_counter()
+    stored = hash_password("correct horse", *cost)
+    hashed_ms = (time.perf_counter() - started) * 1000.0
+    started = time.perf_counter()
+    verify_password("correct horse", stored)
+    print(f"🔑 scrypt n={cost[0]} r={cost[1]} p={cost[2]}: hash {hashed_ms:.0f} ms, "
+          f"verify {(time.perf_counter() - started) * 1000.0:.0f} ms")
+
+    for count in (int(n) for n in args.sessions.split(",")):
+        with tempfile.TemporaryDirectory() as directory:
+            repo = Repository(os.path.join(directory, "sessions.db"), pool_size=args.threads)
+            started = time.perf_counter()
+            tokens = fill(repo, count, SECRET)
+            print(f"📦 {count} sessions created in {time.perf_counter() - started:.1f} s")
+            cached = SessionStore(repo, SECRET, max_entries=count, recheck_seconds=3600)
+            for token in tokens:  # warm the LRU
+                cached.get(token)
+            cached.hits = cached.misses = 0
+            rate = lookups_per_second(cached, tokens, args.threads, args.duration)
+            print(f"   cached  {rate:10.0f} lookups/s  hit rate {cached.metrics()['hit_rate']:.3f}")
+            cold = SessionStore(repo, SECRET, max_entries=args.cache_size, recheck_seconds=3600)
+            rate = lookups_per_second(cold, tokens, args.threads, args.duration)
+            print(f"   cold    {rate:10.0f} lookups/s  hit rate {cold.metrics()['hit_rate']:.3f}")
+            repo.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Profile server cold start: import time per package and time until /api/ready.
+
+Usage:
+  python bench_startup.py                     # -X importtime profile of `import app.main`
+  python bench_startup.py --top 30 --serve    # also start uvicorn and time /api/ready
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_profile(module):
+    """[(cumulative_us, self_us, depth, name)] from `python -X importtime -c 'import module'`."""
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000.0
+    if proc.returncode != 0:
+        sys.exit(f"❌ import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(cumulative_us), int(self_us), len(indent) // 2, name))
+    return rows, wall_ms
+
+
+def time_to_ready(port, timeout):
+    """Start uvicorn and poll /api/ready; returns (listening_s, ready_s)."""
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    listening = None
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/ready", timeout=1) as response:
+                    if response.status == 200:
+                        return listening or time.perf_counter() - started, time.perf_counter() - started
+            except urllib.error.HTTPError as e:
+                if e.code == 503 and listening is None:
+                    listening = time.perf_counter() - started
+            except OSError:
+                pass
+            time.sleep(0.05)
+        return listening, None
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=20, help="packages to list, by cumulative import time")
+    parser.add_argument("--serve", action="store_true", help="also measure time until /api/ready")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    rows, wall_ms = import_profile(args.module)
+    total = next((cumulative for cumulative, _, _, name in rows if name == args.module), 0)
+    print(f"🚀 import {args.module}: {total / 1000:.0f} ms imports, {wall_ms:.0f} ms process wall time")
+    # Top-level packages only; their cumulative time includes everything they pull in
+    packages = {}
+    for cumulative, _, _, name in rows:
+        root = name.split(".")[0]
+        if name == root:
+            packages[root] = max(packages.get(root, 0), cumulative)
+    for name, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"   {cumulative / 1000:8.1f} ms  {name}")
+
+    if args.serve:
+        env_backend = os.environ.get("PLANT_MODEL_BACKEND", "auto")
+        listening, ready = time_to_ready(args.port, args.timeout)
+        listening_text = f"{listening:.2f} s" if listening is not None else "n/a"
+        ready_text = f"{ready:.2f} s" if ready is not None else f"not ready after {args.timeout:.0f} s"
+        print(f"🌡️  backend={env_backend}: accepting connections after {listening_text}, ready after {ready_text}")
+
+
+if __name__ == "__main__":
+    main()
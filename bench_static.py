@@ -0,0 +1,99 @@
+"""Bytes and estimated load time of each page over a slow mobile link, before and after the asset build.
+
+For every page, follows its /static references (stylesheets, scripts, images,
+srcset candidates the browser would pick) and totals what a browser downloads:
+  source   app/static as served before the build: uncompressed, no cache headers
+  first    the built page and hashed assets with br/gzip and WebP negotiated
+  repeat   a second visit: the page revalidates (304), hashed assets come from cache
+Load time is estimated as round trips plus bytes over the link, loading up to
+6 assets in parallel like a browser does per host.
+
+Usage:
+  python -m app.assets build
+  python bench_static.py --kbps 400 --rtt-ms 300
+"""
+import argparse
+import asyncio
+import math
+import os
+import re
+
+from app import settings
+from app.assets import PageCache, StaticAssets
+
+BROWSER = {"accept": "text/html,image/avif,image/webp,*/*;q=0.8", "accept-encoding": "gzip, deflate, br"}
+REFERENCE = re.compile(r"/static/[A-Za-z0-9_.\-/]+")
+SRCSET = re.compile(r"srcset=\"([^\"]+)\"[^>]*sizes=\"(\d+)px\"")
+PARALLEL = 6
+
+
+def fetch(assets, path, headers):
+    """(status, body length) from the StaticAssets ASGI app."""
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path[len("/static/dist"):],
+             "headers": [(key.encode(), value.encode()) for key, value in headers.items()]}
+    asyncio.run(assets(scope, None, send))
+    return messages[0]["status"], len(messages[1]["body"])
+
+
+def srcset_choice(html, dpr):
+    """URLs a browser at `dpr` would load for <img srcset sizes=Npx>, instead of their src."""
+    chosen, skipped = [], set()
+    for candidates, size in SRCSET.findall(html):
+        options = sorted((int(width[:-1]), url) for url, width in (c.strip().split() for c in candidates.split(",")))
+        skipped.update(url for _, url in options)
+        chosen.append(next((url for width, url in options if width >= int(size) * dpr), options[-1][1]))
+    return chosen, skipped
+
+
+def load_time(page_bytes, asset_bytes, kbps, rtt):
+    bytes_per_s = kbps * 1000 / 8
+    rounds = 1 + (math.ceil(len(asset_bytes) / PARALLEL) if asset_bytes else 0)
+    return rounds * rtt + (page_bytes + sum(asset_bytes)) / bytes_per_s
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kbps", type=float, default=400.0, help="link bandwidth")
+    parser.add_argument("--rtt-ms", type=float, default=300.0)
+    parser.add_argument("--dpr", type=float, default=2.0, help="device pixel ratio for srcset")
+    args = parser.parse_args()
+    rtt = args.rtt_ms / 1000.0
+
+    pages = PageCache(settings.STATIC_DIST_DIR, settings.STATIC_DIR)
+    assets = StaticAssets(settings.STATIC_DIST_DIR)
+    if not pages.pages:
+        raise SystemExit("❌ No build found; run `python -m app.assets build` first")
+
+    print(f"📶 {args.kbps:.0f} kbit/s, {args.rtt_ms:.0f} ms RTT, DPR {args.dpr:g}")
+    print(f"{'page':24s} {'source':>16s} {'first visit':>18s} {'repeat visit':>18s}")
+    for name in sorted(pages.pages):
+        with open(pages.source_path(name), "rb") as f:
+            source_html = f.read().decode("utf-8")
+        source_assets = [os.path.getsize(os.path.join(settings.STATIC_DIR, ref[len("/static/"):]))
+                         for ref in dict.fromkeys(REFERENCE.findall(source_html))
+                         if os.path.isfile(os.path.join(settings.STATIC_DIR, ref[len("/static/"):]))]
+        source_page = len(source_html.encode("utf-8"))
+
+        _, page_headers, body = pages.respond(name, BROWSER)
+        built_html = pages.respond(name, {})[2].decode("utf-8")
+        chosen, replaced = srcset_choice(built_html, args.dpr)
+        references = [ref for ref in dict.fromkeys(REFERENCE.findall(built_html)) if ref not in replaced] + chosen
+        built_assets = [fetch(assets, ref, BROWSER)[1] for ref in dict.fromkeys(references)
+                        if ref.startswith("/static/dist/")]
+        revalidated = pages.respond(name, dict(BROWSER, **{"if-none-match": page_headers["etag"]}))[0]
+
+        before = load_time(source_page, source_assets, args.kbps, rtt)
+        first = load_time(len(body), built_assets, args.kbps, rtt)
+        repeat_bytes = 0 if revalidated == 304 else len(body) + sum(built_assets)
+        repeat = load_time(repeat_bytes, [], args.kbps, rtt)
+        print(f"{name:24s} {(source_page + sum(source_assets)) / 1e3:7.1f} kB {before:5.2f} s "
+              f"{(len(body) + sum(built_assets)) / 1e3:9.1f} kB {first:5.2f} s {repeat_bytes / 1e3:9.1f} kB {repeat:5.2f} s")
+
+
+if __name__ == "__main__":
+    main()
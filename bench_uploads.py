@@ -0,0 +1,126 @@
+"""Measure per-request peak memory of the upload path.
+
+For each synthetic photo size, compares
+  legacy   file.read() into bytes, decode from a BytesIO, then decode again for the report thumbnail
+  spooled  decode and thumbnail straight from the SpooledTemporaryFile Starlette already holds
+one request at a time, so the peak RSS (VmHWM after a reset) belongs to that request alone.
+It then streams an oversized body through UploadLimit and reports how much of it was read before the 413.
+
+Usage:
+  python bench_uploads.py --megapixels 3,12,24 --repeat 5
+"""
+import argparse
+import asyncio
+import io
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.preprocessing import IMAGE_SIZE, decode_image, jpeg_thumbnail, preprocess_timed, to_tensor
+from app.uploads import PeakMemory, UploadLimit
+
+SPOOL_MAX_SIZE = 1024 * 1024  # Starlette's in-memory threshold for multipart files
+
+
+def synthetic_jpeg(megapixels, seed=0):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(seed)
+    # Smooth gradients plus noise compress like a photo rather than like pure noise
+    base = np.linspace(0, 255, width, dtype=np.float32)[None, :, None] * np.ones((height, 1, 3), dtype=np.float32)
+    pixels = np.clip(base + rng.normal(0, 20, (height, width, 3)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def spooled(data):
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    spool.write(data)
+    spool.seek(0)
+    return spool
+
+
+def legacy_request(spool):
+    image_bytes = spool.read()
+    image = decode_image(io.BytesIO(image_bytes))
+    tensor = to_tensor(image.resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR))
+    thumbnail = jpeg_thumbnail(decode_image(io.BytesIO(image_bytes), size=100))
+    return tensor, thumbnail
+
+
+def spooled_request(spool):
+    tensor, thumbnail, _ = preprocess_timed(spool, with_thumbnail=True)
+    return tensor, thumbnail
+
+
+def measure(fn, data, repeat):
+    peaks, timings = [], []
+    for _ in range(repeat):
+        spool = spooled(data)
+        memory = PeakMemory()
+        if not memory.start():
+            raise SystemExit("❌ Needs Linux with a writable /proc/self/clear_refs")
+        started = time.perf_counter()
+        result = fn(spool)
+        timings.append((time.perf_counter() - started) * 1000.0)
+        peaks.append(memory.peak_bytes())
+        del result
+        spool.close()
+    return statistics.median(peaks) / 1e6, statistics.median(timings)
+
+
+async def oversized_body(limit, total, chunk):
+    """Stream `total` bytes in `chunk`-sized messages (no Content-Length) through UploadLimit."""
+    statuses = []
+
+    async def reader_app(scope, receive, send):
+        while True:
+            message = await receive()
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    sent = 0
+
+    async def receive():
+        nonlocal sent
+        size = min(chunk, total - sent)
+        sent += size
+        return {"type": "http.request", "body": b"\0" * size, "more_body": sent < total}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    middleware = UploadLimit(reader_app, {"/predict": limit})
+    await middleware({"type": "http", "path": "/predict", "headers": []}, receive, send)
+    return statuses[0], sent
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megapixels", default="3,12,24")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit-mb", type=float, default=25.0)
+    args = parser.parse_args()
+
+    for megapixels in (float(mp) for mp in args.megapixels.split(",")):
+        data = synthetic_jpeg(megapixels)
+        print(f"📷 {megapixels:.0f} MP JPEG, {len(data) / 1e6:.1f} MB upload")
+        for name, fn in (("legacy", legacy_request), ("spooled", spooled_request)):
+            peak_mb, ms = measure(fn, data, args.repeat)
+            print(f"   {name:8s} peak +{peak_mb:7.1f} MB  {ms:7.1f} ms")
+
+    limit = int(args.limit_mb * 1024 * 1024)
+    status, read = asyncio.run(oversized_body(limit, limit * 4, 64 * 1024))
+    print(f"🚧 {limit * 4 / 1e6:.0f} MB chunked body against a {limit / 1e6:.0f} MB cap: "
+          f"HTTP {status} after {read / 1e6:.1f} MB read")
+
+
+if __name__ == "__main__":
+    main()
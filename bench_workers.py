@@ -0,0 +1,188 @@
+"""Compare memory and throughput of the multi-process serving modes.
+
+Starts the server in each mode, waits until every worker is ready, drives
+/predict with concurrent clients for a fixed time and then sums RSS and PSS
+(proportional set size: shared pages are split between the processes mapping
+them, so it shows what the workers really cost together) over the process tree.
+
+Modes:
+  baseline  uvicorn --workers N, each worker with all cores and private weights
+  shared    serve.py: cores / N threads per worker, mmap-shared eager weights
+
+Usage:
+  python bench_workers.py --workers 4 --duration 30 --clients 16
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import numpy as np
+from PIL import Image
+
+
+def synthetic_jpeg(width=1024, height=768, seed=0):
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def process_tree(root_pid):
+    """root_pid and all of its descendants, from /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+
+def memory_kb(pid, field, path):
+    try:
+        with open(f"/proc/{pid}/{path}") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def wait_ready(url, workers, timeout):
+    """Poll /api/ready until enough consecutive answers are 200 to have reached every worker."""
+    deadline = time.time() + timeout
+    streak = 0
+    while time.time() < deadline and streak < workers * 4:
+        try:
+            with urllib.request.urlopen(url + "/api/ready", timeout=2):
+                streak += 1
+        except (urllib.error.URLError, OSError):
+            streak = 0
+            time.sleep(0.2)
+    return streak >= workers * 4
+
+
+def drive(url, image, clients, duration):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client():
+        while time.time() < stop_at:
+            body, content_type = multipart("file", "leaf.jpg", image)
+            request = urllib.request.Request(url + "/predict", data=body, headers={"Content-Type": content_type})
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+                elapsed = (time.perf_counter() - started) * 1000.0
+                with lock:
+                    latencies.append(elapsed)
+            except (urllib.error.URLError, OSError):
+                with lock:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def run_mode(mode, args, image):
+    env = dict(os.environ, PLANT_CACHE_MAX_MB="0", PLANT_WORKERS=str(args.workers))
+    if mode == "baseline":
+        cores = str(os.cpu_count() or 1)
+        env.update(PLANT_MMAP_WEIGHTS="0", PLANT_TORCH_THREADS=cores, PLANT_MODEL_BACKEND=args.backend)
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--workers", str(args.workers)]
+    else:
+        command = [sys.executable, "serve.py", "--port", str(args.port), "--workers", str(args.workers)]
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{args.port}"
+    try:
+        if not wait_ready(url, args.workers, args.timeout):
+            return {"mode": mode, "error": "server did not become ready"}
+        drive(url, image, args.clients, min(5.0, args.duration))  # warm every worker's allocator
+        latencies, errors = drive(url, image, args.clients, args.duration)
+        pids = process_tree(server.pid)
+        rss = sum(memory_kb(pid, "VmRSS", "status") for pid in pids)
+        pss = sum(memory_kb(pid, "Pss", "smaps_rollup") for pid in pids)
+        latencies.sort()
+        return {
+            "mode": mode,
+            "workers": args.workers,
+            "processes": len(pids),
+            "rss_mb": round(rss / 1024, 1),
+            "pss_mb": round(pss / 1024, 1),
+            "requests_per_s": round(len(latencies) / args.duration, 2),
+            "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+            "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 1) if latencies else None,
+            "errors": errors,
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--modes", default="baseline,shared")
+    parser.add_argument("--backend", default="eager", help="backend for the baseline mode")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--output", default="", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    # uvicorn --workers would otherwise race to bootstrap the registry and lose a worker on a fresh tree
+    from serve import prepare
+    prepare()
+
+    image = synthetic_jpeg()
+    results = []
+    for mode in args.modes.split(","):
+        result = run_mode(mode, args, image)
+        results.append(result)
+        if "error" in result:
+            print(f"❌ {mode}: {result['error']}")
+            continue
+        print(f"📊 {mode:8s} {result['workers']} workers: RSS {result['rss_mb']:.0f} MB, PSS {result['pss_mb']:.0f} MB, "
+              f"{result['requests_per_s']:.1f} req/s, p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+              f"{result['errors']} errors")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
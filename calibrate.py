@@ -0,0 +1,83 @@
+"""Fit a softmax temperature for the served model on train.py's validation split.
+
+Usage:
+  python calibrate.py --data-dir dataset                       # same split as train.py --seed 42
+  python calibrate.py --backend torchscript --max-images 2000
+  python -m app.registry register model/model.pth model/class_indices.json --activate   # ships the calibration
+
+Runs the validation images through the same preprocessing as the server,
+fits T by minimising the NLL of softmax(logits / T), and writes
+<model>_calibration.json (temperature plus NLL / ECE before and after), which
+the server picks up for the calibrated_confidence it returns.
+"""
+import argparse
+import json
+
+import torch
+from torch.utils.data import DataLoader, Subset
+from torchvision import datasets
+from tqdm import tqdm
+
+from app.backends import BACKENDS, load_model
+from app.calibration import calibration_path, calibration_report, fit_temperature
+from app.preprocessing import Preprocess, load_image
+from train import split_indices
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Temperature-scale the plant disease model")
+    parser.add_argument("--data-dir", default="dataset")
+    parser.add_argument("--seed", type=int, default=42, help="must match the train.py run")
+    parser.add_argument("--model-path", default="model/model.pth")
+    parser.add_argument("--class-indices", default="model/class_indices.json")
+    parser.add_argument("--model-name", default="tf_efficientnetv2_b3")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-workers", type=int, default=4)
+    parser.add_argument("--max-images", type=int, default=0, help="cap on validation images (0 = all)")
+    parser.add_argument("--output", default=None, help="default: <model>_calibration.json")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with open(args.class_indices, "r") as f:
+        index_to_class = {int(k): v for k, v in json.load(f).items()}
+    class_to_index = {name: idx for idx, name in index_to_class.items()}
+
+    dataset = datasets.ImageFolder(root=args.data_dir, transform=Preprocess(), loader=load_image)
+    _, val_idx = split_indices(dataset.targets, args.seed)
+    if args.max_images:
+        val_idx = val_idx[:args.max_images]
+    # Folder ids -> the model's class ids, by name
+    remap = torch.tensor([class_to_index.get(name, -1) for name, _ in sorted(dataset.class_to_idx.items(), key=lambda kv: kv[1])])
+    loader = DataLoader(Subset(dataset, val_idx), batch_size=args.batch_size, num_workers=args.num_workers)
+
+    device = torch.device("cpu")
+    model, artifact = load_model(args.backend, args.model_name, len(index_to_class), args.model_path, device)
+    print(f"📦 Calibrating {artifact} on {len(val_idx)} validation images")
+    all_logits, all_labels = [], []
+    with torch.inference_mode():
+        for inputs, labels in tqdm(loader, desc="🔎 Collecting logits", unit="batch"):
+            labels = remap[labels]
+            keep = labels >= 0
+            all_logits.append(model(inputs)[keep].float())
+            all_labels.append(labels[keep])
+    logits, labels = torch.cat(all_logits), torch.cat(all_labels)
+    if not len(labels):
+        raise SystemExit("❌ No validation images match class_indices.json")
+
+    temperature = fit_temperature(logits, labels)
+    report = calibration_report(logits, labels, temperature)
+    report.update({"model_path": args.model_path, "backend": args.backend, "seed": args.seed, "data_dir": args.data_dir})
+    output = args.output or calibration_path(args.model_path)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"🌡️ T = {temperature:.3f}: NLL {report['nll_before']:.4f} -> {report['nll_after']:.4f}, "
+          f"ECE {report['ece_before'] * 100:.2f}% -> {report['ece_after'] * 100:.2f}% "
+          f"(accuracy {report['accuracy']:.2f}%)")
+    print(f"📝 Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
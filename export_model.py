@@ -0,0 +1,225 @@
+"""Export model/model.pth to optimized CPU inference backends.
+
+Produces, next to the checkpoint:
+  model/model.ts       traced + frozen TorchScript (fp32), with forward_embed() for the embedding index
+  model/model.onnx     ONNX graph with a dynamic batch dimension
+  model/model_int8.ts  int8 TorchScript (dynamic or static quantization)
+  model/export_report.json  accuracy / latency comparison against eager fp32
+
+Static quantization is calibrated on a sample folder in the same ImageFolder
+layout train.py uses (one sub-folder per class). The same folder is used for
+the comparison report. Backends whose top-1 agreement with the fp32 model
+falls below --min-agreement are not installed (and any older copy of them is
+removed); the script then exits non-zero.
+
+Usage:
+  python export_model.py --calib-dir dataset_sample
+  python export_model.py --calib-dir dataset_sample --quantize dynamic --skip-onnx
+Serve a backend with PLANT_MODEL_BACKEND=torchscript|onnx|int8.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import torch
+from torch.utils.data import DataLoader, Subset
+from torchvision import datasets
+
+from app.backends import OnnxModel, backend_path, build_eager_model
+from app.preprocessing import Preprocess, load_image
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the plant disease model for CPU serving")
+    parser.add_argument("--model-path", default="model/model.pth")
+    parser.add_argument("--class-indices", default="model/class_indices.json")
+    parser.add_argument("--model-name", default="tf_efficientnetv2_b3")
+    parser.add_argument("--calib-dir", required=True, help="ImageFolder-style sample folder for calibration and the report")
+    parser.add_argument("--calib-images", type=int, default=256, help="max images used for calibration / comparison")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--quantize", choices=["static", "dynamic"], default="static")
+    parser.add_argument("--skip-onnx", action="store_true")
+    parser.add_argument("--min-agreement", type=float, default=0.98, help="required top-1 agreement with fp32")
+    parser.add_argument("--latency-runs", type=int, default=20)
+    return parser.parse_args()
+
+
+def load_calibration_set(calib_dir, class_to_index, limit, batch_size):
+    dataset = datasets.ImageFolder(root=calib_dir, transform=Preprocess(), loader=load_image)
+    # Map the sample folder's own class ids onto the model's class ids
+    remap = {}
+    for name, folder_idx in dataset.class_to_idx.items():
+        if name not in class_to_index:
+            print(f"⚠️ Class folder '{name}' is not in class_indices.json, its labels are ignored")
+        remap[folder_idx] = class_to_index.get(name, -1)
+    indices = torch.randperm(len(dataset), generator=torch.Generator().manual_seed(0))[:limit].tolist()
+    loader = DataLoader(Subset(dataset, indices), batch_size=batch_size)
+    batches = []
+    for inputs, labels in loader:
+        batches.append((inputs, torch.tensor([remap[int(l)] for l in labels])))
+    print(f"📂 Loaded {sum(len(b[1]) for b in batches)} calibration images from {calib_dir}")
+    return batches
+
+
+# ==== Exporters ====
+class EmbeddingExport(torch.nn.Module):
+    """forward() -> logits, plus forward_embed() -> (logits, pooled features) for the embedding index."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x)
+
+    def forward_embed(self, x):
+        pooled = self.model.forward_head(self.model.forward_features(x), pre_logits=True)
+        return self.model.get_classifier()(pooled), pooled
+
+
+def export_torchscript(model, path):
+    example = torch.randn(1, 3, 224, 224)
+    with torch.no_grad():
+        traced = torch.jit.trace_module(EmbeddingExport(model).eval(), {"forward": example, "forward_embed": example})
+        frozen = torch.jit.freeze(traced.eval(), preserved_attrs=["forward_embed"])
+        frozen = torch.jit.optimize_for_inference(frozen, other_methods=["forward_embed"])
+    frozen.save(path)
+    print(f"✅ TorchScript saved to {path}")
+
+
+def export_onnx(model, path):
+    example = torch.randn(1, 3, 224, 224)
+    torch.onnx.export(model, example, path, input_names=["input"], output_names=["logits"],
+                      dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}}, opset_version=17)
+    print(f"✅ ONNX graph saved to {path}")
+
+
+def quantize_dynamic(model):
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static(model, calibration_batches):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "fbgemm"
+    qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+    example = (calibration_batches[0][0][:1],)
+    prepared = prepare_fx(model, qconfig_mapping, example)
+    with torch.no_grad():
+        for inputs, _ in calibration_batches:
+            prepared(inputs)
+    return convert_fx(prepared)
+
+
+def export_int8(model, calibration_batches, mode, path):
+    quantized = quantize_static(model, calibration_batches) if mode == "static" else quantize_dynamic(model)
+    example = torch.randn(1, 3, 224, 224)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(quantized.eval(), example))
+    traced.save(path)
+    print(f"✅ int8 ({mode}) TorchScript saved to {path}")
+
+
+# ==== Comparison Report ====
+def evaluate(model, batches):
+    preds, labels = [], []
+    with torch.inference_mode():
+        for inputs, batch_labels in batches:
+            preds.append(model(inputs).argmax(dim=1))
+            labels.append(batch_labels)
+    return torch.cat(preds), torch.cat(labels)
+
+
+def measure_latency(model, batch_size, runs):
+    inputs = torch.randn(batch_size, 3, 224, 224)
+    timings = []
+    with torch.inference_mode():
+        for _ in range(3):
+            model(inputs)
+        for _ in range(runs):
+            started = time.perf_counter()
+            model(inputs)
+            timings.append((time.perf_counter() - started) * 1000.0)
+    timings.sort()
+    return {
+        "batch_size": batch_size,
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 2),
+        "images_per_s": round(batch_size * 1000.0 / statistics.mean(timings), 1),
+    }
+
+
+def build_report(backends, batches, latency_runs, batch_size):
+    reference_preds, labels = evaluate(backends["eager"], batches)
+    labelled = labels >= 0
+    report = {}
+    for name, model in backends.items():
+        preds = reference_preds if name == "eager" else evaluate(model, batches)[0]
+        report[name] = {
+            "top1_agreement": round((preds == reference_preds).float().mean().item(), 4),
+            "accuracy": round((preds[labelled] == labels[labelled]).float().mean().item(), 4) if labelled.any() else None,
+            "latency_bs1": measure_latency(model, 1, latency_runs),
+            f"latency_bs{batch_size}": measure_latency(model, batch_size, max(3, latency_runs // 4)),
+        }
+        print(f"📊 {name:12s} agreement={report[name]['top1_agreement']:.4f} "
+              f"acc={report[name]['accuracy']} p50(bs1)={report[name]['latency_bs1']['p50_ms']}ms")
+    return report
+
+
+def main():
+    args = parse_args()
+    torch.manual_seed(0)
+    with open(args.class_indices, "r") as f:
+        index_to_class = {int(k): v for k, v in json.load(f).items()}
+    class_to_index = {v: k for k, v in index_to_class.items()}
+
+    model = build_eager_model(args.model_name, len(index_to_class), args.model_path, torch.device("cpu"))
+    batches = load_calibration_set(args.calib_dir, class_to_index, args.calib_images, args.batch_size)
+
+    # Written to temp files; only backends that pass the agreement check replace the served artifacts
+    paths = {name: backend_path(name, args.model_path) for name in ("torchscript", "onnx", "int8")}
+    if args.skip_onnx:
+        del paths["onnx"]
+    staged = {name: f"{path}.{os.getpid()}.tmp" for name, path in paths.items()}
+    try:
+        export_torchscript(model, staged["torchscript"])
+        if not args.skip_onnx:
+            export_onnx(model, staged["onnx"])
+        export_int8(model, batches, args.quantize, staged["int8"])
+
+        backends = {"eager": model, "torchscript": torch.jit.load(staged["torchscript"])}
+        if not args.skip_onnx:
+            backends["onnx"] = OnnxModel(staged["onnx"])
+        backends["int8"] = torch.jit.load(staged["int8"])
+        report = build_report(backends, batches, args.latency_runs, args.batch_size)
+
+        failed = [name for name, row in report.items() if row["top1_agreement"] < args.min_agreement]
+        for name, path in paths.items():
+            if name in failed:
+                # An artifact from an earlier checkpoint must not be served in its place either
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                os.replace(staged[name], path)
+    finally:
+        for path in staged.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+    report_path = os.path.join(os.path.dirname(args.model_path) or ".", "export_report.json")
+    with open(report_path, "w") as f:
+        json.dump({"quantize": args.quantize, "min_agreement": args.min_agreement,
+                   "installed": {name: path for name, path in paths.items() if name not in failed},
+                   "rejected": failed, "backends": report}, f, indent=4)
+    print(f"\n✅ Comparison report saved to {report_path}")
+
+    if failed:
+        print(f"❌ Top-1 agreement below {args.min_agreement} for: {', '.join(failed)}; not installed")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,159 +1,292 @@
+import copy
 import io
 import json
 import os
 import re
-import yaml
+import threading
+import zlib
 from PIL import Image
-import qrcode
-import matplotlib.pyplot as plt
 from fpdf import FPDF
 from fastapi.responses import StreamingResponse
 
+# ==== Report Engine ====
+# Everything in the report except the thumbnail, timestamp and confidence is the
+# same for every request of a given class. The engine therefore:
+#   * reads disease_info.json / train/config.yaml and renders the chart once
+#   * keeps the chart and per-class QR codes as pre-encoded image objects in memory
+#   * builds one FPDF "template" per class holding all static sections and
+#     deep-copies it per request, only drawing the dynamic fields on top
+# Images are handed to FPDF as already-parsed image dicts, so nothing is
+# written to temp files (the old temp_qr.png/temp_chart.png raced between requests).
+# yaml, qrcode and matplotlib are imported on first use so importing this module
+# (and app.main) does not pay for the plotting stack.
+
+INFO_PATH = os.path.join("report", "disease_info.json")
+CONFIG_PATH = "train/config.yaml"
+CHART_LABELS = ['Nitrogen', 'Water', 'Humidity', 'Temp']
+CHART_VALUES = [80, 60, 75, 65]  # Example
+CHART_COLORS = ['#2E8B57', '#1E90FF', '#FFA500', '#8A2BE2']
+SUMMARY_KEYS = ["symptoms", "causes", "treatment", "fertilizer", "water", "soil", "humidity", "temperature"]
+
 def remove_special_chars(text):
     return re.sub(r'[^\x00-\x7F]+', ' ', text)
 
-def generate_pdf_report(class_name, image_bytes, dt, confidence=0.0):
-    # Load disease info
-    info_path = os.path.join("report", "disease_info.json")
-    with open(info_path, "r", encoding="utf-8") as f:
-        disease_info = json.load(f)
-    info = disease_info.get(class_name, {})
+def pdf_image(image, jpeg_quality=None):
+    """Encode a PIL image as an FPDF image dict (RGB, Flate or DCT compressed)."""
+    image = image.convert("RGB")
+    width, height = image.size
+    if jpeg_quality:
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=jpeg_quality)
+        return {'w': width, 'h': height, 'cs': 'DeviceRGB', 'bpc': 8, 'f': 'DCTDecode', 'data': buffer.getvalue()}
+    return {'w': width, 'h': height, 'cs': 'DeviceRGB', 'bpc': 8, 'f': 'FlateDecode',
+            'data': zlib.compress(image.tobytes())}
 
+def load_model_name():
     # Load model name with fallback
-    config_path = "train/config.yaml"
-    if os.path.exists(config_path):
-        with open(config_path, "r") as f:
+    if os.path.exists(CONFIG_PATH):
+        import yaml
+        with open(CONFIG_PATH, "r") as f:
             config = yaml.safe_load(f)
-        model_name = config.get("model_name", "Unknown")
-    else:
-        model_name = "EfficientNetV2-B3"
-
-    pdf = FPDF()
-    pdf.add_page()
-
-    # Outer border for page 1
-    pdf.set_draw_color(0, 0, 0)
-    pdf.set_line_width(0.8)
-    pdf.rect(5, 5, 200, 287)
-
-    # Header
-    pdf.set_fill_color(180, 238, 180)
-    pdf.rect(6, 6, 198, 18, 'F')
-    pdf.set_xy(6, 10)
-    pdf.set_font("Arial", 'B', 16)
-    pdf.set_text_color(0, 60, 0)
-    pdf.cell(198, 10, "Plant Disease Detection Report", ln=True, align='C')
-    pdf.set_font("Arial", '', 12)
-    pdf.set_text_color(0, 100, 0)
-    pdf.set_xy(6, 18)
-    pdf.cell(198, 8, f"Confidence Score: {confidence:.2f}%", ln=True, align='C')
-    pdf.set_text_color(0, 0, 0)
-
-    # QR Code
+        return config.get("model_name", "Unknown")
+    return "EfficientNetV2-B3"
+
+def render_chart():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=(4, 2))
+    plt.bar(CHART_LABELS, CHART_VALUES, color=CHART_COLORS)
+    plt.title('Environmental Factors Overview')
+    plt.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    plt.close(fig)
+    buffer.seek(0)
+    return pdf_image(Image.open(buffer))
+
+def render_qr(class_name):
+    import qrcode
     qr_url = f"https://www.google.com/search?q={remove_special_chars(class_name)}+plant+disease"
-    qr = qrcode.make(qr_url)
-    qr_path = "temp_qr.png"
-    qr.save(qr_path)
-    pdf.image(qr_path, x=12, y=26, w=40)
-    os.remove(qr_path)
-
-    # Uploaded image
-    if image_bytes:
-        try:
-            img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            img_path = "temp_image.jpg"
-            img.thumbnail((100, 100))
-            img.save(img_path, "JPEG", quality=95)
-            pdf.image(img_path, x=158, y=26, w=40)
-            os.remove(img_path)
-        except Exception as e:
-            pdf.set_text_color(255, 0, 0)
-            pdf.set_font("Arial", size=10)
-            pdf.cell(0, 10, f"Image error: {e}", ln=True)
-            pdf.set_text_color(0, 0, 0)
-
-    # Details
-    pdf.set_y(72)
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 8, f"Class: {remove_special_chars(class_name)}", ln=True)
-    pdf.set_font("Arial", '', 12)
-    pdf.cell(0, 8, f"Confidence Score: {confidence:.2f}%", ln=True)
-    pdf.cell(0, 8, f"Date: {remove_special_chars(dt)}", ln=True)
-    pdf.cell(0, 8, f"Model: {remove_special_chars(model_name)}", ln=True)
-    pdf.ln(3)
-
-    # Summary
-    pdf.set_font("Arial", 'B', 14)
-    pdf.set_fill_color(220, 220, 220)
-    pdf.cell(0, 8, "Summary", ln=True, fill=True)
-    pdf.set_font("Arial", '', 12)
-    summary_keys = ["symptoms", "causes", "treatment", "fertilizer", "water", "soil", "humidity", "temperature"]
-    for key in summary_keys:
-        if key in info:
-            value = remove_special_chars(info[key])[:80]
-            pdf.cell(45, 7, f"{key.capitalize()}:", border=1)
-            pdf.cell(0, 7, value, border=1, ln=True)
-    pdf.ln(2)
-
-    # Overview
-    pdf.set_font("Arial", 'B', 14)
-    pdf.set_fill_color(220, 255, 220)
-    pdf.cell(0, 8, "Disease Overview", ln=True, fill=True)
-    pdf.set_font("Arial", '', 12)
-    for key in ["symptoms", "causes", "treatment"]:
-        if key in info:
-            pdf.multi_cell(0, 7, f"{key.capitalize()}: {remove_special_chars(info[key])}")
-    pdf.ln(1)
-
-    # Growing Conditions
-    pdf.set_font("Arial", 'B', 14)
-    pdf.set_fill_color(220, 255, 220)
-    pdf.cell(0, 8, "Growing Conditions", ln=True, fill=True)
-    pdf.set_font("Arial", '', 12)
-    for key in ["fertilizer", "water", "soil", "humidity", "temperature"]:
-        if key in info:
-            pdf.multi_cell(0, 7, f"{key.capitalize()}: {remove_special_chars(info[key])}")
-    pdf.ln(1)
-
-    # Tips
-    if "tips" in info:
+    return pdf_image(qrcode.make(qr_url).get_image())
+
+
+class ReportPDF(FPDF):
+    def memory_image(self, name, info, x=None, y=None, w=0, h=0):
+        """Place a pre-encoded image; FPDF reuses self.images entries without touching the filesystem."""
+        if name not in self.images:
+            info = dict(info)
+            info['i'] = len(self.images) + 1
+            self.images[name] = info
+        self.image(name, x=x, y=y, w=w, h=h)
+
+
+class ReportEngine:
+    def __init__(self, precompute=True):
+        self.precompute = precompute
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._qr_codes = {}
+        self.disease_info = {}
+        self.model_name = None
+        self.chart = None
+        if precompute:
+            self._load_static()
+            for class_name in self.disease_info:
+                self._qr_codes[class_name] = render_qr(class_name)
+
+    def _load_static(self):
+        with open(INFO_PATH, "r", encoding="utf-8") as f:
+            disease_info = json.load(f)
+        self.disease_info = {name: {k: remove_special_chars(v) for k, v in info.items()}
+                             for name, info in disease_info.items()}
+        self.model_name = remove_special_chars(load_model_name())
+        self.chart = render_chart()
+
+    def _qr(self, class_name):
+        # Only known classes are cached: the name comes from a client-supplied form field
+        if class_name not in self.disease_info:
+            return render_qr(class_name)
+        if class_name not in self._qr_codes:
+            self._qr_codes[class_name] = render_qr(class_name)
+        return self._qr_codes[class_name]
+
+    def template(self, class_name):
+        """Static sections for one class, built on first use and cached (known classes only)."""
+        if not self.precompute:
+            # Uncached path: reload and re-render every asset, as the original generator did
+            self._load_static()
+            self._qr_codes.pop(class_name, None)
+            return self._build_template(class_name)
+        if class_name not in self.disease_info:
+            # Arbitrary names would grow the cache without bound, so they are rendered every time
+            return self._build_template(class_name)
+        with self._lock:
+            if class_name not in self._templates:
+                self._templates[class_name] = self._build_template(class_name)
+            return self._templates[class_name]
+
+    def _build_template(self, class_name):
+        info = self.disease_info.get(class_name, {})
+        pdf = ReportPDF()
+        pdf.add_page()
+
+        # Outer border for page 1
+        pdf.set_draw_color(0, 0, 0)
+        pdf.set_line_width(0.8)
+        pdf.rect(5, 5, 200, 287)
+
+        # Header
+        pdf.set_fill_color(180, 238, 180)
+        pdf.rect(6, 6, 198, 18, 'F')
+        pdf.set_xy(6, 10)
+        pdf.set_font("Arial", 'B', 16)
+        pdf.set_text_color(0, 60, 0)
+        pdf.cell(198, 10, "Plant Disease Detection Report", ln=True, align='C')
+        pdf.set_text_color(0, 0, 0)
+
+        # QR Code
+        pdf.memory_image(f"qr:{class_name}", self._qr(class_name), x=12, y=26, w=40)
+
+        # Details (confidence and date lines are left blank, see render())
+        pdf.set_y(72)
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(0, 8, f"Class: {remove_special_chars(class_name)}", ln=True)
+        pdf.set_font("Arial", '', 12)
+        pdf.ln(16)
+        pdf.cell(0, 8, f"Model: {self.model_name}", ln=True)
+        pdf.ln(3)
+
+        # Summary
+        pdf.set_font("Arial", 'B', 14)
+        pdf.set_fill_color(220, 220, 220)
+        pdf.cell(0, 8, "Summary", ln=True, fill=True)
+        pdf.set_font("Arial", '', 12)
+        for key in SUMMARY_KEYS:
+            if key in info:
+                pdf.cell(45, 7, f"{key.capitalize()}:", border=1)
+                pdf.cell(0, 7, info[key][:80], border=1, ln=True)
+        pdf.ln(2)
+
+        # Overview
         pdf.set_font("Arial", 'B', 14)
         pdf.set_fill_color(220, 255, 220)
-        pdf.cell(0, 8, "Tips", ln=True, fill=True)
+        pdf.cell(0, 8, "Disease Overview", ln=True, fill=True)
         pdf.set_font("Arial", '', 12)
-        pdf.multi_cell(0, 7, remove_special_chars(info["tips"]))
-
-    # Chart
-    chart_labels = ['Nitrogen', 'Water', 'Humidity', 'Temp']
-    chart_values = [80, 60, 75, 65]  # Example
-    colors = ['#2E8B57', '#1E90FF', '#FFA500', '#8A2BE2']
-    plt.figure(figsize=(4, 2))
-    plt.bar(chart_labels, chart_values, color=colors)
-    plt.title('Environmental Factors Overview')
-    plt.tight_layout()
-    chart_path = "temp_chart.png"
-    plt.savefig(chart_path)
-    plt.close()
-
-    pdf.add_page()
-    pdf.set_draw_color(0, 0, 0)
-    pdf.set_line_width(0.8)
-    pdf.rect(5, 5, 200, 287)
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 10, "Environmental Insight Chart", ln=True)
-    pdf.image(chart_path, x=40, w=130)
-    os.remove(chart_path)
-    pdf.set_font("Arial", '', 12)
-    pdf.multi_cell(0, 7, "This chart visually summarizes the general environmental requirements for healthy plant growth such as nitrogen, water, humidity, and temperature. These conditions play a critical role in either promoting or preventing plant diseases.")
-
-    # Footer
-    pdf.set_y(-15)
-    pdf.set_font("Arial", 'I', 10)
-    pdf.set_text_color(100, 100, 100)
-    pdf.cell(0, 10, "Generated by Plant Disease Detector", 0, 0, 'C')
-
-    # Output
-    pdf_bytes = pdf.output(dest='S').encode('latin1')
+        for key in ["symptoms", "causes", "treatment"]:
+            if key in info:
+                pdf.multi_cell(0, 7, f"{key.capitalize()}: {info[key]}")
+        pdf.ln(1)
+
+        # Growing Conditions
+        pdf.set_font("Arial", 'B', 14)
+        pdf.set_fill_color(220, 255, 220)
+        pdf.cell(0, 8, "Growing Conditions", ln=True, fill=True)
+        pdf.set_font("Arial", '', 12)
+        for key in ["fertilizer", "water", "soil", "humidity", "temperature"]:
+            if key in info:
+                pdf.multi_cell(0, 7, f"{key.capitalize()}: {info[key]}")
+        pdf.ln(1)
+
+        # Tips
+        if "tips" in info:
+            pdf.set_font("Arial", 'B', 14)
+            pdf.set_fill_color(220, 255, 220)
+            pdf.cell(0, 8, "Tips", ln=True, fill=True)
+            pdf.set_font("Arial", '', 12)
+            pdf.multi_cell(0, 7, info["tips"])
+
+        # Chart
+        pdf.add_page()
+        pdf.set_draw_color(0, 0, 0)
+        pdf.set_line_width(0.8)
+        pdf.rect(5, 5, 200, 287)
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(0, 10, "Environmental Insight Chart", ln=True)
+        pdf.memory_image("chart", self.chart, x=40, w=130)
+        pdf.set_font("Arial", '', 12)
+        pdf.multi_cell(0, 7, "This chart visually summarizes the general environmental requirements for healthy plant growth such as nitrogen, water, humidity, and temperature. These conditions play a critical role in either promoting or preventing plant diseases.")
+
+        # Footer
+        pdf.set_y(-15)
+        pdf.set_font("Arial", 'I', 10)
+        pdf.set_text_color(100, 100, 100)
+        pdf.cell(0, 10, "Generated by Plant Disease Detector", 0, 0, 'C')
+        return pdf
+
+    def render(self, class_name, image_bytes, dt, confidence=0.0, thumbnail=None):
+        """Copy the class template and draw the per-request fields onto page 1.
+
+        `image_bytes` may also be a file object (a spooled upload). `thumbnail` may
+        be an already-decoded PIL image, which skips decoding image_bytes.
+        """
+        pdf = copy.deepcopy(self.template(class_name))
+        last_page = pdf.page
+        pdf.page = 1
+
+        # Header confidence
+        pdf.set_font("Arial", '', 12)
+        pdf.set_text_color(0, 100, 0)
+        pdf.set_xy(6, 18)
+        pdf.cell(198, 8, f"Confidence Score: {confidence:.2f}%", align='C')
+        pdf.set_text_color(0, 0, 0)
+
+        # Uploaded image
+        if thumbnail is not None or image_bytes:
+            try:
+                if thumbnail is not None:
+                    img = thumbnail.copy()
+                else:
+                    img = Image.open(image_source(image_bytes))
+                    img.draft("RGB", (100, 100))  # JPEG: decode at reduced size
+                img.thumbnail((100, 100))
+                pdf.memory_image("thumbnail", pdf_image(img, jpeg_quality=95), x=158, y=26, w=40)
+            except Exception as e:
+                pdf.set_text_color(255, 0, 0)
+                pdf.set_font("Arial", size=10)
+                pdf.set_xy(60, 40)
+                pdf.cell(95, 10, remove_special_chars(f"Image error: {e}")[:60])
+                pdf.set_text_color(0, 0, 0)
+
+        # Details
+        pdf.set_font("Arial", '', 12)
+        pdf.set_xy(pdf.l_margin, 80)
+        pdf.cell(0, 8, f"Confidence Score: {confidence:.2f}%")
+        pdf.set_xy(pdf.l_margin, 88)
+        pdf.cell(0, 8, f"Date: {remove_special_chars(dt)}")
+
+        pdf.page = last_page
+        return pdf.output(dest='S').encode('latin1')
+
+
+def image_source(image):
+    """Bytes become a BytesIO; spooled upload files are rewound and read in place instead of copied."""
+    if isinstance(image, (bytes, bytearray)):
+        return io.BytesIO(image)
+    image.seek(0)
+    return image
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_report_engine():
+    """Process-wide engine, built on first use (call at startup to pay the cost up front)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ReportEngine()
+        return _engine
+
+def render_pdf_report(class_name, image_bytes, dt, confidence=0.0):
+    """Build the report and return the raw PDF bytes (picklable, so it can run in a process pool)."""
+    return get_report_engine().render(class_name, image_bytes, dt, confidence)
+
+def pdf_response(pdf_bytes):
     return StreamingResponse(io.BytesIO(pdf_bytes), media_type="application/pdf", headers={
         "Content-Disposition": f"attachment; filename=plant_report.pdf"
     })
+
+def generate_pdf_report(class_name, image_bytes, dt, confidence=0.0):
+    pdf_bytes = render_pdf_report(class_name, image_bytes, dt, confidence)
+    return pdf_response(pdf_bytes)
@@ -0,0 +1,84 @@
+"""Launch the API with several uvicorn worker processes sized to this machine.
+
+Each worker gets cores / workers intra-op threads, and by default loads the
+eager model with memory-mapped weights (PLANT_MMAP_WEIGHTS), so the workers
+share one copy of the weights through the page cache instead of each holding
+its own. Migrations and the model registry bootstrap run once here, before
+the workers start, so they don't race each other.
+
+Usage:
+  python serve.py                             # workers = cores / --threads-per-worker
+  python serve.py --workers 4 --port 8000
+"""
+import argparse
+import os
+import sys
+
+
+def available_memory_mb():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+def choose_workers(threads_per_worker, worker_mem_mb):
+    """As many workers as there are thread groups of cores, capped by available memory."""
+    cores = os.cpu_count() or 1
+    workers = max(1, cores // max(1, threads_per_worker))
+    memory = available_memory_mb()
+    if memory is not None and worker_mem_mb > 0:
+        workers = min(workers, max(1, memory // worker_mem_mb))
+    return workers
+
+
+def prepare():
+    """One-off setup shared by every worker: schema migrations and the registry's first version."""
+    from app import settings
+    from app.db import ConnectionPool, migrate
+    from app.registry import ModelRegistry
+
+    pool = ConnectionPool(settings.DB_PATH, size=1)
+    migrate(pool)
+    pool.close()
+    registry = ModelRegistry(settings.MODEL_REGISTRY_DIR)
+    if registry.active_version() is None:
+        version = registry.register(settings.MODEL_PATH, settings.CLASS_INDICES_PATH, note="bootstrapped from MODEL_PATH")
+        print(f"✅ Registered {settings.MODEL_PATH} as model version {version}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process Plant Doctor server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=0, help="0 = choose from cores and memory")
+    parser.add_argument("--threads-per-worker", type=int, default=2, help="intra-op threads per worker when --workers is 0")
+    parser.add_argument("--worker-mem-mb", type=int, default=400, help="memory budget per worker when choosing the count")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    workers = args.workers or choose_workers(args.threads_per_worker, args.worker_mem_mb)
+    threads = max(1, cores // workers)
+    os.environ["PLANT_WORKERS"] = str(workers)
+    os.environ.setdefault("PLANT_TORCH_THREADS", str(threads))
+    # OpenMP/MKL read these when torch is imported, before settings are applied
+    os.environ.setdefault("OMP_NUM_THREADS", os.environ["PLANT_TORCH_THREADS"])
+    os.environ.setdefault("MKL_NUM_THREADS", os.environ["PLANT_TORCH_THREADS"])
+    if workers > 1:
+        # Frozen TorchScript weights are private to each process; eager + mmap shares them
+        os.environ.setdefault("PLANT_MODEL_BACKEND", "eager")
+
+    prepare()
+    print(f"🚀 Starting {workers} worker(s) x {os.environ['PLANT_TORCH_THREADS']} thread(s) on {cores} cores, "
+          f"backend={os.environ.get('PLANT_MODEL_BACKEND', 'auto')}")
+    command = [sys.executable, "-m", "uvicorn", "app.main:app",
+               "--host", args.host, "--port", str(args.port), "--workers", str(workers)]
+    os.execv(sys.executable, command)
+
+
+if __name__ == "__main__":
+    main()
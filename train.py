@@ -1,85 +1,417 @@
+"""Train the plant disease classifier.
+
+Usage:
+  python train.py                                         # defaults match the original script
+  python train.py --num-workers 8 --cache-shards cache/train_224.u8 --bf16 --channels-last
+  python train.py --compile --epochs 10 --batch-size 32
+  python train.py --resume --save-every 200 --patience 3    # pick up an interrupted run
+
+Data loading runs in worker processes and hands uint8 images to the main process,
+which normalizes each batch in one vectorized op. With --cache-shards, every image
+is decoded and resized once into a memory-mapped uint8 file and later epochs read
+straight from it, without touching a JPEG decoder.
+
+Full training state (model, optimizer, scheduler, RNG, position in the epoch) is
+written atomically to --checkpoint-dir every --save-every steps and at each epoch
+end. Every epoch is validated; whenever validation accuracy improves the weights
+are exported to --model-save-path in the plain state_dict format app/main.py loads.
+"""
+import argparse
+import hashlib
+import json
 import os
+import random
+import time
+
+import numpy as np
 import torch
 import timm
-import json
 from tqdm import tqdm
 from torch import nn, optim
-from torchvision import datasets, transforms
-from torch.utils.data import DataLoader
+from torchvision import datasets
+from torch.utils.data import DataLoader, Dataset, Sampler, Subset
 from sklearn.model_selection import train_test_split
+from app.preprocessing import IMAGE_SIZE, MEAN, STD, load_image
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the plant disease classifier")
+    parser.add_argument("--data-dir", default="dataset")
+    parser.add_argument("--model-name", default="tf_efficientnetv2_b3")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--lr", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--model-save-path", default="model/model.pth")
+    parser.add_argument("--index-json-path", default="model/class_indices.json")
+    parser.add_argument("--no-pretrained", action="store_true", help="start from random weights")
+    # Data loading
+    parser.add_argument("--num-workers", type=int, default=min(8, os.cpu_count() or 1))
+    parser.add_argument("--prefetch-factor", type=int, default=4, help="batches prefetched per worker")
+    parser.add_argument("--cache-shards", default=None,
+                        help="path of a memory-mapped uint8 shard file; built on first use")
+    # Compute
+    parser.add_argument("--bf16", action="store_true", help="bfloat16 autocast (CPU or CUDA)")
+    parser.add_argument("--channels-last", action="store_true", help="NHWC memory format for conv layers")
+    parser.add_argument("--compile", action="store_true", help="wrap the model in torch.compile")
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = torch default)")
+    # Checkpointing / validation
+    parser.add_argument("--checkpoint-dir", default="checkpoints")
+    parser.add_argument("--save-every", type=int, default=500, help="steps between checkpoints (0 = epoch end only)")
+    parser.add_argument("--resume", action="store_true", help="continue from checkpoint-dir/last.pt if present")
+    parser.add_argument("--scheduler", choices=["constant", "cosine"], default="constant")
+    parser.add_argument("--patience", type=int, default=0, help="stop after N epochs without val improvement (0 = off)")
+    parser.add_argument("--min-delta", type=float, default=0.0, help="val accuracy gain (%%) that counts as improvement")
+    return parser.parse_args()
+
+
+# --- Datasets ---
+def to_uint8_chw(image):
+    """Dataset transform: keep pixels as uint8 so workers ship 4x less data than float tensors."""
+    return torch.from_numpy(np.asarray(image, dtype=np.uint8)).permute(2, 0, 1).contiguous()
+
+
+class ShardDataset(Dataset):
+    """Preprocessed (N, 3, H, W) uint8 images in one memory-mapped file, plus labels."""
+
+    def __init__(self, path):
+        with open(path + ".json", "r") as f:
+            self.meta = json.load(f)
+        shape = (self.meta["count"], 3, self.meta["size"], self.meta["size"])
+        self.images = np.memmap(path, dtype=np.uint8, mode="r", shape=shape)
+        self.targets = np.load(path + ".labels.npy")
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, idx):
+        return torch.from_numpy(np.array(self.images[idx])), int(self.targets[idx])
+
+
+def dataset_fingerprint(dataset):
+    files = hashlib.sha1("\n".join(path for path, _ in dataset.samples).encode()).hexdigest()
+    return {"count": len(dataset.samples), "classes": dataset.classes, "size": IMAGE_SIZE, "files": files}
+
+
+def build_shards(dataset, path, num_workers, batch_size=64):
+    """Decode + resize every image once and write it into a memory-mapped uint8 file."""
+    fingerprint = dataset_fingerprint(dataset)
+    if os.path.exists(path) and os.path.exists(path + ".json"):
+        with open(path + ".json", "r") as f:
+            if json.load(f) == fingerprint:
+                print(f"📦 Reusing shard cache {path}")
+                return ShardDataset(path)
+        print(f"📦 Dataset changed, rebuilding shard cache {path}")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    images = np.memmap(path, dtype=np.uint8, mode="w+", shape=(len(dataset), 3, IMAGE_SIZE, IMAGE_SIZE))
+    labels = np.empty(len(dataset), dtype=np.int64)
+    loader = DataLoader(dataset, batch_size=batch_size, num_workers=num_workers)
+    offset = 0
+    for batch, batch_labels in tqdm(loader, desc="📦 Building shard cache", unit="batch"):
+        images[offset:offset + len(batch)] = batch.numpy()
+        labels[offset:offset + len(batch)] = batch_labels.numpy()
+        offset += len(batch)
+    images.flush()
+    np.save(path + ".labels.npy", labels)
+    with open(path + ".json", "w") as f:
+        json.dump(fingerprint, f)
+    return ShardDataset(path)
+
+
+class ResumableSampler(Sampler):
+    """Seeded per-epoch shuffle that can start part-way through an epoch without loading skipped batches."""
+
+    def __init__(self, size, seed, batch_size):
+        self.size = size
+        self.seed = seed
+        self.batch_size = batch_size
+        self.epoch = 0
+        self.start_batch = 0
+
+    def set_position(self, epoch, start_batch=0):
+        self.epoch = epoch
+        self.start_batch = start_batch
+
+    def __iter__(self):
+        order = torch.randperm(self.size, generator=torch.Generator().manual_seed(self.seed + self.epoch))
+        return iter(order[self.start_batch * self.batch_size:].tolist())
+
+    def __len__(self):
+        return max(0, self.size - self.start_batch * self.batch_size)
+
+
+def split_indices(targets, seed, val_fraction=0.2):
+    """Stratified (train, val) index split; calibrate.py reuses it to get the same validation images."""
+    return train_test_split(list(range(len(targets))), test_size=val_fraction, stratify=targets, random_state=seed)
+
+
+def make_loader(dataset, args, pin_memory, sampler=None):
+    kwargs = {}
+    if args.num_workers > 0:
+        kwargs = {"prefetch_factor": args.prefetch_factor, "persistent_workers": True}
+    return DataLoader(dataset, batch_size=args.batch_size, sampler=sampler, num_workers=args.num_workers,
+                      pin_memory=pin_memory, **kwargs)
+
+
+class Normalizer:
+    """uint8 NCHW batch -> normalized float batch in a single fused multiply-add."""
+
+    def __init__(self, device, channels_last):
+        std = torch.tensor(STD, device=device).view(1, 3, 1, 1)
+        mean = torch.tensor(MEAN, device=device).view(1, 3, 1, 1)
+        self.scale = 1.0 / (255.0 * std)
+        self.shift = -mean / std
+        self.memory_format = torch.channels_last if channels_last else torch.contiguous_format
+
+    def __call__(self, batch):
+        batch = batch.to(self.scale.device, non_blocking=True)
+        batch = torch.addcmul(self.shift, batch.float(), self.scale)
+        return batch.contiguous(memory_format=self.memory_format)
 
-# --- Parameters ---
-data_dir = "dataset"
-model_name = "tf_efficientnetv2_b3"
-batch_size = 16
-epochs = 5
-lr = 0.001
-model_save_path = "model/model.pth"
-index_json_path = "model/class_indices.json"
-
-# --- Transforms ---
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],
-                         [0.229, 0.224, 0.225])
-])
-
-# --- Dataset ---
-print("📂 Loading dataset...")
-full_dataset = datasets.ImageFolder(root=data_dir, transform=transform)
-class_to_idx = full_dataset.class_to_idx
-idx_to_class = {v: k for k, v in class_to_idx.items()}
-
-# Save class_indices.json
-os.makedirs("model", exist_ok=True)
-with open(index_json_path, "w") as f:
-    json.dump(idx_to_class, f, indent=4)
-
-# --- Split dataset ---
-train_idx, val_idx = train_test_split(list(range(len(full_dataset))), test_size=0.2, stratify=full_dataset.targets)
-train_subset = torch.utils.data.Subset(full_dataset, train_idx)
-val_subset = torch.utils.data.Subset(full_dataset, val_idx)
-
-train_loader = DataLoader(train_subset, batch_size=batch_size, shuffle=True)
-val_loader = DataLoader(val_subset, batch_size=batch_size)
-
-# --- Load EfficientNetV2 ---
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = timm.create_model(model_name, pretrained=True, num_classes=len(class_to_idx))
-model.to(device)
-
-# --- Loss & Optimizer ---
-criterion = nn.CrossEntropyLoss()
-optimizer = optim.Adam(model.parameters(), lr=lr)
-
-# --- Training loop ---
-print(f"\n🚀 Starting training with {model_name} for {epochs} epochs on {len(class_to_idx)} classes...")
-
-for epoch in range(epochs):
-    model.train()
-    total_loss, correct = 0, 0
-    print(f"\n🔁 Epoch {epoch+1}/{epochs}")
 
-    for batch_idx, (inputs, labels) in enumerate(tqdm(train_loader, desc="🧪 Training", unit="batch")):
-        inputs, labels = inputs.to(device), labels.to(device)
+# --- Checkpoints ---
+def atomic_save(obj, path):
+    tmp_path = path + ".tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
 
-        optimizer.zero_grad()
-        outputs = model(inputs)
-        loss = criterion(outputs, labels)
+
+def rng_state():
+    state = {"torch": torch.get_rng_state(), "numpy": np.random.get_state(), "python": random.getstate()}
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state):
+    torch.set_rng_state(state["torch"])
+    np.random.set_state(state["numpy"])
+    random.setstate(state["python"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+class Checkpointer:
+    def __init__(self, directory, model, optimizer, scheduler, model_save_path):
+        self.directory = directory
+        self.model = model
+        self.optimizer = optimizer
+        self.scheduler = scheduler
+        self.model_save_path = model_save_path
+        os.makedirs(directory, exist_ok=True)
+        self.last_path = os.path.join(directory, "last.pt")
+        self.best_path = os.path.join(directory, "best.pt")
+
+    def state(self, epoch, batch, step, best_acc, stale_epochs, history):
+        return {
+            "model": self.model.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "scheduler": self.scheduler.state_dict(),
+            "rng": rng_state(),
+            "epoch": epoch,            # epoch in progress
+            "batch": batch,            # batches of that epoch already trained
+            "step": step,
+            "best_acc": best_acc,
+            "stale_epochs": stale_epochs,
+            "history": history,
+        }
+
+    def save(self, **position):
+        atomic_save(self.state(**position), self.last_path)
+
+    def save_best(self, **position):
+        atomic_save(self.state(**position), self.best_path)
+        # Plain state_dict + class_indices.json is exactly what app/main.py loads
+        atomic_save(self.model.state_dict(), self.model_save_path)
+
+    def load(self, device):
+        if not os.path.exists(self.last_path):
+            return None
+        checkpoint = torch.load(self.last_path, map_location=device, weights_only=False)
+        self.model.load_state_dict(checkpoint["model"])
+        self.optimizer.load_state_dict(checkpoint["optimizer"])
+        self.scheduler.load_state_dict(checkpoint["scheduler"])
+        restore_rng_state(checkpoint["rng"])
+        return checkpoint
+
+
+# --- Training ---
+def train_one_epoch(model, loader, normalize, criterion, optimizer, scheduler, device, autocast, epoch, epochs,
+                    start_batch=0, on_step=None):
+    model.train()
+    total_loss, correct, seen = 0.0, 0, 0
+    data_time, compute_time = 0.0, 0.0
+    started = time.perf_counter()
+    batch_end = started
+    progress = tqdm(loader, desc=f"🧪 Epoch {epoch + 1}/{epochs}", unit="batch",
+                    initial=start_batch, total=start_batch + len(loader))
+    for batch_idx, (inputs, labels) in enumerate(progress, start=start_batch):
+        data_ready = time.perf_counter()
+        data_time += data_ready - batch_end
+
+        inputs = normalize(inputs)
+        labels = labels.to(device, non_blocking=True)
+        optimizer.zero_grad(set_to_none=True)
+        with autocast():
+            outputs = model(inputs)
+            loss = criterion(outputs, labels)
         loss.backward()
         optimizer.step()
+        scheduler.step()
+
+        total_loss += loss.item() * len(labels)
+        correct += (outputs.argmax(dim=1) == labels).sum().item()
+        seen += len(labels)
+        batch_end = time.perf_counter()
+        compute_time += batch_end - data_ready
+        progress.set_postfix(loss=f"{total_loss / seen:.4f}", acc=f"{100 * correct / seen:.2f}%")
+        if on_step is not None:
+            on_step(batch_idx + 1)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "loss": total_loss / max(seen, 1),
+        "accuracy": 100 * correct / max(seen, 1),
+        "images_per_s": seen / elapsed if elapsed else 0.0,
+        "data_wait_s": data_time,
+        "compute_s": compute_time,
+    }
+
+
+@torch.inference_mode()
+def validate(model, loader, normalize, criterion, device, autocast, num_classes):
+    """Loss, accuracy and a (true x predicted) confusion matrix, accumulated on-device per batch."""
+    model.eval()
+    confusion = torch.zeros(num_classes * num_classes, dtype=torch.long, device=device)
+    total_loss, seen = 0.0, 0
+    for inputs, labels in tqdm(loader, desc="🔎 Validating", unit="batch"):
+        inputs = normalize(inputs)
+        labels = labels.to(device, non_blocking=True)
+        with autocast():
+            outputs = model(inputs)
+        total_loss += criterion(outputs.float(), labels).item() * len(labels)
+        seen += len(labels)
+        confusion += torch.bincount(labels * num_classes + outputs.argmax(dim=1), minlength=num_classes * num_classes)
+    confusion = confusion.view(num_classes, num_classes).cpu()
+    correct = confusion.diag().sum().item()
+    per_class = (confusion.diag().float() / confusion.sum(dim=1).clamp(min=1).float() * 100).tolist()
+    return {
+        "loss": total_loss / max(seen, 1),
+        "accuracy": 100 * correct / max(seen, 1),
+        "per_class_accuracy": per_class,
+        "confusion_matrix": confusion.tolist(),
+    }
+
+
+def main():
+    args = parse_args()
+    torch.manual_seed(args.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    # --- Dataset ---
+    print("📂 Loading dataset...")
+    full_dataset = datasets.ImageFolder(root=args.data_dir, transform=to_uint8_chw, loader=load_image)
+    class_to_idx = full_dataset.class_to_idx
+    idx_to_class = {v: k for k, v in class_to_idx.items()}
+
+    # Save class_indices.json
+    os.makedirs(os.path.dirname(args.index_json_path) or ".", exist_ok=True)
+    with open(args.index_json_path, "w") as f:
+        json.dump(idx_to_class, f, indent=4)
+
+    if args.cache_shards:
+        data = build_shards(full_dataset, args.cache_shards, args.num_workers)
+    else:
+        data = full_dataset
+
+    # --- Split dataset ---
+    train_idx, val_idx = split_indices(full_dataset.targets, args.seed)
+    train_subset = Subset(data, train_idx)
+    val_subset = Subset(data, val_idx)
+
+    pin_memory = device.type == "cuda"
+    train_sampler = ResumableSampler(len(train_subset), args.seed, args.batch_size)
+    train_loader = make_loader(train_subset, args, pin_memory=pin_memory, sampler=train_sampler)
+    val_loader = make_loader(val_subset, args, pin_memory=pin_memory)
+    steps_per_epoch = -(-len(train_subset) // args.batch_size)
+
+    # --- Load EfficientNetV2 ---
+    model = timm.create_model(args.model_name, pretrained=not args.no_pretrained, num_classes=len(class_to_idx))
+    model.to(device)
+    if args.channels_last:
+        model.to(memory_format=torch.channels_last)
+    train_model = torch.compile(model) if args.compile else model
+    normalize = Normalizer(device, args.channels_last)
+
+    def autocast():
+        return torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=args.bf16)
+
+    # --- Loss & Optimizer ---
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(model.parameters(), lr=args.lr)
+    if args.scheduler == "cosine":
+        scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=args.epochs * steps_per_epoch)
+    else:
+        scheduler = optim.lr_scheduler.ConstantLR(optimizer, factor=1.0, total_iters=0)
+
+    # --- Checkpoints ---
+    checkpointer = Checkpointer(args.checkpoint_dir, model, optimizer, scheduler, args.model_save_path)
+    start_epoch, start_batch, step = 0, 0, 0
+    best_acc, stale_epochs, history = -1.0, 0, []
+    if args.resume:
+        checkpoint = checkpointer.load(device)
+        if checkpoint is not None:
+            start_epoch, start_batch, step = checkpoint["epoch"], checkpoint["batch"], checkpoint["step"]
+            best_acc, stale_epochs, history = checkpoint["best_acc"], checkpoint["stale_epochs"], checkpoint["history"]
+            print(f"♻️ Resumed from {checkpointer.last_path}: epoch {start_epoch + 1}, batch {start_batch}, step {step}")
+        else:
+            print(f"♻️ No checkpoint in {args.checkpoint_dir}, starting fresh")
+
+    # --- Training loop ---
+    print(f"\n🚀 Starting training with {args.model_name} for {args.epochs} epochs on {len(class_to_idx)} classes "
+          f"({args.num_workers} workers, bf16={args.bf16}, channels_last={args.channels_last}, compile={args.compile})...")
+
+    for epoch in range(start_epoch, args.epochs):
+        train_sampler.set_position(epoch, start_batch)
+        epoch_start_step = step - start_batch
+
+        def on_step(batch_done):
+            nonlocal step
+            step = epoch_start_step + batch_done
+            if args.save_every and step % args.save_every == 0 and batch_done < steps_per_epoch:
+                checkpointer.save(epoch=epoch, batch=batch_done, step=step, best_acc=best_acc,
+                                  stale_epochs=stale_epochs, history=history)
+
+        stats = train_one_epoch(train_model, train_loader, normalize, criterion, optimizer, scheduler, device,
+                                autocast, epoch, args.epochs, start_batch=start_batch, on_step=on_step)
+        start_batch = 0
+        print(f"✅ Epoch {epoch+1} completed | Avg Loss: {stats['loss']:.4f} | Accuracy: {stats['accuracy']:.2f}% | "
+              f"{stats['images_per_s']:.1f} img/s | data wait {stats['data_wait_s']:.1f}s / compute {stats['compute_s']:.1f}s")
+
+        val = validate(train_model, val_loader, normalize, criterion, device, autocast, len(class_to_idx))
+        print(f"🔎 Validation | Loss: {val['loss']:.4f} | Accuracy: {val['accuracy']:.2f}%")
+        history.append({"epoch": epoch + 1, "train": stats, "val": val})
+        with open(os.path.join(args.checkpoint_dir, "metrics.json"), "w") as f:
+            json.dump({"classes": idx_to_class, "epochs": history}, f, indent=2)
+
+        if val["accuracy"] > best_acc + args.min_delta:
+            best_acc, stale_epochs = val["accuracy"], 0
+            checkpointer.save_best(epoch=epoch + 1, batch=0, step=step, best_acc=best_acc,
+                                   stale_epochs=stale_epochs, history=history)
+            print(f"🏆 New best val accuracy {best_acc:.2f}%, model saved to {args.model_save_path}")
+        else:
+            stale_epochs += 1
+        checkpointer.save(epoch=epoch + 1, batch=0, step=step, best_acc=best_acc,
+                          stale_epochs=stale_epochs, history=history)
+        if args.patience and stale_epochs >= args.patience:
+            print(f"⏹️ Early stopping: no improvement for {stale_epochs} epochs")
+            break
 
-        total_loss += loss.item()
-        _, preds = torch.max(outputs, 1)
-        correct += torch.sum(preds == labels).item()
+    print(f"\n✅ Best model (val accuracy {best_acc:.2f}%) saved to {args.model_save_path}")
+    print(f"✅ Class index mapping saved to {args.index_json_path}")
 
-# Optional: Show per-batch info
-tqdm.write(f"   🔹 Batch {batch_idx+1} | Loss: {loss.item():.4f} | Accuracy so far: {100 * correct / ((batch_idx+1) * batch_size):.2f}%")
-epoch_acc = 100 * correct / len(train_subset)
-print(f"✅ Epoch {epoch+1} completed | Avg Loss: {total_loss:.4f} | Accuracy: {epoch_acc:.2f}%")
 
-# --- Save model ---
-torch.save(model.state_dict(), model_save_path)
-print(f"\n✅ Model saved to {model_save_path}")
-print(f"✅ Class index mapping saved to {index_json_path}")
+if __name__ == "__main__":
+    main()